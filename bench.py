@@ -0,0 +1,1572 @@
+# Benchmarks and equivalence checks for the parsers and interpreters.
+# Run with: python bench.py [name ...]   (no names runs everything)
+import contextlib
+import functools
+import io
+import sys
+import time
+import tracemalloc
+
+import brewlex
+import brewparse
+import brewtok
+from element import DictElement, Element
+from parse_cache import encode_ast
+
+# small programs covering the whole grammar, used to check that every parser
+# builds the same trees
+CORPUS = [
+    """
+func main() {
+  print("hello world");
+}
+""",
+    """
+struct node {
+  val: int;
+  next: node;
+}
+struct list { head: node; size: int; }
+
+func push(l: list, v: int): void {
+  var n: node;
+  n = new node;
+  n.val = v;
+  n.next = l.head;
+  l.head = n;
+  l.size = l.size + 1;
+}
+
+func main(): void {
+  var l: list;
+  var i: int;
+  l = new list;
+  for (i = 0; i < 10; i = i + 1) {
+    push(l, i * 2);
+  }
+  print(l.head.next.val, " ", l.size);
+}
+""",
+    """
+/* comments
+   can span lines */
+func fact(n) {
+  if (n <= 1) { return 1; }
+  return n * fact(n - 1);
+}
+
+func f(a, b, c) {
+  return a + b * c - -a / (b - c) == a && !b || c != 3 && a >= b || a > b && a < c;
+}
+
+func main() {
+  var x;
+  x = -(1 + 2) * 3;
+  x = !true == false;
+  x = - - x;
+  x = !!x;
+  x = 1 < 2 == true;
+  print(fact(5), f(1, 2, 3), nil, "s");
+  if (x) { print(1); } else { print(2); }
+  return;
+}
+""",
+    """
+func thrower(x) {
+  if (x == 0) {
+    raise "zero";
+  }
+  return 10 / x;
+}
+
+func main() {
+  try {
+    print(thrower(0));
+    raise "x" + "y";
+  }
+  catch "zero" {
+    print("caught zero");
+  }
+  catch "xy" {
+    try { raise "inner"; } catch "inner" { return; }
+  }
+  inputi("n: ");
+  var s: string;
+  s = inputs();
+}
+""",
+]
+
+# programs every parser must reject. (ply's error recovery can resync on a later
+# token and still hand back a tree for some broken programs, the rd parser
+# always stops at the first error, so only compare inputs neither can recover from)
+BAD_CORPUS = [
+    "func main() { }",
+    "func main() { var x }",
+    "func main() { x = ; }",
+    "func main() { print(1) }",
+    "func main() { print(1); } }",
+    "",
+]
+
+# ply recovers from the error here and hands back a tree with only g in it,
+# which must not be cached for the next parse (by any parser)
+RECOVERED_PROGRAM = "func main() { print(1) } func g() { print(2); }"
+
+
+# v3 programs (typed), paired with their input, for comparing execution engines.
+# Most of the error cases stop with a different ErrorType, the rest run to the end.
+V3_CORPUS = [
+    ("""
+struct node { val: int; next: node; }
+func fib(n: int): int { if (n < 2) { return n; } return fib(n-1) + fib(n-2); }
+func mk(v: int, nx: node): node { var n: node; n = new node; n.val = v; n.next = nx; return n; }
+func sum(n: node): int { if (n == nil) { return 0; } return n.val + sum(n.next); }
+func noret(x: int): bool { if (x > 0) { return 3; } }
+func main(): int {
+  var x: int;
+  var n: node;
+  var b: bool;
+  var s: string;
+  n = new node;
+  n.val = 5;
+  for (x = 0; x < 3; x = x + 1) { print(x, " ", fib(10), " ", n.val); }
+  b = 5;
+  print(b, " ", !0, " ", -x, " ", s, "|", noret(1), " ", noret(0));
+  n = mk(1, mk(2, mk(3, nil)));
+  print(sum(n), " ", n.next.next.val);
+  n.next.val = 10;
+  print(sum(n), " ", n == n, " ", n != nil, " ", 1 == true, " ", true && 1, " ", "a" + "b" == "ab");
+  print(3 / 2, " ", 7 - 2 * 3, " ", 1 < 2 || 0);
+}
+""", []),
+    ("""
+func side(x: int): int { print("side ", x); return x; }
+func f(a: int, b: bool, c: string): string { print(a, b, c); return c + "!"; }
+func v(): void { print("void"); }
+func g(): void { return; }
+func main(): void {
+  var x: int;
+  x = 1;
+  if (x) { var x: string; x = "inner"; print(x); } else { print("no"); }
+  print(x);
+  print(f(side(1), side(0), "s"));
+  v();
+  g();
+  x = inputi("enter: ");
+  print(x + 1, inputs());
+  for (x = 3; x; x = x - 1) { print(x); }
+}
+""", ["41", "str"]),
+    ("func main(): void { print(y); }", []),
+    ("func main(): void { var x: int; x = \"a\" + 1; }", []),
+    ("func main(): void { foo(); }", []),
+    ("func f(a: int): int { return a; } func main(): void { f(); }", []),
+    ("func v(): void { return; } func main(): void { var x: int; x = v(); }", []),
+    ("struct s { a: int; } func main(): void { var p: s; p.a = 1; }", []),
+    ("struct s { a: int; } func main(): void { var p: s; p = new s; p.b = 1; }", []),
+    ("func f(a: string): int { return 1; } func main(): void { f(1); }", []),
+    ("func f(): int { return \"x\"; } func main(): void { print(f()); }", []),
+    ("func main(): void { var x: int; var x: bool; }", []),
+    ("func main(): void { var x: int; x = -true; }", []),
+    ("func main(): void { var x: int; x = 1; y = 2; }", []),
+    ("func main(): void { var x: foo; }", []),
+    ("func main(): void { print(inputi(1, 2)); }", []),
+    ("func main(): void { if (\"s\") { print(1); } }", []),
+    ("""
+struct p { x: int; q: p; }
+func f(a: int, a: int): int { var a: string; a = "shadow"; print(a); return 1; }
+func n(): int { return nil; }
+func s(): p { return; }
+func main(): void {
+  var x: int;
+  var i: int;
+  x = 1;
+  if (true) { print(x); var x: bool; print(x); if (x == false) { var x: string; x = "deep"; print(x); } print(x); }
+  print(x, f(1, 2));
+  for (i = 0; i < 2; i = i + 1) { var y: int; print(y); y = i + 10; print(y); }
+  print(s() == nil, " ", 1 && 2, " ", 0 || 0, " ", !1);
+  var a: p;
+  var b: p;
+  a = new p;
+  b = new p;
+  print(a == b, a != b);
+  a.q = b;
+  b.x = 3;
+  print(a.q.x, a == b);
+  print(n());
+}
+""", []),
+    ("func main(): void { var x: int; print(x, nil, 1); }", []),
+    ("func main(): void { print(a.b); }", []),
+    ("func main(): void { x = inputi(); }", ["3"]),
+    ("func f(): void { return 1; } func main(): void { f(); }", []),
+    ("func f(): bool { return 5; } func main(): void { print(f()); }", []),
+    ("""
+struct node { val: int; next: node; }
+func loop(n: int, acc: int): int { if (n == 0) { return acc; } return loop(n - 1, acc + n); }
+func even(n: int): bool { if (n == 0) { return true; } return odd(n - 1); }
+func odd(n: int): bool { if (n == 0) { return false; } return even(n - 1); }
+func count(n: int): bool { if (n == 0) { return 1; } return down(n); }
+func down(n: int): int { print("down ", n); if (n == 1) { return 0; } return down(n - 1); }
+func last(l: node): node { if (l.next == nil) { return l; } return last(l.next); }
+func mk(v: int, nx: node): node { var n: node; n = new node; n.val = v; n.next = nx; return n; }
+func inloop(n: int): int { var i: int; for (i = 0; i < 3; i = i + 1) { if (i == 1) { return inloop2(n, i); } } return 0; }
+func inloop2(n: int, i: int): int { if (n == 0) { return i; } return inloop(n - 1); }
+func same(a: int, a: int): int { if (a > 5) { return a; } return same(a, a + 3); }
+func v(): void { print("v"); }
+func callsv(): int { return v(); }
+func main(): void {
+  var l: node;
+  print(loop(100, 0), " ", even(7), " ", odd(7), " ", count(3));
+  l = last(mk(1, mk(2, mk(3, nil))));
+  print(l.val, " ", inloop(4), " ", same(0, 1));
+  print(callsv());
+}
+""", []),
+    ("""
+func tobool(n: int): bool { return ident(n); }
+func ident(n: int): int { print("ident ", n); return n; }
+func str(): string { return ident(1); }
+func main(): void { print(tobool(2), " ", tobool(0)); print(str()); }
+""", []),
+    # both operands of && and || are always evaluated
+    ("""
+func t(n: int): bool { print("t ", n); return n > 0; }
+func main(): void {
+  var a: bool;
+  a = t(0) && t(1);
+  print(a, " ", t(1) || t(0), " ", t(2) == t(0), " ", !t(3), " ", -(2 * 300));
+}
+""", []),
+    # x isn't coerced by plain assignments, so x + x sees ints and strings
+    ("""
+func main(): void {
+  var x: int;
+  var i: int;
+  for (i = 0; i < 12; i = i + 1) {
+    if (i / 2 * 2 == i) { x = i; } else { x = "s"; }
+    print(x + x, " ", x == x);
+  }
+  x = true;
+  print(x + x);
+}
+""", []),
+    # constants, dead branches, code after return and copies for the optimizer;
+    # b holds an int, q keeps the old value of p, and the last print fails
+    ("""
+func f(a: int): int { var b: int; b = a; return b * (2 + 3); print("never"); }
+func main(): void {
+  var x: int;
+  var y: int;
+  var b: bool;
+  var p: int;
+  var q: int;
+  x = f(1 + 1);
+  y = x;
+  y = y + 1;
+  print(x, " ", y, " ", "a" + "b" == "ab", " ", !(1 < 2), " ", -(3 - 5), " ", true == 1, " ", 7 / 2);
+  if ("a" != "a") { print("dead"); } else { if (1 == 1) { print("taken"); } }
+  if (true) { var y: string; y = "inner"; print(y); }
+  b = 5;
+  if (b) { print(b + 1); }
+  p = 3;
+  q = p;
+  p = 4;
+  print(q, " ", p, " ", q + p);
+  print(3 + "x");
+}
+""", []),
+    # pure and impure functions for memoization: noisy prints, bump changes
+    # its argument, tobool's result is coerced
+    ("""
+struct p { x: int; }
+func fib(n: int): int { if (n < 2) { return n; } return fib(n - 1) + fib(n - 2); }
+func choose(n: int, k: int): int { if (k == 0 || k == n) { return 1; } return choose(n - 1, k - 1) + choose(n - 1, k); }
+func noisy(n: int): int { print("noisy ", n); return n; }
+func calls_noisy(n: int): int { return noisy(n) + 1; }
+func bump(q: p): int { q.x = q.x + 1; return q.x; }
+func even(n: int): bool { if (n == 0) { return true; } return odd(n - 1); }
+func odd(n: int): bool { if (n == 0) { return false; } return even(n - 1); }
+func tobool(n: int): bool { return n; }
+func label(s: string, b: bool): string { if (b) { return s + "!"; } return s; }
+func main(): void {
+  var q: p;
+  q = new p;
+  print(fib(10), " ", choose(6, 3), " ", calls_noisy(1), " ", calls_noisy(1));
+  print(bump(q), " ", bump(q), " ", even(9), " ", odd(9), " ", tobool(3), " ", tobool(0), " ", tobool(3));
+  print(label("a", 1), " ", label("a", true), " ", label("a", false), " ", fib(1) == 1);
+  print(tobool("x"));
+}
+""", []),
+    # struct references compare by identity (also when two instances hold the
+    # same values, and on a cycle), nested field paths, and a field that holds
+    # nil
+    ("""
+struct a { x: int; y: string; }
+struct b { y: string; x: int; }
+struct node { val: int; next: node; }
+func main(): void {
+  var p: a; var q: b; var s: a; var n: node;
+  p = new a; q = new b; s = new a;
+  print(p == q, " ", p == s, " ", p == p, " ", p != s);
+  q.y = p.y; q.x = p.x;
+  print(p == q, " ", p == nil, " ", q != p);
+  n = new node;
+  n.next = new node;
+  n.next.val = 5;
+  print(n.next.val, " ", n.val, " ", n.next.next == nil);
+  n.next.next = n;
+  print(n.next.next == n, " ", n.next.next.next == n.next, " ", n.next == n);
+  n.next.next = nil;
+  n.next.next = new node;
+}
+""", []),
+    # v3 has no exceptions, so raise does nothing and what follows it runs
+    ('func main(): void { print("a"); raise "x"; print("after"); }', []),
+]
+
+
+V2_CORPUS = [
+    ("""
+func f(a) { return a + 1; }
+func g(a, b) { if (a > b) { return a; } return b; }
+func main() {
+  var s;
+  var i;
+  s = 0;
+  for (i = 0; i < 5; i = i + 1) { s = s + i; }
+  print(s, " ", f(3), " ", g(1, 2), " ", g(5, 2));
+  if (s == 10) { var s; s = "x"; print(s); } else { print("no"); }
+  print(s, " ", "a" + "b", " ", !true, " ", -s, " ", 1 == 2, " ", true && false, " ", 3 / 2, " ", 1 != "a");
+}
+""", []),
+    ('func main() { var x; x = inputi("n? "); print(x * 2); print(inputs()); }', ["4", "hi"]),
+    ('func p() { print("side"); return true; } '
+     'func main() { if (p()) { print("yes"); } if (!p()) { print("no"); } else { print("else"); } }', []),
+    ("func main() { var i; for (i = 0; i < 3; i = i + 1) { var y; y = i; print(y, i); } }", []),
+    ("func f(n) { if (n < 2) { return n; } return f(n - 1) + f(n - 2); } func main() { print(f(10)); }", []),
+    ('func main() { var x; x = nil; if (x == nil) { print("nil"); } print(1 == "a", 1 != nil, "a" == "a"); }', []),
+    ("func f() { return; } func main() { var x; x = f(); print(x == nil); }", []),
+    ('func main() { var x; x = true; if (x) { return; } print("unreached"); }', []),
+    ("func main() { var i; for (i = 0; i < 3; i = i + 1) { if (i == 1) { return; } print(i); } }", []),
+    ('func main() { print(true && false || true, !false, 7 / 2, 3 - 5, "x" != "y"); }', []),
+    ("func f(a) { print(a); } func main() { var x; x = 3; f(x + 1); f(x == 3); }", []),
+    ("func f(a, a) { return a; } func main() { print(f(1, 2)); }", []),
+    ("func main() { var x; x = 1; if (x) { print(1); } }", []),
+    ('func main() { print(1 + "a"); }', []),
+    ('func main() { print(1 < "a"); }', []),
+    ('func main() { print(-"a"); }', []),
+    ("func main() { y = 1; }", []),
+    ("func main() { print(z); }", []),
+    ("func main() { foo(1); }", []),
+    ("func main() { var x; var x; }", []),
+    ("func main() { var x; x = 1; for (x = 0; x; x = x + 1) { print(x); } }", []),
+    ("func main() { print(inputi(1, 2)); }", []),
+    ("func g(a) { return a * 2; } "
+     "func main() { var i; var s; s = 0; for (i = 0; i < 4; i = i + 1) { s = s + g(i); } print(s); }", []),
+    ("""
+func main() {
+  var x;
+  var y;
+  var z;
+  x = 2 * 3 + 4;
+  y = x;
+  z = y + 1;
+  print(x, " ", y, " ", z, " ", "a" + "b" == "ab", " ", !(1 < 2), " ", -(3 - 5));
+  if (1 + 1 == 2) { print("taken"); } else { print("not taken"); }
+  if (false) { print("dead"); }
+  if (true && false) { var q; print(q); } else { var q; q = y; print(q); }
+  y = 7;
+  print(z, " ", y, " ", x);
+  return;
+  print("unreachable");
+}
+""", []),
+    ("func main() { var x; x = 2 - 2; print(1 / 0, x); }", []),
+    # raise does nothing in v2; call arguments are looked up one scope out from
+    # the call, so the scopes of the blocks around a call matter
+    ('func main() { print("a"); raise "x"; print("after"); }', []),
+    ("func g(a, b) { return a + b; } "
+     "func main() { var x; x = 1; if (true) { if (true) { print(g(x, x)); } } }", []),
+    ("func f(a) { return a; } func main() { var y; y = 1; if (true) { var x; x = y; print(f(x)); } }", []),
+]
+
+
+# v4 programs (lazy evaluation and exceptions), paired with their input
+V4_CORPUS = [
+    ("func main() { var i; var t; t = 0; for (i = 0; i < 5; i = i + 1) { t = t + i; "
+     "if (t > 3) { var y; y = t; print(y); } } print(t); }", []),
+    ('func f(x) { print("f", x); return x * 2; } func main() { var a; a = f(3); print("before"); print(a); print(a); }', []),
+    ('func main() { try { raise "boom"; print("no"); } catch "boom" { print("caught"); } print("after"); }', []),
+    ('func g() { raise "e1"; } '
+     'func main() { try { g(); } catch "e2" { print("wrong"); } catch "e1" { print("right"); } }', []),
+    ('func main() { var x; x = 5 / 0; try { print(x); } catch "div0" { print("div"); } }', []),
+    ("func main() { var x; var x; }", []),
+    ("func main() { print(y); }", []),
+    ('func main() { raise "unhandled"; }', []),
+    ("func f(a) { var a; a = 2; return a; } func main() { print(f(1)); }", []),
+    ("func main() { var i; for (i = 0; i < 3; i = i + 1) { var z; z = i; print(z); } "
+     'if (true) { print("t"); } else { var q; print("e"); } }', []),
+    ("func main() { var a; a = true || x; print(a); var b; b = false && y; print(b); }", []),
+    ('func main() { var x; x = inputi("? "); print(x + 1); }', ["4"]),
+    ("func fib(n) { if (n < 2) { return n; } return fib(n - 1) + fib(n - 2); } func main() { print(fib(12)); }", []),
+    ('func side(x) { print("side ", x); return x; } '
+     "func first(a, b) { return a; } func main() { print(first(side(1), side(2))); }", []),
+    ('func main() { print(-3, " ", !true, " ", "a" + "b", " ", 1 == "a", " ", nil == nil, " ", 7 / 2, " ", 2 >= 3); }', []),
+    ('func main() { print(-"a"); }', []),
+    ('func main() { print(1 + "a"); }', []),
+    ("func main() { raise 1; }", []),
+    ('func main() { var i; for (i = 0; i < 5; i = i + 1) { if (i == 2) { raise "stop"; } print(i); } }', []),
+    ('func f(n) { if (n == 0) { raise "bottom"; } return f(n - 1); } '
+     'func main() { try { print(f(5)); } catch "bottom" { print("caught"); } }', []),
+    ('func main() { try { try { raise "a"; } catch "b" { print("b"); } } catch "a" { print("outer a"); } }', []),
+    ('func f() { try { return 1; } catch "x" { print("x"); } return 2; } func main() { print(f()); }', []),
+    ("func main() { var x; x = 1; x = x + 1; x = x * 10; print(x); }", []),
+    ("func main() { print(inputi(1, 2)); }", []),
+    ('func main() { if (1) { print("int cond"); } }', []),
+    ('func loop(n, acc) { print("at ", n); if (n == 0) { return acc; } return loop(n - 1, acc + n); } '
+     "func main() { var r; r = loop(3, 0); print(r); print(r); }", []),
+    ('func f(n) { if (n == 0) { raise "done"; } return f(n - 1); } '
+     'func main() { try { print(f(3)); } catch "done" { print("caught"); } }', []),
+    ("func f(n) { if (n == 0) { return 1 / 0; } return f(n - 1); } "
+     'func main() { var x; x = f(2); try { print(x); } catch "div0" { print("div0"); } print("end"); }', []),
+    ("func even(n) { if (n == 0) { return true; } return odd(n - 1); } "
+     "func odd(n) { if (n == 0) { return false; } return even(n - 1); } func main() { print(even(10), odd(7)); }", []),
+    ('func add(a, b) { return a + b; } '
+     'func main() { var i; for (i = 0; i < 12; i = i + 1) { if (i / 2 * 2 == i) { print(add(i, 1), " ", add(i, 0) / (i + 1)); } '
+     'else { print(add("s", "t")); } } print(add(1, "x")); }', []),
+    ("""
+func main() {
+  var a;
+  var b;
+  var c;
+  a = 10 / (5 - 5);
+  b = a;
+  print("start");
+  try { print(b); } catch "div0" { print("div0 ", 2 * 3); }
+  c = 2 + 3 * 4;
+  if (c > 10) { print("big"); } else { print("small"); }
+  if (false) { raise "never"; }
+  b = c;
+  a = 1;
+  print(b + a, " ", "x" + "y", " ", !false);
+  raise "end" + "ed";
+  print("unreachable");
+}
+""", []),
+    # lazy chains thousands of links long, one of them failing
+    ("func main() { var s; var i; s = 0; for (i = 0; i < 3000; i = i + 1) { s = s + 10 / (i - 2000); } "
+     'try { print(s); } catch "div0" { print("div0"); } print(s); '
+     's = 0; for (i = 0; i < 3000; i = i + 1) { s = s - i; } print(-s, " ", !(s < 0)); }', []),
+    # strict variables given values that fail or raise only do so when used
+    ('func f(n) { print("f ", n); return n; } func main() { var x; var i; x = 1 / 0; print("before"); '
+     'i = x + f(1); print("after"); try { print(i); } catch "div0" { print("div0"); } }', []),
+    ('func main() { var x; var y; y = 2; x = y + "a"; print("before"); x = x * y; print(x); }', []),
+    # exceptions leaving blocks and calls, caught by nested trys and catchers
+    ("""
+func dive(n) { var k; k = n; if (n == 0) { raise "bottom"; } dive(n - 1); print("unreached"); }
+func countdown(n) { if (n == 0) { raise "zero"; } return countdown(n - 1); }
+func main() {
+  var s; var x; var y;
+  s = "outer";
+  try { var s2; s2 = "inner"; dive(5); } catch "bottom" { print("caught bottom ", s); }
+  x = 1 / 0;
+  try { print(x); } catch "div0" { print("caught div0"); }
+  if (x == "div0") { print("forced again, div0 is a plain value"); }
+  y = countdown(3);
+  try { print(y + 1); } catch "zero" { print("caught zero"); } catch "zero" { print("second zero"); }
+  try { try { raise "a"; } catch "b" { print("wrong"); } } catch "a" { print("outer caught a"); }
+  try { raise "a"; } catch "a" { try { raise "c"; } catch "c" { print("nested in catcher"); } }
+  for (x = 0; x < 3; x = x + 1) {
+    try { if (x == 1) { raise "one"; } print(x); } catch "one" { print("skip one"); }
+  }
+  try { raise y; } catch "zero" { print("raise y raises zero"); }
+  print(s);
+  raise "end";
+}
+""", []),
+    # arguments and returned values are the caller's lazy expressions, so a
+    # call in one is only made once, by whichever forces it first
+    ("""
+func noisy(x) { print("noisy ", x); return x; }
+func use(a) { print("use ", a); return a + 1; }
+func id(a) { return a; }
+func main() {
+  var y; var z;
+  y = noisy(5);
+  print(use(y));
+  print(y);
+  z = id(noisy(7));
+  print(z, " ", z);
+}
+""", []),
+]
+
+def run_program(interpreter, program, inp):
+    try:
+        interpreter.run(program)
+        outcome = None
+    except Exception as e:
+        outcome = interpreter.get_error_type_and_line()[0] or type(e).__name__
+    return interpreter.get_output(), outcome
+
+
+def make_large_program(num_funcs=200):
+    funcs = []
+    for i in range(num_funcs):
+        funcs.append(
+            f"""
+func f{i}(a: int, b: int): int {{
+  var x: int;
+  var y: int;
+  x = a * {i} + b - (a / 2) * (b + {i});
+  for (y = 0; y < 10; y = y + 1) {{
+    if (x > y && !(a == b) || y != 3) {{
+      x = x + y * 2 - -1;
+    }} else {{
+      x = x - 1;
+    }}
+  }}
+  print("f{i}: ", x, " ", a >= b, " ", b <= a);
+  return x;
+}}
+"""
+        )
+    funcs.append("func main(): void {\n  print(f0(1, 2));\n}\n")
+    return "".join(funcs)
+
+
+def check_parsers(programs=None):
+    programs = CORPUS + [make_large_program(20)] if programs is None else programs
+    for i, program in enumerate(programs):
+        # encoded, so a dotted path has to come out as a DottedName from both
+        expected = encode_ast(brewparse.parse_program(program, use_cache=False, parser="ply"))
+        for name in brewparse.PARSERS:
+            actual = encode_ast(brewparse.parse_program(program, use_cache=False, parser=name))
+            if actual != expected:
+                raise AssertionError(f"parser {name} disagrees with ply on program {i}")
+    for program in BAD_CORPUS:
+        for name in brewparse.PARSERS:
+            try:
+                brewparse.parse_program(program, use_cache=False, parser=name)
+            except SyntaxError:
+                continue
+            raise AssertionError(f"parser {name} accepted {program!r}")
+    brewparse.parse_program(RECOVERED_PROGRAM, parser="ply")
+    if brewparse.ast_cache.key(RECOVERED_PROGRAM, "ply") in brewparse.ast_cache.entries:
+        raise AssertionError("a tree ply recovered from a syntax error was cached")
+    try:
+        brewparse.parse_program(RECOVERED_PROGRAM, parser="rd")
+        raise AssertionError("rd accepted the program ply recovered from")
+    except SyntaxError:
+        pass
+    print(f"parsers agree on {len(programs)} programs and reject {len(BAD_CORPUS)} bad ones")
+
+
+# inputs that poke at the corners of the lexer rules
+LEXER_EDGE_CASES = [
+    "a.b.c = 12abc;",
+    "/* unterminated comment\n x = 1;",
+    "/*/ tricky */ x /*\n\n*/ y",
+    "/** starry **/ a /***/ b /* a */* c a/**/b",
+    'print("not /* a comment */", x);',
+    '"unterminated string\n x',
+    "x @ y # z \r\n $",
+    "a||b&&c!=d==e>=f<=g<h>i!j",
+    "",
+]
+
+
+def ply_tokens(program):
+    brewlex.reset_lineno()
+    brewlex.lexer.input(program)
+    result = []
+    while True:
+        tok = brewlex.lexer.token()
+        if tok is None:
+            return result
+        result.append((tok.type, tok.value, tok.lineno))
+
+
+def fast_tokens(program):
+    kinds, values, lines = brewtok.tokenize(program)
+    return [(brewtok.KIND_NAMES[k], v, l) for k, v, l in zip(kinds, values, lines)]
+
+
+def check_tokenizers():
+    programs = CORPUS + LEXER_EDGE_CASES + [make_large_program(20)]
+    for i, program in enumerate(programs):
+        if ply_tokens(program) != fast_tokens(program):
+            raise AssertionError(f"brewtok disagrees with brewlex on program {i}")
+    print(f"tokenizers agree on {len(programs)} programs")
+
+
+def bench_tokenizers():
+    program = make_large_program(10000)
+    num_tokens = len(brewtok.tokenize(program)[0])
+    print(f"tokenize: {len(program) / 1e6:.1f} MB, {num_tokens} tokens")
+    for name, f in (("ply.lex", ply_tokens), ("brewtok", brewtok.tokenize)):
+        elapsed = timed(lambda: f(program), 1)
+        print(f"  {name:>8}: {elapsed * 1000:8.1f} ms  {num_tokens / elapsed:12.0f} tokens/s")
+
+
+def check_engines_v3(engines=("vm", "python")):
+    import interpreterv3
+
+    for i, (program, inp) in enumerate(V3_CORPUS):
+        expected = run_program(interpreterv3.Interpreter(False, list(inp)), program, inp)
+        for engine in engines:
+            actual = run_program(interpreterv3.Interpreter(False, list(inp), engine=engine), program, inp)
+            if actual != expected:
+                raise AssertionError(f"v3 engine {engine} differs on program {i}: {actual} != {expected}")
+    print(f"v3 engines {', '.join(engines)} agree with the tree walker on {len(V3_CORPUS)} programs")
+
+
+def check_engines_v2(engines=("closure",)):
+    import interpreterv2
+
+    for i, (program, inp) in enumerate(V2_CORPUS):
+        expected = run_program(interpreterv2.Interpreter(False, list(inp)), program, inp)
+        for engine in engines:
+            actual = run_program(interpreterv2.Interpreter(False, list(inp), engine=engine), program, inp)
+            if actual != expected:
+                raise AssertionError(f"v2 engine {engine} differs on program {i}: {actual} != {expected}")
+    print(f"v2 engines {', '.join(engines)} agree with the tree walker on {len(V2_CORPUS)} programs")
+
+
+def check_engines_v4(engines=("stack",)):
+    import interpreterv4
+
+    for i, (program, inp) in enumerate(V4_CORPUS):
+        expected = run_program(interpreterv4.Interpreter(False, list(inp)), program, inp)
+        for engine in engines:
+            actual = run_program(interpreterv4.Interpreter(False, list(inp), engine=engine), program, inp)
+            if actual != expected:
+                raise AssertionError(f"v4 engine {engine} differs on program {i}: {actual} != {expected}")
+    print(f"v4 engines {', '.join(engines)} agree with the tree walker on {len(V4_CORPUS)} programs")
+
+V2_LOOP_PROGRAM = """
+func main() {
+  var i;
+  var j;
+  var total;
+  total = 0;
+  for (i = 0; i < 300; i = i + 1) {
+    for (j = 0; j < 100; j = j + 1) {
+      if (j / 2 * 2 == j) { total = total + i * j; } else { total = total - 1; }
+    }
+  }
+  print(total);
+}
+"""
+
+V2_CALL_PROGRAM = """
+func fib(n) {
+  if (n < 2) { return n; }
+  return fib(n - 1) + fib(n - 2);
+}
+func main() {
+  print(fib(16));
+}
+"""
+
+
+def bench_engines_v2(engines=("tree", "closure")):
+    import interpreterv2
+
+    for label, program in (("loop-heavy", V2_LOOP_PROGRAM), ("call-heavy", V2_CALL_PROGRAM)):
+        baseline = None
+        for engine in engines:
+            elapsed = timed(lambda: interpreterv2.Interpreter(False, engine=engine).run(program), 3)
+            baseline = baseline or elapsed
+            print(f"v2 {label:>10} {engine:>7}: {elapsed * 1000:8.1f} ms  {baseline / elapsed:5.2f}x")
+
+
+# the if conditions force total every iteration, otherwise v4 would build one
+# lazy expression 40000 additions deep
+BLOCK_SCOPE_PROGRAM = """
+func main() {
+  var i;
+  var total;
+  total = 0;
+  for (i = 0; i < 20000; i = i + 1) {
+    total = total + i;
+    if (total < 0) { print("overflow"); }
+  }
+  for (i = 0; i < 20000; i = i + 1) {
+    var sq;
+    sq = i * i;
+    total = total + sq;
+    if (total < 0) { print("overflow"); }
+  }
+  print(total);
+}
+"""
+
+
+def bench_block_scopes():
+    import env_v1
+    import env_v4
+    import interpreterv2
+    import interpreterv4
+
+    counts = {"blocks": 0, "scopes": 0, "pushes": 0, "new dicts": 0}
+    run_block_v2 = interpreterv2.Interpreter._Interpreter__run_block
+    new_scope_v2 = env_v1.EnvironmentManager.__init__
+    run_block_v4 = interpreterv4.Interpreter._Interpreter__run_statements
+    push_block_v4 = env_v4.EnvironmentManager.push_block
+
+    def counted_run_block_v2(self, statements):
+        counts["blocks"] += 1
+        return run_block_v2(self, statements)
+
+    def counted_new_scope_v2(self):
+        counts["scopes"] += 1
+        new_scope_v2(self)
+
+    def counted_run_block_v4(self, statements):
+        counts["blocks"] += 1
+        return run_block_v4(self, statements)
+
+    def counted_push_block_v4(self):
+        counts["pushes"] += 1
+        if not self.free_blocks:
+            counts["new dicts"] += 1
+        push_block_v4(self)
+
+    interpreterv2.Interpreter._Interpreter__run_block = counted_run_block_v2
+    env_v1.EnvironmentManager.__init__ = counted_new_scope_v2
+    interpreterv4.Interpreter._Interpreter__run_statements = counted_run_block_v4
+    env_v4.EnvironmentManager.push_block = counted_push_block_v4
+    try:
+        env_v1.EnvironmentManager.free_scopes.clear()
+        elapsed = timed(lambda: interpreterv2.Interpreter(False).run(BLOCK_SCOPE_PROGRAM), 1)
+        print(f"v2 block scopes: {counts['blocks']} blocks run, {counts['scopes']} scope objects allocated "
+              f"(main's included), {elapsed * 1000:.1f} ms")
+        counts["blocks"] = 0
+        elapsed = timed(lambda: interpreterv4.Interpreter(False).run(BLOCK_SCOPE_PROGRAM), 1)
+        print(f"v4 block scopes: {counts['blocks']} blocks run, {counts['pushes']} block scopes pushed, "
+              f"{counts['new dicts']} block dicts allocated, {elapsed * 1000:.1f} ms")
+    finally:
+        interpreterv2.Interpreter._Interpreter__run_block = run_block_v2
+        env_v1.EnvironmentManager.__init__ = new_scope_v2
+        interpreterv4.Interpreter._Interpreter__run_statements = run_block_v4
+        env_v4.EnvironmentManager.push_block = push_block_v4
+
+
+V3_LOOP_PROGRAM = """
+func main(): void {
+  var i: int;
+  var j: int;
+  var total: int;
+  total = 0;
+  for (i = 0; i < 300; i = i + 1) {
+    for (j = 0; j < 100; j = j + 1) {
+      if (j / 2 * 2 == j) { total = total + i * j; } else { total = total - 1; }
+    }
+  }
+  print(total);
+}
+"""
+
+V3_CALL_PROGRAM = """
+func fib(n: int): int {
+  if (n < 2) { return n; }
+  return fib(n - 1) + fib(n - 2);
+}
+func main(): void {
+  print(fib(11));
+}
+"""
+
+
+def bench_engines_v3(engines=("tree", "vm", "python")):
+    import interpreterv3
+
+    # without memoization, which would turn fib into a handful of calls
+    for label, program in (("loop-heavy", V3_LOOP_PROGRAM), ("call-heavy", V3_CALL_PROGRAM)):
+        baseline = None
+        for engine in engines:
+            elapsed = timed(lambda: interpreterv3.Interpreter(False, engine=engine, memo_size=0).run(program), 3)
+            baseline = baseline or elapsed
+            print(f"v3 {label:>10} {engine:>6}: {elapsed * 1000:8.1f} ms  {baseline / elapsed:5.2f}x")
+
+
+# the checker with nothing for the interpreter to use, so the v3 engines do all
+# their dynamic checks
+def without_type_facts(interpreterv3):
+    class NoTypeFacts(interpreterv3.TypeChecker):
+        def check_program(self):
+            super().check_program()
+            self.fast_ops = {}
+            self.exact_args = set()
+            return self
+
+    return NoTypeFacts
+
+
+def check_type_checker(engines=("tree", "vm", "python")):
+    import interpreterv3
+
+    checked = interpreterv3.TypeChecker
+    rejected = 0
+    for i, (program, inp) in enumerate(V3_CORPUS):
+        interpreterv3.TypeChecker = without_type_facts(interpreterv3)
+        try:
+            expected = run_program(interpreterv3.Interpreter(False, list(inp)), program, inp)
+        finally:
+            interpreterv3.TypeChecker = checked
+        for engine in engines:
+            actual = run_program(interpreterv3.Interpreter(False, list(inp), engine=engine), program, inp)
+            if actual != expected:
+                raise AssertionError(f"v3 engine {engine} with type facts differs on program {i}: {actual} != {expected}")
+        # a program rejected up front fails the same way when it runs
+        interpreter = interpreterv3.Interpreter(False, list(inp), check_types=True)
+        output, outcome = run_program(interpreter, program, inp)
+        if interpreter.checker.errors:
+            rejected += 1
+            if outcome != expected[1]:
+                raise AssertionError(f"type checker reports {outcome} on program {i}, running it gives {expected[1]}")
+    print(f"v3 type facts change nothing on {len(V3_CORPUS)} programs, {rejected} rejected before running")
+
+
+def bench_type_check(engines=("tree", "vm", "python")):
+    import interpreterv3
+
+    checked = interpreterv3.TypeChecker
+    for label, program in (("loop-heavy", V3_LOOP_PROGRAM), ("call-heavy", V3_CALL_PROGRAM)):
+        interpreter = interpreterv3.Interpreter(False)
+        interpreter.run(program)
+        checker = interpreter.checker
+        print(f"v3 {label}: {len(checker.fast_ops)} unchecked operators, "
+              f"{len(checker.exact_args)} uncoerced arguments, {len(checker.errors)} type errors")
+        for engine in engines:
+            interpreterv3.TypeChecker = without_type_facts(interpreterv3)
+            try:
+                dynamic = timed(lambda: interpreterv3.Interpreter(False, engine=engine, memo_size=0).run(program), 3)
+            finally:
+                interpreterv3.TypeChecker = checked
+            static = timed(lambda: interpreterv3.Interpreter(False, engine=engine, memo_size=0).run(program), 3)
+            print(f"  {engine:>6}: dynamic checks {dynamic * 1000:8.1f} ms, "
+                  f"type checked {static * 1000:8.1f} ms  {dynamic / static:5.2f}x")
+
+
+V4_ARITH_PROGRAM = """
+func main() {
+  var i;
+  var j;
+  var total;
+  total = 0;
+  for (i = 0; i < 100; i = i + 1) {
+    for (j = 0; j < 100; j = j + 1) {
+      if (j / 2 * 2 == j) { total = total + i * j; } else { total = total - 1; }
+      if (total < 0) { print("overflow"); }
+    }
+  }
+  print(total);
+}
+"""
+
+
+def bench_op_caches():
+    import interpreterv3
+    import interpreterv4
+    import opcache
+
+    class CountingOpCaches(opcache.OpCaches):
+        def __init__(self, specialize, generic):
+            super().__init__(specialize, generic)
+            self.count = 0
+
+        def apply(self, op_ast, left_value_obj, right_value_obj):
+            self.count += 1
+            return super().apply(op_ast, left_value_obj, right_value_obj)
+
+    # the v3 type checker already proves the operands of these programs, so
+    # its facts are turned off to measure the caches alone
+    checked = interpreterv3.TypeChecker
+    interpreterv3.TypeChecker = without_type_facts(interpreterv3)
+    runs = (
+        ("v3", interpreterv3, V3_LOOP_PROGRAM, ("tree", "vm")),
+        ("v4", interpreterv4, V4_ARITH_PROGRAM, ("tree", "stack")),
+    )
+    def run(module, program, engine):
+        interpreter = module.Interpreter(False, engine=engine)
+        interpreter.run(program)
+        return interpreter
+
+    try:
+        for version, module, program, engines in runs:
+            module.OpCaches = CountingOpCaches
+            interpreter = run(module, program, "tree")
+            caches = interpreter.op_caches
+            num_ops = caches.count
+            print(f"{version}: {num_ops} binary ops, {caches.specializations} specializations, "
+                  f"{caches.despecializations} despecializations")
+            for engine in engines:
+                # a cache that never specializes leaves everything to the generic path
+                module.OpCaches = lambda specialize, generic: opcache.OpCaches(lambda op, t: None, generic)
+                generic = timed(lambda: run(module, program, engine), 3)
+                module.OpCaches = opcache.OpCaches
+                cached = timed(lambda: run(module, program, engine), 3)
+                print(f"  {engine:>5}: generic {num_ops / generic / 1e6:5.2f} M ops/s, "
+                      f"inline caches {num_ops / cached / 1e6:5.2f} M ops/s  {generic / cached:5.2f}x")
+    finally:
+        interpreterv3.TypeChecker = checked
+        interpreterv3.OpCaches = interpreterv4.OpCaches = opcache.OpCaches
+
+
+# a linked list and a binary tree of N nodes, built and walked
+V3_STRUCT_PROGRAMS = {
+    "list": """
+struct node { val: int; next: node; }
+func main(): void {
+  var head: node; var n: node; var i: int; var total: int;
+  head = nil;
+  for (i = 0; i < N; i = i + 1) { n = new node; n.val = i; n.next = head; head = n; }
+  total = 0;
+  for (n = head; n != nil; n = n.next) { total = total + n.val; }
+  print(total);
+}
+""",
+    "tree": """
+struct tree { val: int; left: tree; right: tree; }
+struct total { n: int; }
+func build(lo: int, hi: int): tree {
+  var t: tree; var mid: int;
+  if (lo > hi) { return nil; }
+  mid = (lo + hi) / 2;
+  t = new tree; t.val = mid; t.left = build(lo, mid - 1); t.right = build(mid + 1, hi);
+  return t;
+}
+func sum(t: tree, acc: total): void {
+  if (t == nil) { return; }
+  acc.n = acc.n + t.val; sum(t.left, acc); sum(t.right, acc);
+}
+func main(): void {
+  var t: tree; var acc: total;
+  t = build(1, N);
+  acc = new total;
+  sum(t, acc);
+  print(acc.n, " ", t.left.left.val, " ", t.right.right.val);
+}
+""",
+}
+
+
+def bench_struct_shapes(size=5000, engines=("tree", "vm", "python")):
+    import interpreterv3
+
+    for label, program in V3_STRUCT_PROGRAMS.items():
+        program = program.replace("N", str(size))
+        for engine in engines:
+            # an interpreter only runs one program with structs
+            elapsed = timed(lambda: interpreterv3.Interpreter(False, engine=engine, memo_size=0).run(program), 3)
+            interpreter = interpreterv3.Interpreter(False, engine=engine, memo_size=0)
+            tracemalloc.start()
+            interpreter.run(program)
+            _, peak = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+            print(f"v3 {label} of {size} nodes {engine:>6}: {elapsed * 1000:8.1f} ms, peak {peak / size:6.0f} bytes/node, "
+                  f"printed {interpreter.get_output()[-1]}")
+
+
+# reads and writes a four field path N times
+V3_FIELD_PATH_PROGRAM = """
+struct d { val: int; }
+struct c { d: d; }
+struct b { c: c; }
+struct a { b: b; }
+func main(): void {
+  var x: a; var i: int;
+  x = new a; x.b = new b; x.b.c = new c; x.b.c.d = new d;
+  for (i = 0; i < N; i = i + 1) { x.b.c.d.val = x.b.c.d.val + i; }
+  print(x.b.c.d.val);
+}
+"""
+
+
+def bench_field_paths(n=20000, engines=("tree", "vm", "python")):
+    import interpreterv3
+
+    program = V3_FIELD_PATH_PROGRAM.replace("N", str(n))
+    for engine in engines:
+        def run():
+            interpreter = interpreterv3.Interpreter(False, engine=engine, memo_size=0)
+            interpreter.run(program)
+            return interpreter
+        elapsed = timed(run, 5)
+        print(f"v3 {n} field path reads and writes {engine:>6}: {elapsed * 1000:8.1f} ms, printed {run().get_output()[-1]}")
+
+
+# builds two lists of L nodes, then compares their heads K times
+V3_STRUCT_EQUALITY_PROGRAM = """
+struct node { val: int; next: node; }
+func build(n: int): node {
+  var head: node; var i: int; var t: node;
+  for (i = 0; i < n; i = i + 1) { t = new node; t.val = i; t.next = head; head = t; }
+  return head;
+}
+func main(): void {
+  var a: node; var b: node; var i: int; var same: int;
+  a = build(L); b = build(L); same = 0;
+  for (i = 0; i < K; i = i + 1) { if (a == b) { same = same + 1; } if (a != a.next) { same = same + 1; } }
+  print(same);
+}
+"""
+
+
+def bench_struct_equality(lengths=(10, 1000, 10000), compares=20000, engines=("tree", "python")):
+    import interpreterv3
+
+    for length in lengths:
+        for engine in engines:
+            def run(k):
+                program = V3_STRUCT_EQUALITY_PROGRAM.replace("L", str(length)).replace("K", str(k))
+                interpreter = interpreterv3.Interpreter(False, engine=engine, memo_size=0)
+                interpreter.run(program)
+                return interpreter
+            # the time the comparisons take, without building the lists
+            elapsed = timed(lambda: run(compares), 3) - timed(lambda: run(0), 3)
+            interpreter = run(compares)
+            stats = interpreter.heap.stats()["node"]
+            print(f"v3 list of {length:>5} {engine:>6}: {elapsed / (2 * compares) * 1e9:6.0f} ns per comparison, "
+                  f"printed {interpreter.get_output()[-1]}, {stats['allocated']} nodes allocated, "
+                  f"{stats['live']} live after the run ({stats['bytes']} bytes)")
+
+
+# builds a linked list of N nodes, one new per node
+V3_NEW_PROGRAM = """
+struct node { val: int; name: string; done: bool; next: node; }
+func main(): void {
+  var head: node; var n: node; var i: int;
+  for (i = 0; i < N; i = i + 1) { n = new node; n.next = head; head = n; }
+  print(head.next.val);
+}
+"""
+
+
+def bench_struct_new(size=100000, engines=("tree", "vm", "python")):
+    import interpreterv3
+
+    program = V3_NEW_PROGRAM.replace("N", str(size))
+    for engine in engines:
+        elapsed = timed(lambda: interpreterv3.Interpreter(False, engine=engine, memo_size=0).run(program), 3)
+        interpreter = interpreterv3.Interpreter(False, engine=engine, memo_size=0)
+        tracemalloc.start()
+        interpreter.run(program)
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        print(f"v3 new {engine:>6}: {size / elapsed:9.0f} nodes/s, peak {peak / size:4.0f} bytes/node for {size} nodes")
+
+
+def bench_value_allocations():
+    import interpreterv2
+    import interpreterv3
+    import interpreterv4
+    import type_valuev1
+    import type_valuev2
+    import type_valuev4
+
+    runs = (
+        ("v2", interpreterv2, type_valuev1, V2_LOOP_PROGRAM, ("tree", "closure")),
+        ("v3", interpreterv3, type_valuev2, V3_LOOP_PROGRAM, ("tree", "vm", "python")),
+        ("v4", interpreterv4, type_valuev4, V4_ARITH_PROGRAM, ("tree", "stack")),
+    )
+    for version, module, type_module, program, engines in runs:
+        value_class = type_module.Value
+        value = value_class(type_module.Type.INT, 1000)
+        size = sys.getsizeof(value) + (sys.getsizeof(value.__dict__) if hasattr(value, "__dict__") else 0)
+        print(f"{version}: {size} bytes per Value")
+
+        # the tree walkers print every statement they run when tracing
+        statements = 0
+
+        def count_statement(*args):
+            nonlocal statements
+            if len(args) == 1 and isinstance(args[0], Element):
+                statements += 1
+
+        module.print = count_statement
+        try:
+            module.Interpreter(False, trace_output=True).run(program)
+        finally:
+            del module.print
+
+        # copy.copy doesn't call __init__, so count in __new__
+        allocations = 0
+
+        def counting_new(cls, *args, **kwargs):
+            nonlocal allocations
+            allocations += 1
+            return object.__new__(cls)
+
+        for engine in engines:
+            allocations = 0
+            value_class.__new__ = counting_new
+            try:
+                with contextlib.redirect_stdout(io.StringIO()):
+                    module.Interpreter(False, engine=engine).run(program)
+            finally:
+                del value_class.__new__
+            print(f"  {engine:>7}: {allocations:8} Values allocated, {allocations / statements:5.2f} per statement "
+                  f"({statements} statements)")
+
+
+V3_DEEP_PROGRAM = """
+struct node { val: int; next: node; }
+func count(n: int): int { if (n == 0) { return 0; } return count(n - 1) + 1; }
+func build(n: int): node { var x: node; if (n == 0) { return nil; } x = new node; x.val = n; x.next = build(n - 1); return x; }
+func sum(l: node): int { if (l == nil) { return 0; } return l.val + sum(l.next); }
+func main(): void { print(count(DEPTH)); print(sum(build(DEPTH))); }
+"""
+
+V4_DEEP_PROGRAM = """
+func count(n) { if (n == 0) { return 0; } return count(n - 1) + 1; }
+func loop(n, acc) { if (n == 0) { return acc; } return loop(n - 1, acc + n); }
+func main() { print(count(DEPTH)); print(loop(DEPTH, 0)); }
+"""
+
+
+def check_memoization(engines=("tree", "vm", "python"), sizes=(2, 1024)):
+    import interpreterv3
+
+    for i, (program, inp) in enumerate(V3_CORPUS):
+        expected = run_program(interpreterv3.Interpreter(False, list(inp), memo_size=0), program, inp)
+        for size in sizes:
+            for engine in engines:
+                interpreter = interpreterv3.Interpreter(False, list(inp), engine=engine, memo_size=size)
+                actual = run_program(interpreter, program, inp)
+                if actual != expected:
+                    raise AssertionError(
+                        f"v3 engine {engine} memoizing {size} results differs on program {i}: {actual} != {expected}"
+                    )
+    print(f"v3 memoization changes nothing on {len(V3_CORPUS)} programs")
+
+
+V3_PURE_PROGRAMS = {
+    "fib": "func fib(n: int): int { if (n < 2) { return n; } return fib(n - 1) + fib(n - 2); } "
+    "func main(): void { print(fib(11)); }",
+    "binomial": "func choose(n: int, k: int): int { if (k == 0 || k == n) { return 1; } "
+    "return choose(n - 1, k - 1) + choose(n - 1, k); } func main(): void { print(choose(10, 5)); }",
+    "paths": "func paths(r: int, c: int): int { if (r == 0 || c == 0) { return 1; } "
+    "return paths(r - 1, c) + paths(r, c - 1); } func main(): void { print(paths(5, 5)); }",
+}
+
+
+def bench_memoization(engines=("tree", "vm", "python"), sizes=(0, 16, 1024)):
+    import interpreterv3
+
+    for label, program in V3_PURE_PROGRAMS.items():
+        for engine in engines:
+            timings = []
+            for size in sizes:
+                timings.append(timed(lambda: interpreterv3.Interpreter(False, engine=engine, memo_size=size).run(program), 1))
+                interpreter = interpreterv3.Interpreter(False, engine=engine, memo_size=size)
+                interpreter.run(program)
+                memo = interpreter.memo
+                print(f"v3 {label:>8} {engine:>6} memo {size:>4}: {timings[-1] * 1000:8.1f} ms  "
+                      f"{timings[0] / timings[-1]:7.1f}x  {memo.hits} hits, {memo.misses} misses, "
+                      f"{memo.evictions} evictions")
+
+
+# (interpreter module name, corpus, engines) for each version the optimizer runs on
+OPTIMIZED_VERSIONS = (
+    ("interpreterv2", V2_CORPUS, ("tree", "closure")),
+    ("interpreterv3", V3_CORPUS, ("tree", "vm", "python")),
+    ("interpreterv4", V4_CORPUS, ("tree", "stack")),
+)
+
+
+def check_optimizer(levels=(1, 2)):
+    import importlib
+
+    for module_name, corpus, engines in OPTIMIZED_VERSIONS:
+        module = importlib.import_module(module_name)
+        for i, (program, inp) in enumerate(corpus):
+            expected = run_program(module.Interpreter(False, list(inp)), program, inp)
+            for level in levels:
+                for engine in engines:
+                    interpreter = module.Interpreter(False, list(inp), engine=engine, opt_level=level)
+                    actual = run_program(interpreter, program, inp)
+                    if actual != expected:
+                        raise AssertionError(
+                            f"{module_name} -O{level} {engine} differs on program {i}: {actual} != {expected}"
+                        )
+    print(f"-O{', -O'.join(map(str, levels))} change nothing on "
+          f"{sum(len(corpus) for _, corpus, _ in OPTIMIZED_VERSIONS)} programs")
+
+
+def bench_optimizer(level=2):
+    import importlib
+
+    for module_name, corpus, engines in OPTIMIZED_VERSIONS:
+        module = importlib.import_module(module_name)
+        for i, (program, inp) in enumerate(corpus):
+            interpreter = module.Interpreter(False, list(inp), opt_level=level)
+            with contextlib.redirect_stdout(io.StringIO()):
+                run_program(interpreter, program, inp)
+            stats = interpreter.optimizer.stats
+            if any(stats.values()):
+                print(f"{module_name} program {i:>2} -O{level}: "
+                      + ", ".join(f"{count} {name}" for name, count in stats.items()))
+    for module_name, program in (
+        ("interpreterv2", V2_LOOP_PROGRAM),
+        ("interpreterv3", V3_LOOP_PROGRAM),
+        ("interpreterv4", V4_ARITH_PROGRAM),
+    ):
+        module = importlib.import_module(module_name)
+        with contextlib.redirect_stdout(io.StringIO()):
+            unoptimized = timed(lambda: module.Interpreter(False).run(program), 3)
+            optimized = timed(lambda: module.Interpreter(False, opt_level=level).run(program), 3)
+        print(f"{module_name} loop-heavy: -O0 {unoptimized * 1000:8.1f} ms, "
+              f"-O{level} {optimized * 1000:8.1f} ms  {unoptimized / optimized:5.2f}x")
+
+
+V4_CHAIN_PROGRAM = "func main() { var s; var i; s = 0; for (i = 0; i < LENGTH; i = i + 1) { s = s + i; } print(s); }"
+
+
+def bench_lazy_chains(lengths=(1000, 10000, 100000), engines=("tree", "stack")):
+    import interpreterv4
+
+    for length in lengths:
+        program = V4_CHAIN_PROGRAM.replace("LENGTH", str(length))
+        for engine in engines:
+            interpreter = interpreterv4.Interpreter(False, engine=engine)
+            with contextlib.redirect_stdout(io.StringIO()):
+                elapsed = timed(lambda: interpreter.run(program), 1)
+            print(f"v4 lazy chain of {length:>7} {engine:>5}: {elapsed * 1000:9.1f} ms, printed {interpreter.get_output()[-1]}")
+
+
+def bench_strictness(engines=("tree", "stack")):
+    import interpreterv4
+    import lazy_val
+
+    programs = (
+        ("loop-heavy", V4_ARITH_PROGRAM),
+        ("lazy chain", V4_CHAIN_PROGRAM.replace("LENGTH", "10000")),
+        ("call-heavy", "func fib(n) { if (n < 2) { return n; } return fib(n - 1) + fib(n - 2); } "
+         "func main() { print(fib(14)); }"),
+    )
+    forced_value = interpreterv4.Interpreter.forced_value
+    # new lazy expressions with an expression tree, not counting the copies
+    # made of arguments
+    allocations = 0
+    init = lazy_val.LazyExpr.__init__
+
+    def counting_init(self, value=None, unknown_var=None, expr_ast=None, bindings=None):
+        nonlocal allocations
+        allocations += expr_ast is not None
+        init(self, value, unknown_var, expr_ast, bindings)
+
+    def measure(program, engine):
+        nonlocal allocations
+        interpreter = interpreterv4.Interpreter(False, engine=engine)
+        allocations = 0
+        lazy_val.LazyExpr.__init__ = counting_init
+        try:
+            with contextlib.redirect_stdout(io.StringIO()):
+                interpreter.run(program)
+        finally:
+            lazy_val.LazyExpr.__init__ = init
+        with contextlib.redirect_stdout(io.StringIO()):
+            elapsed = timed(lambda: interpreterv4.Interpreter(False, engine=engine).run(program), 3)
+        return interpreter, allocations, elapsed
+
+    for label, program in programs:
+        for engine in engines:
+            # without computing anything early
+            interpreterv4.Interpreter.forced_value = lambda self, expr_ast, bindings=None: None
+            try:
+                _, lazy_allocations, lazy_time = measure(program, engine)
+            finally:
+                interpreterv4.Interpreter.forced_value = forced_value
+            interpreter, strict_allocations, strict_time = measure(program, engine)
+            print(f"v4 {label} {engine:>5}: {len(interpreter.strictness.eager)} eager sites, "
+                  f"{interpreter.thunks_avoided} thunks avoided, thunks built {lazy_allocations} -> "
+                  f"{strict_allocations}, {lazy_time * 1000:7.1f} -> {strict_time * 1000:7.1f} ms  "
+                  f"{lazy_time / strict_time:5.2f}x")
+
+
+# lazy expressions that are made but never forced, of growing size
+V4_THUNK_PROGRAM = """
+func main() {
+  var i;
+  var unused;
+  for (i = 0; i < 3000; i = i + 1) {
+    unused = EXPRESSION;
+  }
+  print(i);
+}
+"""
+
+
+def bench_thunk_templates(sizes=(1, 4, 16, 64), engines=("tree", "stack")):
+    import interpreterv4
+
+    for size in sizes:
+        expression = " + ".join(f"(i * {n} - i / 3)" for n in range(size))
+        program = V4_THUNK_PROGRAM.replace("EXPRESSION", expression)
+        for engine in engines:
+            interpreter = interpreterv4.Interpreter(False, engine=engine)
+            with contextlib.redirect_stdout(io.StringIO()):
+                elapsed = timed(lambda: interpreter.run(program), 3)
+            print(f"v4 3000 lazy expressions of {size * 4 - 1:>3} operators {engine:>5}: {elapsed * 1000:7.1f} ms, "
+                  f"{len(interpreter.thunk_templates)} templates")
+
+
+# exceptions raised DEPTH calls deep and caught, and divisions by zero caught
+V4_EXCEPTION_PROGRAMS = {
+    "raise": "func dive(n) { var k; k = n; if (n == 0) { raise \"bottom\"; } dive(n - 1); }"
+    " func main() { var i; var caught; caught = 0; for (i = 0; i < 1000; i = i + 1) {"
+    " try { dive(DEPTH); } catch \"bottom\" { caught = caught + 1; } } print(caught); }",
+    "div0": "func main() { var i; var x; var caught; caught = 0; for (i = 0; i < 5000; i = i + 1) {"
+    " try { x = i / 0; print(x); } catch \"div0\" { caught = caught + 1; } } print(caught); }",
+}
+
+
+def bench_exceptions(depth=20, engines=("tree", "stack")):
+    import interpreterv4
+
+    runs = [
+        ("no exceptions, loops", V4_ARITH_PROGRAM),
+        ("no exceptions, calls", "func fib(n) { if (n < 2) { return n; } return fib(n - 1) + fib(n - 2); } "
+         "func main() { print(fib(16)); }"),
+        (f"raise {depth} calls deep", V4_EXCEPTION_PROGRAMS["raise"].replace("DEPTH", str(depth))),
+        ("div0", V4_EXCEPTION_PROGRAMS["div0"]),
+    ]
+    for label, program in runs:
+        for engine in engines:
+            interpreter = interpreterv4.Interpreter(False, engine=engine)
+            with contextlib.redirect_stdout(io.StringIO()):
+                elapsed = timed(lambda: interpreter.run(program), 3)
+            print(f"v4 {label:>21} {engine:>5}: {elapsed * 1000:8.1f} ms, printed {interpreter.get_output()[-1]}")
+
+
+# calls whose results are returned from an expression, so not as tail calls
+V3_CALL_PROGRAMS = {
+    "loop": """
+func add(a: int, b: int): int { return a + b; }
+func main(): void { var i: int; var s: int; s = 0; for (i = 0; i < N; i = i + 1) { s = add(s, i); } print(s); }
+""",
+    "fib": """
+func fib(n: int): int { if (n < 2) { return n; } return fib(n - 1) + fib(n - 2); }
+func main(): void { print(fib(N)); }
+""",
+}
+
+V4_CALL_PROGRAM = """
+func add(a, b) { return a + b; }
+func main() { var i; var s; s = 0; for (i = 0; i < N; i = i + 1) { s = add(s, i); print(s); } }
+"""
+
+
+def bench_calls(calls=20000, fib=12):
+    import interpreterv3
+    import interpreterv4
+
+    # v3 without memoization, which would make all but a few of the fib calls
+    v3_interpreter = functools.partial(interpreterv3.Interpreter, memo_size=0)
+    runs = (
+        ("v3", v3_interpreter, "loop", V3_CALL_PROGRAMS["loop"], calls, ("tree", "vm", "python")),
+        ("v3", v3_interpreter, "fib", V3_CALL_PROGRAMS["fib"], fib, ("tree", "vm", "python")),
+        ("v4", interpreterv4.Interpreter, "loop", V4_CALL_PROGRAM, calls, ("tree", "stack")),
+    )
+    for version, interpreter_class, label, program, n, engines in runs:
+        program = program.replace("N", str(n))
+        for engine in engines:
+            interpreter = interpreter_class(False, engine=engine)
+            elapsed = timed(lambda: interpreter.run(program), 3)
+            print(f"{version} {label:>4}({n}) {engine:>6}: {elapsed * 1000:9.1f} ms, printed {interpreter.get_output()[-1]}")
+
+
+def bench_deep_recursion(depth=100000):
+    import interpreterv3
+    import interpreterv4
+
+    runs = (
+        ("v3", interpreterv3.Interpreter, V3_DEEP_PROGRAM, ("tree", "vm")),
+        ("v4", interpreterv4.Interpreter, V4_DEEP_PROGRAM, ("tree", "stack")),
+    )
+    for version, interpreter_class, program, engines in runs:
+        program = program.replace("DEPTH", str(depth))
+        for engine in engines:
+            interpreter = interpreter_class(False, engine=engine)
+            start = time.perf_counter()
+            try:
+                interpreter.run(program)
+                outcome = ", ".join(interpreter.get_output())
+            except RecursionError:
+                outcome = "RecursionError"
+            elapsed = time.perf_counter() - start
+            print(f"{version} recursion depth {depth} {engine:>5}: {outcome:>24}  {elapsed * 1000:9.1f} ms")
+
+V3_TAIL_PROGRAMS = {
+    "self": "func loop(n: int, acc: int): int { if (n == 0) { return acc; } return loop(n - 1, acc + n); }"
+    " func main(): void { print(loop(DEPTH, 0)); }",
+    "mutual": "func even(n: int): bool { if (n == 0) { return true; } return odd(n - 1); }"
+    " func odd(n: int): bool { if (n == 0) { return false; } return even(n - 1); }"
+    " func main(): void { print(even(DEPTH)); }",
+}
+
+# the if forces acc on every call, otherwise the final print would force a
+# lazy expression DEPTH additions deep
+V4_TAIL_PROGRAMS = {
+    "self": "func loop(n, acc) { if (acc < 0) { return 0; } if (n == 0) { return acc; } return loop(n - 1, acc + n); }"
+    " func main() { print(loop(DEPTH, 0)); }",
+    "mutual": "func even(n) { if (n == 0) { return true; } return odd(n - 1); }"
+    " func odd(n) { if (n == 0) { return false; } return even(n - 1); }"
+    " func main() { print(even(DEPTH)); }",
+}
+
+
+# the python engine only turns tail calls of a function to itself into loops,
+# other tail calls are still Python calls
+def bench_tail_calls(depth=100000):
+    import interpreterv3
+    import interpreterv4
+
+    runs = (
+        ("v3", interpreterv3.Interpreter, V3_TAIL_PROGRAMS, "self", ("tree", "vm", "python")),
+        ("v3", interpreterv3.Interpreter, V3_TAIL_PROGRAMS, "mutual", ("tree", "vm")),
+        ("v4", interpreterv4.Interpreter, V4_TAIL_PROGRAMS, "self", ("tree", "stack")),
+        ("v4", interpreterv4.Interpreter, V4_TAIL_PROGRAMS, "mutual", ("tree", "stack")),
+    )
+    for version, interpreter_class, programs, label, engines in runs:
+        program = programs[label].replace("DEPTH", str(depth))
+        for engine in engines:
+            interpreter = interpreter_class(False, engine=engine)
+            elapsed = timed(lambda: interpreter.run(program), 1)
+            outcome = ", ".join(interpreter.get_output())
+            print(f"{version} {depth} {label:>6} tail calls {engine:>6}: {outcome:>10}  {elapsed * 1000:9.1f} ms  "
+                  f"{depth / elapsed:9.0f} calls/s")
+
+def timed(f, repeat):
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        f()
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+
+def bench_parsers():
+    program = make_large_program()
+    num_tokens = len(brewtok.tokenize(program)[0])
+    print(f"parse: {len(program)} bytes, {num_tokens} tokens")
+    for name in brewparse.PARSERS:
+        elapsed = timed(lambda: brewparse.parse_program(program, use_cache=False, parser=name), 3)
+        print(f"  {name:>4}: {elapsed * 1000:8.1f} ms  {num_tokens / elapsed:12.0f} tokens/s  {1 / elapsed:8.2f} programs/s")
+    small = CORPUS[1]
+    for name in brewparse.PARSERS:
+        elapsed = timed(lambda: brewparse.parse_program(small, use_cache=False, parser=name), 200)
+        print(f"  {name:>4} (small program): {1 / elapsed:10.0f} programs/s")
+
+
+def bench_parse_cache():
+    program = make_large_program()
+    cache = brewparse.ast_cache
+    cache.clear()
+    cache.reset_stats()
+    cold = timed(lambda: brewparse.parse_program(program), 1)
+    warm = timed(lambda: brewparse.parse_program(program), 5)
+    stats = cache.stats()
+    print(f"parse cache: cold {cold * 1000:.1f} ms, warm {warm * 1000:.1f} ms, hit rate {stats['hit_rate']:.2f}")
+
+
+def to_dict_elements(node):
+    if isinstance(node, Element):
+        return DictElement(node.elem_type, **{key: to_dict_elements(value) for key, value in node.dict.items()})
+    if isinstance(node, list):
+        return [to_dict_elements(item) for item in node]
+    return node
+
+
+def all_nodes(node, result):
+    if isinstance(node, Element):
+        result.append(node)
+        for value in node.dict.values():
+            all_nodes(value, result)
+    elif isinstance(node, list):
+        for item in node:
+            all_nodes(item, result)
+    return result
+
+
+def bench_ast_nodes():
+    program = make_large_program(2000)
+    typed = brewparse.parse_program(program, use_cache=False, parser="rd")
+    num_nodes = len(all_nodes(typed, []))
+    print(f"ast nodes: {num_nodes} nodes")
+
+    for name, build in (
+        ("dict Element", lambda: to_dict_elements(typed)),
+        ("slotted nodes", lambda: brewparse.parse_program(program, use_cache=False, parser="rd")),
+    ):
+        tracemalloc.start()
+        tree = build()
+        size, _ = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        nodes = all_nodes(tree, [])
+        keys = ("op1", "op2", "name", "val", "statements", "missing")
+
+        def read_fields():
+            for node in nodes:
+                for key in keys:
+                    node.get(key)
+
+        elapsed = timed(read_fields, 3)
+        print(f"  {name:>13}: {size / num_nodes:6.0f} bytes/node (tree incl. lists and values), "
+              f"{num_nodes * len(keys) / elapsed / 1e6:6.2f} M get()/s")
+
+    binops = [node for node in all_nodes(typed, []) if node.elem_type in ("+", "-", "*", "/")]
+
+    def read_attributes():
+        for node in binops:
+            node.op1
+            node.op2
+
+    elapsed = timed(read_attributes, 3)
+    print(f"  slotted nodes, direct attribute access: {len(binops) * 2 / elapsed / 1e6:6.2f} M reads/s")
+
+
+BENCHMARKS = {
+    "check_tokenizers": check_tokenizers,
+    "check_parsers": check_parsers,
+    "check_engines_v2": check_engines_v2,
+    "check_engines_v3": check_engines_v3,
+    "check_engines_v4": check_engines_v4,
+    "check_type_checker": check_type_checker,
+    "check_optimizer": check_optimizer,
+    "check_memoization": check_memoization,
+    "tokenizers": bench_tokenizers,
+    "parsers": bench_parsers,
+    "parse_cache": bench_parse_cache,
+    "ast_nodes": bench_ast_nodes,
+    "engines_v2": bench_engines_v2,
+    "engines_v3": bench_engines_v3,
+    "block_scopes": bench_block_scopes,
+    "deep_recursion": bench_deep_recursion,
+    "calls": bench_calls,
+    "tail_calls": bench_tail_calls,
+    "type_check": bench_type_check,
+    "op_caches": bench_op_caches,
+    "value_allocations": bench_value_allocations,
+    "optimizer": bench_optimizer,
+    "memoization": bench_memoization,
+    "lazy_chains": bench_lazy_chains,
+    "strictness": bench_strictness,
+    "thunk_templates": bench_thunk_templates,
+    "exceptions": bench_exceptions,
+    "struct_shapes": bench_struct_shapes,
+    "field_paths": bench_field_paths,
+    "struct_equality": bench_struct_equality,
+    "struct_new": bench_struct_new,
+}
+
+if __name__ == "__main__":
+    names = sys.argv[1:] or list(BENCHMARKS)
+    for name in names:
+        BENCHMARKS[name]()
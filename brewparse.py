@@ -1,6 +1,12 @@
-from element import Element
+import hashlib
+import os
+
+from element import Element, dotted_name
 from brewlex import *
 from intbase import InterpreterBase
+from parse_cache import ParseCache
+import brewparse_rd
+import brewtok
 from ply import yacc
 
 # Parsing rules
@@ -114,7 +120,7 @@ def p_variable_w_dot(p):
     """variable_w_dot : variable_w_dot DOT NAME
     | NAME"""
     if len(p) == 4:
-        p[0] = p[1] + "." + p[3]
+        p[0] = dotted_name(p[1], p[3])
     else:
         p[0] = p[1]
 
@@ -254,21 +260,85 @@ def p_expression_args(p):
     collapse_items(p, 1, 3)
 
 
+# syntax errors reported by the last parse, ply recovers from some of them and
+# hands back a partial tree
+syntax_errors = 0
+
+
 def p_error(p):
+    global syntax_errors
+    syntax_errors += 1
     if p:
         print(f"Syntax error at '{p.value}' on line {p.lineno}")
     else:
         print("Syntax error at EOF")
 
 
-# exported function
-def parse_program(program):
+# lexer=None feeds yacc from the fast tokenizer in brewtok.py, pass brewlex.lexer
+# to go through ply.lex instead
+def parse_program_ply(program, lexer=None):
+    global syntax_errors
+    if lexer is None:
+        lexer = brewtok.PlyLexer()
     reset_lineno()
-    ast = yacc.parse(program)
+    syntax_errors = 0
+    ast = yacc.parse(program, lexer=lexer)
     if ast is None:
         raise SyntaxError("Syntax error")
     return ast
 
 
+# both produce identical trees, "rd" is the hand-written recursive descent parser
+PARSERS = {
+    "ply": parse_program_ply,
+    "rd": brewparse_rd.parse_program,
+}
+default_parser = os.environ.get("BREWIN_PARSER", "ply")
+
+
+def parse_program_uncached(program, parser=None):
+    parser = parser or default_parser
+    if parser not in PARSERS:
+        raise ValueError(f"Unknown parser {parser}")
+    return PARSERS[parser](program)
+
+
+# the tree and whether it can be cached: not when ply recovered from a syntax
+# error, the tree is only part of the program then
+def parse_program_checked(program, parser):
+    global syntax_errors
+    syntax_errors = 0
+    ast = parse_program_uncached(program, parser)
+    return ast, syntax_errors == 0
+
+
+# exported function
+def parse_program(program, use_cache=True, parser=None):
+    parser = parser or default_parser
+    if not use_cache:
+        return parse_program_uncached(program, parser)
+    return ast_cache.parse(program, parser, lambda p: parse_program_checked(p, parser))
+
+
 # generate our parser
-yacc.yacc() # yacc.yacc(debug=True, debuglog=open("parse.log", "w"))
+parser_tables = yacc.yacc() # yacc.yacc(debug=True, debuglog=open("parse.log", "w"))
+
+
+# a hash of the tables the parser actually runs with (whether yacc just built
+# them or loaded them from parsetab.py) and the rule functions they reduce by,
+# so trees parsed by an older grammar never come out of the cache. States with
+# no gotos are skipped, as parsetab.py leaves them out.
+def grammar_signature(lr_parser):
+    h = hashlib.sha256()
+    h.update(repr(sorted((state, sorted(actions.items())) for state, actions in lr_parser.action.items())).encode())
+    h.update(repr(sorted((state, sorted(gotos.items())) for state, gotos in lr_parser.goto.items() if gotos)).encode())
+    h.update(repr([(str(production), production.func) for production in lr_parser.productions]).encode())
+    return h.hexdigest()
+
+
+# BREWIN_AST_CACHE_DIR=<directory> also keeps the trees on disk there, for later
+# runs (see parse_cache.py), otherwise the cache is in memory only.
+ast_cache = ParseCache(
+    grammar_signature(parser_tables),
+    cache_dir=os.environ.get("BREWIN_AST_CACHE_DIR") or None,
+)
@@ -0,0 +1,314 @@
+# Hand-written recursive descent parser for brewin, with Pratt-style parsing for
+# expressions. It builds exactly the same Element trees as the PLY grammar in
+# brewparse.py, just without going through the generic LR driver.
+# Select it with parse_program(program, parser="rd") or BREWIN_PARSER=rd.
+from element import DottedName, Element
+from intbase import InterpreterBase
+from brewtok import KIND, END, tokenize
+
+# token kind codes, see brewtok.py
+ASSIGN = KIND["ASSIGN"]
+CATCH = KIND["CATCH"]
+COLON = KIND["COLON"]
+COMMA = KIND["COMMA"]
+DOT = KIND["DOT"]
+ELSE = KIND["ELSE"]
+FALSE = KIND["FALSE"]
+FOR = KIND["FOR"]
+FUNC = KIND["FUNC"]
+IF = KIND["IF"]
+LBRACE = KIND["LBRACE"]
+LPAREN = KIND["LPAREN"]
+MINUS = KIND["MINUS"]
+NAME = KIND["NAME"]
+NEW = KIND["NEW"]
+NIL = KIND["NIL"]
+NOT = KIND["NOT"]
+NUMBER = KIND["NUMBER"]
+RAISE = KIND["RAISE"]
+RBRACE = KIND["RBRACE"]
+RETURN = KIND["RETURN"]
+RPAREN = KIND["RPAREN"]
+SEMI = KIND["SEMI"]
+STRING = KIND["STRING"]
+STRUCT = KIND["STRUCT"]
+TRUE = KIND["TRUE"]
+TRY = KIND["TRY"]
+VAR = KIND["VAR"]
+
+# binding powers by token kind, mirroring the precedence table in brewparse.py
+BINARY_BP = [None] * len(KIND)
+for kind_name, bp in (
+    ("OR", 1),
+    ("AND", 2),
+    ("GREATER_EQ", 3),
+    ("GREATER", 3),
+    ("LESS_EQ", 3),
+    ("LESS", 3),
+    ("EQ", 3),
+    ("NOT_EQ", 3),
+    ("PLUS", 4),
+    ("MINUS", 4),
+    ("MULTIPLY", 5),
+    ("DIVIDE", 5),
+):
+    BINARY_BP[KIND[kind_name]] = bp
+UNARY_BP = 6
+
+
+class ParseError(Exception):
+    pass
+
+
+class Parser:
+    def __init__(self, kinds, values, lines):
+        self.kinds = kinds
+        self.values = values
+        self.lines = lines
+        self.pos = 0
+        self.kinds.append(END)
+        self.values.append(None)
+        self.lines.append(lines[-1] if lines else 1)
+
+    def peek(self, offset=0):
+        return self.kinds[self.pos + offset]
+
+    def advance(self):
+        value = self.values[self.pos]
+        self.pos += 1
+        return value
+
+    def expect(self, kind):
+        if self.kinds[self.pos] != kind:
+            self.fail()
+        return self.advance()
+
+    # same message as brewparse.p_error
+    def fail(self):
+        if self.kinds[self.pos] == END:
+            print("Syntax error at EOF")
+        else:
+            print(f"Syntax error at '{self.values[self.pos]}' on line {self.lines[self.pos]}")
+        raise ParseError()
+
+    def parse_program(self):
+        structs = []
+        while self.peek() == STRUCT:
+            structs.append(self.parse_struct())
+        functions = [self.parse_func()]
+        while self.peek() == FUNC:
+            functions.append(self.parse_func())
+        if self.peek() != END:
+            self.fail()
+        return Element(InterpreterBase.PROGRAM_NODE, structs=structs, functions=functions)
+
+    def parse_struct(self):
+        self.expect(STRUCT)
+        name = self.expect(NAME)
+        self.expect(LBRACE)
+        fields = [self.parse_field()]
+        while self.peek() != RBRACE:
+            fields.append(self.parse_field())
+        self.advance()
+        return Element(InterpreterBase.STRUCT_NODE, name=name, fields=fields)
+
+    def parse_field(self):
+        name = self.expect(NAME)
+        self.expect(COLON)
+        var_type = self.expect(NAME)
+        self.expect(SEMI)
+        return Element(InterpreterBase.FIELD_DEF_NODE, name=name, var_type=var_type)
+
+    def parse_func(self):
+        self.expect(FUNC)
+        name = self.expect(NAME)
+        self.expect(LPAREN)
+        args = []
+        if self.peek() != RPAREN:
+            args.append(self.parse_formal_arg())
+            while self.peek() == COMMA:
+                self.advance()
+                args.append(self.parse_formal_arg())
+        self.expect(RPAREN)
+        return_type = None
+        if self.peek() == COLON:
+            self.advance()
+            return_type = self.expect(NAME)
+        statements = self.parse_block()
+        return Element(
+            InterpreterBase.FUNC_NODE, name=name, args=args, return_type=return_type, statements=statements
+        )
+
+    def parse_formal_arg(self):
+        name = self.expect(NAME)
+        var_type = None
+        if self.peek() == COLON:
+            self.advance()
+            var_type = self.expect(NAME)
+        return Element(InterpreterBase.ARG_NODE, name=name, var_type=var_type)
+
+    # { statement+ }
+    def parse_block(self):
+        self.expect(LBRACE)
+        statements = [self.parse_statement()]
+        while self.peek() != RBRACE:
+            statements.append(self.parse_statement())
+        self.advance()
+        return statements
+
+    def parse_statement(self):
+        kind = self.peek()
+        if kind == VAR:
+            self.advance()
+            name = self.expect(NAME)
+            var_type = None
+            if self.peek() == COLON:
+                self.advance()
+                var_type = self.expect(NAME)
+            self.expect(SEMI)
+            return Element(InterpreterBase.VAR_DEF_NODE, name=name, var_type=var_type)
+        if kind == IF:
+            self.advance()
+            self.expect(LPAREN)
+            condition = self.parse_expression()
+            self.expect(RPAREN)
+            statements = self.parse_block()
+            else_statements = None
+            if self.peek() == ELSE:
+                self.advance()
+                else_statements = self.parse_block()
+            return Element(
+                InterpreterBase.IF_NODE,
+                condition=condition,
+                statements=statements,
+                else_statements=else_statements,
+            )
+        if kind == FOR:
+            self.advance()
+            self.expect(LPAREN)
+            init = self.parse_assign()
+            self.expect(SEMI)
+            condition = self.parse_expression()
+            self.expect(SEMI)
+            update = self.parse_assign()
+            self.expect(RPAREN)
+            statements = self.parse_block()
+            return Element(
+                InterpreterBase.FOR_NODE, init=init, condition=condition, update=update, statements=statements
+            )
+        if kind == TRY:
+            self.advance()
+            statements = self.parse_block()
+            catchers = [self.parse_catch()]
+            while self.peek() == CATCH:
+                catchers.append(self.parse_catch())
+            return Element(InterpreterBase.TRY_NODE, statements=statements, catchers=catchers)
+        if kind == RAISE:
+            self.advance()
+            expression = self.parse_expression()
+            self.expect(SEMI)
+            return Element(InterpreterBase.RAISE_NODE, exception_type=expression)
+        if kind == RETURN:
+            self.advance()
+            expression = None
+            if self.peek() != SEMI:
+                expression = self.parse_expression()
+            self.expect(SEMI)
+            return Element(InterpreterBase.RETURN_NODE, expression=expression)
+        if kind == NAME and self.is_assign():
+            statement = self.parse_assign()
+        else:
+            statement = self.parse_expression()
+        self.expect(SEMI)
+        return statement
+
+    def parse_catch(self):
+        self.expect(CATCH)
+        exception_type = self.expect(STRING)
+        statements = self.parse_block()
+        return Element(InterpreterBase.CATCH_NODE, exception_type=exception_type, statements=statements)
+
+    # NAME (DOT NAME)* ASSIGN starts an assignment, anything else is an expression
+    def is_assign(self):
+        i = self.pos + 1
+        kinds = self.kinds
+        while kinds[i] == DOT and kinds[i + 1] == NAME:
+            i += 2
+        return kinds[i] == ASSIGN
+
+    def parse_assign(self):
+        name = self.parse_variable_w_dot()
+        self.expect(ASSIGN)
+        return Element("=", name=name, expression=self.parse_expression())
+
+    def parse_variable_w_dot(self):
+        name = self.expect(NAME)
+        fields = []
+        while self.peek() == DOT:
+            self.advance()
+            fields.append(self.expect(NAME))
+        if fields:
+            return DottedName(name, tuple(fields))
+        return name
+
+    def parse_expression(self, min_bp=0):
+        left = self.parse_prefix()
+        kinds = self.kinds
+        while True:
+            bp = BINARY_BP[kinds[self.pos]]
+            if bp is None or bp <= min_bp:
+                return left
+            op = self.advance()
+            left = Element(op, op1=left, op2=self.parse_expression(bp))
+
+    def parse_prefix(self):
+        kind = self.peek()
+        if kind == NUMBER:
+            return Element(InterpreterBase.INT_NODE, val=self.advance())
+        if kind == NAME:
+            if self.peek(1) == LPAREN:
+                return self.parse_call()
+            return Element(InterpreterBase.VAR_NODE, name=self.parse_variable_w_dot())
+        if kind == STRING:
+            return Element(InterpreterBase.STRING_NODE, val=self.advance())
+        if kind == TRUE or kind == FALSE:
+            bool_val = self.advance() == InterpreterBase.TRUE_DEF
+            return Element(InterpreterBase.BOOL_NODE, val=bool_val)
+        if kind == NIL:
+            self.advance()
+            return Element(InterpreterBase.NIL_NODE)
+        if kind == LPAREN:
+            self.advance()
+            expression = self.parse_expression()
+            self.expect(RPAREN)
+            return expression
+        if kind == NOT:
+            self.advance()
+            return Element(InterpreterBase.NOT_NODE, op1=self.parse_expression(UNARY_BP))
+        if kind == MINUS:
+            self.advance()
+            return Element(InterpreterBase.NEG_NODE, op1=self.parse_expression(UNARY_BP))
+        if kind == NEW:
+            self.advance()
+            return Element(InterpreterBase.NEW_NODE, var_type=self.expect(NAME))
+        self.fail()
+
+    def parse_call(self):
+        name = self.advance()
+        self.advance()  # (
+        args = []
+        if self.peek() != RPAREN:
+            args.append(self.parse_expression())
+            while self.peek() == COMMA:
+                self.advance()
+                args.append(self.parse_expression())
+        self.expect(RPAREN)
+        return Element(InterpreterBase.FCALL_NODE, name=name, args=args)
+
+
+def parse_program(program):
+    try:
+        return Parser(*tokenize(program)).parse_program()
+    except ParseError:
+        pass
+    raise SyntaxError("Syntax error")
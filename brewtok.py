@@ -0,0 +1,110 @@
+# Fast tokenizer for brewin. It accepts exactly the same language as brewlex.py,
+# but matches all the tokens with one compiled regex and writes the results into
+# three parallel arrays (kind codes, values, line numbers) instead of building a
+# LexToken per token. Both parsers can use it: brewparse_rd reads the arrays
+# directly and PlyLexer replays them to ply.yacc.
+from array import array
+import re
+
+from brewlex import tokens, reserved_map
+from ply.lex import LexToken
+
+# kind codes are indexes into KIND_NAMES
+KIND_NAMES = tokens + ("$end",)
+KIND = {name: code for code, name in enumerate(KIND_NAMES)}
+END = KIND["$end"]
+
+# Every match is (skipped text, token). The skipped part covers t_ignore,
+# t_newline and t_comment: whitespace, newlines and complete /* */ comments, the
+# latter with the unrolled-loop pattern, which runs in linear time unlike the
+# lazy (.|\n)*? in brewlex. An unterminated comment doesn't match it, so just like
+# ply the "/" and "*" come out as tokens. The token alternatives follow the order
+# ply tries brewlex's rules in; the final "." is brewlex's t_DOT, which is an
+# unescaped "." and so matches any other character.
+TOKEN_RE = re.compile(
+    r"((?:[ \t\n]+|/\*[^*]*\*+(?:[^/*][^*]*\*+)*/)*)"
+    r'(\d+|[A-Za-z_][\w_]*|".*?"|\|\||==|>=|<=|!=|&&|.)'
+)
+
+# token text -> kind for everything that isn't a name, number or string
+FIXED_KIND = {
+    "||": KIND["OR"],
+    "(": KIND["LPAREN"],
+    ")": KIND["RPAREN"],
+    "{": KIND["LBRACE"],
+    "}": KIND["RBRACE"],
+    "==": KIND["EQ"],
+    ">=": KIND["GREATER_EQ"],
+    "<=": KIND["LESS_EQ"],
+    "!=": KIND["NOT_EQ"],
+    "+": KIND["PLUS"],
+    "-": KIND["MINUS"],
+    "*": KIND["MULTIPLY"],
+    "&&": KIND["AND"],
+    ",": KIND["COMMA"],
+    ":": KIND["COLON"],
+    ";": KIND["SEMI"],
+    ">": KIND["GREATER"],
+    "<": KIND["LESS"],
+    "=": KIND["ASSIGN"],
+    "/": KIND["DIVIDE"],
+    "!": KIND["NOT"],
+}
+for word, kind in reserved_map.items():
+    FIXED_KIND[word] = KIND[kind]
+
+NAME_START = frozenset("ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz_")
+NAME = KIND["NAME"]
+NUMBER = KIND["NUMBER"]
+STRING = KIND["STRING"]
+DOT = KIND["DOT"]
+
+
+def tokenize(program):
+    kinds = array("B")
+    values = []
+    lines = array("I")
+    fixed_kind = FIXED_KIND
+    name_start = NAME_START
+    lineno = 1
+    # only trailing whitespace can fail to match, so findall never skips a token
+    for skipped, text in TOKEN_RE.findall(program):
+        if skipped and "\n" in skipped:
+            lineno += skipped.count("\n")
+        kind = fixed_kind.get(text)
+        if kind is None:
+            first = text[0]
+            if first in name_start:
+                kind = NAME
+            elif first == '"' and len(text) > 1:
+                kind = STRING
+                text = text[1:-1]
+            elif first.isdecimal():  # the same characters as \d
+                kind = NUMBER
+                text = int(text)
+            else:
+                kind = DOT
+        kinds.append(kind)
+        values.append(text)
+        lines.append(lineno)
+    return kinds, values, lines
+
+
+# Drop-in replacement for the ply lexer object, for yacc.parse(program, lexer=...)
+class PlyLexer:
+    def input(self, program):
+        self.kinds, self.values, self.lines = tokenize(program)
+        self.pos = 0
+        self.lineno = 1
+
+    def token(self):
+        pos = self.pos
+        if pos >= len(self.kinds):
+            return None
+        self.pos = pos + 1
+        tok = LexToken()
+        tok.type = KIND_NAMES[self.kinds[pos]]
+        tok.value = self.values[pos]
+        tok.lineno = self.lineno = self.lines[pos]
+        tok.lexpos = pos  # token index, ply only reads this when tracking positions
+        return tok
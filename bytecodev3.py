@@ -0,0 +1,392 @@
+# Bytecode compiler and stack VM for the v3 interpreter.
+#
+# Each function is lowered once to a flat list of (opcode, arg) instructions and
+# run by a single dispatch loop, instead of re-walking the Element tree. Brewin
+# calls push a frame onto the VM's own call stack rather than recursing in
+# Python. All of the runtime semantics (coercion, struct field paths, default
+# values, void checks, errors) come from the helpers on interpreterv3.Interpreter,
+# so the VM behaves exactly like the tree walker. Use it with
+# Interpreter(engine="vm").
+
+from element import DottedName
+from intbase import InterpreterBase, ErrorType
+from type_valuev2 import Type, Value, bool_value, int_value, get_printable
+
+# opcodes, roughly ordered by how often they run
+LOAD = 0  # push the value of the variable in frame slot arg
+CONST = 1  # push a prebuilt Value
+BINOP = 2  # pop right, left, push left op right, arg is the op node (for its inline cache)
+STORE = 3  # pop a value into frame slot arg
+JUMP_IF_FALSE = 4  # pop a bool, jump to arg if false
+JUMP = 5
+TO_BOOL = 6  # coerce the top of the stack to a bool (if/for conditions)
+CALL = 7  # arg is the Function, its arguments are already on the stack
+COERCE_ARG = 8  # coerce the top of the stack to the formal argument arg
+CHECK_VOID = 9  # error if the top of the stack is a void function result
+POP = 10
+RETURN = 11  # pop the return value and leave the function
+RETURN_NIL = 12  # leave the function without a return value
+RETURN_VALUE = 13  # replace the top of the stack with the value a return hands back for it
+LOAD_FIELD = 14  # arg is (dotted struct field path, slot of its root), push its value
+STORE_FIELD = 15  # arg is (dotted struct field path, slot of its root), pop a value into it
+UNARY = 16  # arg is (op, type, function)
+VAR_DEF = 17  # arg is (name, slot, type)
+NEW = 18  # arg is the allocator for the struct type (see Interpreter.struct_allocator)
+PRINT = 19  # arg is the number of values to pop and print
+INPUT = 20  # arg is (name, has_prompt)
+ERROR = 21  # arg is (error_type, description)
+TAIL_CALL = 22  # like CALL, but the running function is left first
+FAST_BINOP = 23  # like BINOP, arg is the operator function for operands the type checker proved
+
+OPCODE_NAMES = {
+    value: name for name, value in globals().items() if name.isupper() and isinstance(value, int)
+}
+
+UNARY_OPS = {
+    InterpreterBase.NEG_NODE: (Type.INT, lambda x: -1 * x),
+    InterpreterBase.NOT_NODE: (Type.BOOL, lambda x: not x),
+}
+
+
+class Function:
+    def __init__(self, func_ast):
+        self.func_ast = func_ast
+        self.name = func_ast.get("name")
+        self.return_type = func_ast.get("return_type")
+        self.num_args = len(func_ast.get("args"))
+        self.param_slots = None
+        self.frame_size = None
+        self.code = []
+
+    def disassemble(self):
+        lines = [f"func {self.name}:"]
+        for pc, (op, arg) in enumerate(self.code):
+            if op == BINOP:
+                arg = arg.elem_type
+            lines.append(f"  {pc:4} {OPCODE_NAMES[op]:<14} {'' if arg is None else arg}")
+        return "\n".join(lines)
+
+
+class Compiler:
+    def __init__(self, interpreter):
+        self.interpreter = interpreter
+        self.resolver = interpreter.resolver
+
+    # compiles every function in the interpreter's function table
+    def compile_program(self):
+        func_table = self.interpreter.func_name_to_ast
+        self.functions = {}
+        for candidates in func_table.values():
+            for func_ast in candidates.values():
+                self.functions[id(func_ast)] = Function(func_ast)
+        for candidates in func_table.values():
+            for func_ast in candidates.values():
+                self.compile_function(func_ast, self.functions[id(func_ast)])
+        return self.functions
+
+    def compile_function(self, func_ast, function):
+        self.code = function.code
+        function.param_slots = self.resolver.param_slots[id(func_ast)]
+        function.frame_size = self.resolver.frame_sizes[id(func_ast)]
+        self.compile_block(func_ast.get("statements"))
+        self.emit(RETURN_NIL)
+
+    def emit(self, op, arg=None):
+        self.code.append((op, arg))
+        return len(self.code) - 1
+
+    def patch(self, index, target):
+        self.code[index] = (self.code[index][0], target)
+
+    def compile_block(self, statements):
+        for statement in statements:
+            self.compile_statement(statement)
+
+    def compile_statement(self, statement):
+        kind = statement.elem_type
+        if kind == InterpreterBase.FCALL_NODE:
+            self.compile_call(statement)
+            self.emit(POP)
+        elif kind == "=":
+            self.compile_expr(statement.get("expression"))
+            self.compile_variable(statement, STORE, STORE_FIELD, "Undefined variable {} in assignment")
+        elif kind == InterpreterBase.VAR_DEF_NODE:
+            slot = self.resolver.slots[statement]
+            self.emit(VAR_DEF, (statement.get("name"), slot, statement.get("var_type")))
+        elif kind == InterpreterBase.RETURN_NODE:
+            self.compile_return(statement)
+        elif kind == InterpreterBase.IF_NODE:
+            self.compile_if(statement)
+        elif kind == InterpreterBase.FOR_NODE:
+            self.compile_for(statement)
+        # the tree walker ignores every other kind of statement, so do we
+
+    def compile_return(self, statement):
+        expr_ast = statement.get("expression")
+        if expr_ast is None:
+            self.emit(RETURN_NIL)
+            return
+        callee_ast = self.interpreter.tail_callee(expr_ast)
+        if callee_ast is not None:
+            self.compile_args(callee_ast, expr_ast.get("args"))
+            self.emit(TAIL_CALL, self.functions[id(callee_ast)])
+            return
+        self.compile_expr(expr_ast)
+        self.emit(RETURN_VALUE)
+        self.emit(RETURN)
+
+    def compile_if(self, statement):
+        self.compile_expr(statement.get("condition"))
+        self.emit(TO_BOOL)
+        jump_to_else = self.emit(JUMP_IF_FALSE)
+        self.compile_block(statement.get("statements"))
+        else_statements = statement.get("else_statements")
+        if else_statements is None:
+            self.patch(jump_to_else, len(self.code))
+            return
+        jump_to_end = self.emit(JUMP)
+        self.patch(jump_to_else, len(self.code))
+        self.compile_block(else_statements)
+        self.patch(jump_to_end, len(self.code))
+
+    def compile_for(self, statement):
+        self.compile_statement(statement.get("init"))
+        loop_start = len(self.code)
+        self.compile_expr(statement.get("condition"))
+        self.emit(TO_BOOL)
+        jump_to_end = self.emit(JUMP_IF_FALSE)
+        self.compile_block(statement.get("statements"))
+        self.compile_statement(statement.get("update"))
+        self.emit(JUMP, loop_start)
+        self.patch(jump_to_end, len(self.code))
+
+    # leaves the call's result on the stack
+    def compile_call(self, call_ast):
+        func_name = call_ast.get("name")
+        actual_args = call_ast.get("args")
+        if func_name == "print":
+            for arg in actual_args:
+                self.compile_expr(arg)
+            self.emit(PRINT, len(actual_args))
+            return
+        if func_name == "inputi" or func_name == "inputs":
+            if len(actual_args) > 1:
+                self.emit(ERROR, (ErrorType.NAME_ERROR, "No inputi() function that takes > 1 parameter"))
+                return
+            if actual_args:
+                self.compile_expr(actual_args[0])
+            self.emit(INPUT, (func_name, len(actual_args) == 1))
+            return
+
+        # the function table never changes while running, so resolve the callee
+        # now and only report a missing one when the call is reached
+        candidates = self.interpreter.func_name_to_ast.get(func_name)
+        if candidates is None:
+            self.emit(ERROR, (ErrorType.NAME_ERROR, f"Function {func_name} not found"))
+            return
+        func_ast = candidates.get(len(actual_args))
+        if func_ast is None:
+            self.emit(
+                ERROR, (ErrorType.NAME_ERROR, f"Function {func_name} taking {len(actual_args)} params not found")
+            )
+            return
+        self.compile_args(func_ast, actual_args)
+        self.emit(CALL, self.functions[id(func_ast)])
+
+    def compile_args(self, func_ast, actual_args):
+        exact_args = self.interpreter.checker.exact_args
+        for formal_ast, actual_ast in zip(func_ast.get("args"), actual_args):
+            self.compile_expr(actual_ast)
+            if actual_ast not in exact_args:
+                self.emit(COERCE_ARG, formal_ast)
+
+    # plain variables the resolver couldn't find are reported when reached,
+    # dotted paths leave that to the field helpers
+    def compile_variable(self, node, op, field_op, missing_message):
+        name = node.get("name")
+        slot = self.resolver.slots[node]
+        if isinstance(name, DottedName):
+            self.emit(field_op, (name, slot))
+        elif slot is None:
+            self.emit(ERROR, (ErrorType.NAME_ERROR, missing_message.format(name)))
+        else:
+            self.emit(op, slot)
+
+    def compile_expr(self, expr_ast):
+        kind = expr_ast.elem_type
+        if kind == InterpreterBase.NIL_NODE:
+            self.emit(CONST, self.interpreter.NIL_VALUE)
+        elif kind == InterpreterBase.INT_NODE:
+            self.emit(CONST, int_value(expr_ast.get("val")))
+        elif kind == InterpreterBase.STRING_NODE:
+            self.emit(CONST, Value(Type.STRING, expr_ast.get("val")))
+        elif kind == InterpreterBase.BOOL_NODE:
+            self.emit(CONST, bool_value(expr_ast.get("val")))
+        elif kind == InterpreterBase.VAR_NODE:
+            self.compile_variable(expr_ast, LOAD, LOAD_FIELD, "Variable {} not found")
+        elif kind == InterpreterBase.FCALL_NODE:
+            self.compile_call(expr_ast)
+            self.emit(CHECK_VOID)
+        elif kind in self.interpreter.BIN_OPS:
+            self.compile_expr(expr_ast.get("op1"))
+            self.compile_expr(expr_ast.get("op2"))
+            f = self.interpreter.checker.fast_ops.get(expr_ast)
+            if f is not None:
+                self.emit(FAST_BINOP, f)
+            else:
+                self.emit(BINOP, expr_ast)
+        elif kind in UNARY_OPS:
+            self.compile_expr(expr_ast.get("op1"))
+            t, f = UNARY_OPS[kind]
+            self.emit(UNARY, (kind, t, f))
+        elif kind == InterpreterBase.NEW_NODE:
+            self.emit(NEW, self.interpreter.struct_allocator(expr_ast.get("var_type")))
+
+
+class VM:
+    def __init__(self, interpreter):
+        self.interpreter = interpreter
+        self.functions = Compiler(interpreter).compile_program()
+
+    def run_main(self):
+        interp = self.interpreter
+        main_ast = interp.get_func_by_name("main", 0)
+        return self.call(self.functions[id(main_ast)], [])
+
+    # runs function with already coerced argument values, returns the call's value
+    def call(self, function, arg_values):
+        interp = self.interpreter
+        env = interp.env
+        error = interp.error
+        nil_value = interp.NIL_VALUE
+        op_caches = interp.op_caches
+        memo = interp.memo
+
+        frames = []  # suspended callers: (function, pc, stack, pending, memo_key)
+        # return types of the functions the running one was tail called from,
+        # as a linked list of (return_type, rest), innermost first
+        pending = None
+        # where to keep the result of the running call, None if it isn't memoized
+        memo_key = memo.key(function.func_ast, arg_values)
+        frame = self.enter(function, arg_values)
+        code = function.code
+        stack = []
+        pc = 0
+        while True:
+            op, arg = code[pc]
+            pc += 1
+            if op == LOAD:
+                stack.append(frame[arg])
+            elif op == CONST:
+                stack.append(arg)
+            elif op == BINOP:
+                right = stack.pop()
+                stack[-1] = op_caches.apply(arg, stack[-1], right)
+            elif op == FAST_BINOP:
+                right = stack.pop()
+                stack[-1] = arg(stack[-1], right)
+            elif op == STORE:
+                frame[arg] = stack.pop()
+            elif op == JUMP_IF_FALSE:
+                if not stack.pop().value():
+                    pc = arg
+            elif op == JUMP:
+                pc = arg
+            elif op == TO_BOOL:
+                if stack[-1].type() != Type.BOOL:
+                    stack[-1] = interp.coerce_value(Type.BOOL, stack[-1])
+            elif op == CALL:
+                num_args = arg.num_args
+                if num_args:
+                    arg_values = stack[-num_args:]
+                    del stack[-num_args:]
+                else:
+                    arg_values = []
+                key = memo.key(arg.func_ast, arg_values)
+                if key is not None:
+                    cached = memo.lookup(key)
+                    if cached is not None:
+                        stack.append(cached)
+                        continue
+                frames.append((function, pc, stack, pending, memo_key))
+                memo_key = key
+                pending = None
+                function = arg
+                frame = self.enter(function, arg_values)
+                code = function.code
+                stack = []
+                pc = 0
+            elif op == COERCE_ARG:
+                stack[-1] = interp.coerce_arg(arg, stack[-1])
+            elif op == CHECK_VOID:
+                if stack[-1].type() == Type.VOID:
+                    error(ErrorType.TYPE_ERROR, f"Void function cannot be assigned to anything and evaluated")
+            elif op == POP:
+                stack.pop()
+            elif op == RETURN or op == RETURN_NIL:
+                return_val = stack.pop() if op == RETURN else nil_value
+                env.pop_func()
+                return_val = interp.finish_call(function.return_type, return_val)
+                while pending is not None:
+                    return_type, pending = pending
+                    return_val = interp.finish_tail_call(return_type, return_val)
+                if memo_key is not None:
+                    memo.store(memo_key, return_val)
+                if not frames:
+                    return return_val
+                function, pc, stack, pending, memo_key = frames.pop()
+                frame = env.frame
+                code = function.code
+                stack.append(return_val)
+            elif op == RETURN_VALUE:
+                stack[-1] = interp.return_value(stack[-1])
+            elif op == LOAD_FIELD:
+                stack.append(interp.lookup_var(*arg))
+            elif op == STORE_FIELD:
+                name, slot = arg
+                interp.assign_var(name, slot, stack.pop())
+            elif op == UNARY:
+                name, t, f = arg
+                stack[-1] = interp.apply_unary_op(name, t, f, stack[-1])
+            elif op == VAR_DEF:
+                interp.define_var(*arg)
+            elif op == NEW:
+                stack.append(arg())
+            elif op == PRINT:
+                if arg:
+                    values = stack[-arg:]
+                    del stack[-arg:]
+                else:
+                    values = []
+                stack.append(interp.print_values(values))
+            elif op == INPUT:
+                name, has_prompt = arg
+                if has_prompt:
+                    interp.output(get_printable(stack.pop()))
+                stack.append(interp.read_input(name))
+            elif op == ERROR:
+                error(*arg)
+            elif op == TAIL_CALL:
+                num_args = arg.num_args
+                if num_args:
+                    arg_values = stack[-num_args:]
+                    del stack[-num_args:]
+                else:
+                    arg_values = []
+                env.pop_func()
+                if arg.return_type != function.return_type:
+                    pending = (function.return_type, pending)
+                function = arg
+                frame = self.enter(function, arg_values)
+                code = function.code
+                pc = 0
+
+    # new activation record holding the arguments, like __call_func_aux
+    def enter(self, function, arg_values):
+        frame = self.interpreter.env.push_func(function.frame_size)
+        for slot, value in zip(function.param_slots, arg_values):
+            frame[slot] = value
+        return frame
+
+    def disassemble(self):
+        return "\n\n".join(function.disassemble() for function in self.functions.values())
@@ -0,0 +1,405 @@
+# Closure compiler for the v2 interpreter.
+#
+# Every statement and expression of the program is turned into a Python closure
+# once, before main runs: literals become prebuilt Values, variable names, scope
+# offsets, operator tables and callees are looked up at compile time, and running
+# a function is just calling its compiled body. The closures follow the tree
+# walker step for step (the same scope stack, the same order of evaluation, the
+# same errors, even where an if condition gets evaluated more than once), so the
+# output is identical to interpreterv2.Interpreter's. Use it with
+# Interpreter(engine="closure").
+from env_v1 import EnvironmentManager
+from intbase import InterpreterBase, ErrorType
+from type_valuev1 import Type, Value, NIL_VALUE, TRUE_VALUE, FALSE_VALUE, int_value, get_printable
+
+ARITH_OPS = {"+", "-", "*", "/"}
+UNARY_OPS = {"!", "neg"}
+COMP_OPS = {"==", "<", "<=", ">", ">=", "!=", "&&", "||"}
+LITERAL_TYPES = {
+    InterpreterBase.INT_NODE: Type.INT,
+    InterpreterBase.STRING_NODE: Type.STRING,
+    InterpreterBase.BOOL_NODE: Type.BOOL,
+}
+
+
+class Function:
+    __slots__ = ("formal_names", "body")
+
+    def __init__(self, func_ast):
+        self.formal_names = [arg.get("name") for arg in func_ast.get("args")]
+        self.body = None
+
+
+class ClosureCompiler:
+    def __init__(self, interpreter):
+        self.interpreter = interpreter
+        self.scopes = interpreter.scopes
+        self.op_to_lambda = interpreter.op_to_lambda
+        self.trace_output = interpreter.trace_output
+        self.functions = {}
+
+    # compiles every function in interpreter.func_name_to_ast, keyed the same way
+    def compile_program(self):
+        func_name_to_ast = self.interpreter.func_name_to_ast
+        for key, func_ast in func_name_to_ast.items():
+            self.functions[key] = Function(func_ast)
+        for key, func_ast in func_name_to_ast.items():
+            self.functions[key].body = self.__compile_block(func_ast.get("statements"))
+        return self.functions
+
+    # main's scope has already been pushed by Interpreter.run
+    def run_main(self):
+        self.compile_program()
+        self.functions[("main", 0)].body()
+
+    # A compiled block returns None when it runs off the end and (True, value)
+    # when a return statement was hit, like __run_statements
+    def __compile_block(self, statements):
+        compiled = []
+        for statement in statements:
+            closure = self.__compile_statement(statement)
+            if self.trace_output:
+                closure = self.__traced(statement, closure)
+            if closure is not None:
+                compiled.append(closure)
+        compiled = tuple(compiled)
+
+        def run_block():
+            for statement in compiled:
+                result = statement()
+                if result is not None:
+                    return result
+            return None
+
+        return run_block
+
+    def __traced(self, statement, closure):
+        def traced():
+            print(statement)
+            if closure is not None:
+                return closure()
+            return None
+
+        return traced
+
+    def __compile_statement(self, statement):
+        elem_type = statement.elem_type
+        if elem_type == InterpreterBase.FCALL_NODE:
+            call = self.__compile_call(statement)
+
+            def call_statement():
+                call()
+
+            return call_statement
+        if elem_type == "=":
+            return self.__compile_assign(statement)
+        if elem_type == InterpreterBase.VAR_DEF_NODE:
+            return self.__compile_var_def(statement)
+        if elem_type == InterpreterBase.FOR_NODE:
+            return self.__compile_for(statement)
+        if elem_type == InterpreterBase.IF_NODE:
+            return self.__compile_if(statement)
+        if elem_type == InterpreterBase.RETURN_NODE:
+            return self.__compile_return(statement)
+        return None
+
+    def __compile_return(self, return_ast):
+        if return_ast.get("expression") is None:
+            def return_nil():
+                return (True, NIL_VALUE)
+
+            return return_nil
+        expression = self.__compile_expr(return_ast.get("expression"))
+
+        def return_value():
+            return (True, expression())
+
+        return return_value
+
+    def __compile_var_def(self, var_ast):
+        var_name = var_ast.get("name")
+        scopes = self.scopes
+        error = self.interpreter.error
+        zero = int_value(0)
+
+        def var_def():
+            if not scopes[-1].create(var_name, zero):
+                error(ErrorType.NAME_ERROR, f"Duplicate definition for variable {var_name}")
+
+        return var_def
+
+    def __compile_assign(self, assign_ast):
+        var_name = assign_ast.get("name")
+        expression = self.__compile_expr(assign_ast.get("expression"))
+        scopes = self.scopes
+        find_scope = self.__find_scope
+        error = self.interpreter.error
+
+        def assign():
+            value_obj = expression()
+            environment = scopes[-1].environment
+            if var_name in environment:
+                environment[var_name] = value_obj
+            elif not scopes[find_scope(var_name)].set(var_name, value_obj):
+                error(ErrorType.NAME_ERROR, f"Undefined variable {var_name} in assignment")
+
+        return assign
+
+    # blocks get a scope only where the tree walker would give them one (see
+    # Interpreter.needs_scope)
+    def __compile_scoped_block(self, statements):
+        block = self.__compile_block(statements)
+        if not self.interpreter.needs_scope(statements):
+            return block
+        scopes = self.scopes
+        acquire = EnvironmentManager.acquire
+
+        def run_scoped_block():
+            scopes.append(acquire())
+            value = block()
+            scopes.pop().release()
+            return value
+
+        return run_scoped_block
+
+    def __compile_for(self, for_ast):
+        init = self.__compile_assign(for_ast.get("init"))
+        condition = self.__compile_comp(for_ast.get("condition"))
+        body = self.__compile_scoped_block(for_ast.get("statements"))
+        update = self.__compile_assign(for_ast.get("update"))
+
+        def run_for():
+            init()
+            while condition().v is True:
+                value = body()
+                if value is not None:
+                    return value
+                update()
+            return None
+
+        return run_for
+
+    # The tree walker re-evaluates the condition for every test in its if/elif
+    # chain, so this does too: side effects in the condition must happen the
+    # same number of times.
+    def __compile_if(self, if_ast):
+        condition_ast = if_ast.get("condition")
+        condition = self.__compile_expr(condition_ast)
+        comp_condition = self.__compile_comp(condition_ast)
+        then_block = self.__compile_scoped_block(if_ast.get("statements"))
+        else_block = None
+        if if_ast.get("else_statements") is not None:
+            else_block = self.__compile_scoped_block(if_ast.get("else_statements"))
+        error = self.interpreter.error
+
+        def run_branch(block):
+            if block is None:
+                return None
+            return block()
+
+        def run_if():
+            if condition().type() == Type.INT or condition().type() == Type.STRING:
+                error(ErrorType.TYPE_ERROR, "")
+            elif condition().value() == True:
+                return run_branch(then_block)
+            elif condition().value() == False:
+                return run_branch(else_block)
+            elif comp_condition().value():
+                return run_branch(then_block)
+            elif comp_condition().value() is False:
+                return run_branch(else_block)
+            else:
+                error(ErrorType.TYPE_ERROR, "If statement not boolean expression")
+            return None
+
+        return run_if
+
+    def __compile_call(self, call_ast):
+        func_name = call_ast.get("name")
+        args = call_ast.get("args")
+        if func_name == "print":
+            return self.__compile_print(args)
+        if func_name == "inputi" or func_name == "inputs":
+            return self.__compile_input(func_name, args)
+        error = self.interpreter.error
+        function = self.functions.get((func_name, len(args)))
+        if function is None:
+            def missing_function():
+                error(ErrorType.NAME_ERROR, f"Function {func_name} not found")
+
+            return missing_function
+        # arguments are evaluated after the callee's scope is pushed, so the
+        # caller's variables are one scope further down
+        actual_args = [self.__compile_expr(arg, -2) for arg in args]
+        scopes = self.scopes
+
+        def call():
+            env = EnvironmentManager()
+            env.isFunction = True
+            scopes.append(env)
+            for new_arg, old_arg in zip(function.formal_names, actual_args):
+                if not env.create(new_arg, old_arg()):
+                    error(ErrorType.NAME_ERROR, "Duplicate definition for variable")
+            returned = function.body()
+            scopes.pop()
+            if returned is not None:
+                return returned[1]
+            return NIL_VALUE
+
+        return call
+
+    def __compile_print(self, args):
+        values = [self.__compile_expr(arg) for arg in args]
+        output = self.interpreter.output
+
+        def call_print():
+            line = ""
+            for value in values:
+                line = line + get_printable(value())
+            output(line)
+            return NIL_VALUE
+
+        return call_print
+
+    def __compile_input(self, func_name, args):
+        interpreter = self.interpreter
+        prompt = self.__compile_expr(args[0]) if len(args) == 1 else None
+        too_many_args = len(args) > 1
+        value_type = Type.INT if func_name == "inputi" else Type.STRING
+        convert = int if func_name == "inputi" else str
+
+        def call_input():
+            if prompt is not None:
+                interpreter.output(get_printable(prompt()))
+            elif too_many_args:
+                interpreter.error(ErrorType.NAME_ERROR, "No inputi() function that takes > 1 parameter")
+            return Value(value_type, convert(interpreter.get_input()))
+
+        return call_input
+
+    # Same search as Interpreter.__find_which_previous_scope once the variable
+    # isn't in the requested scope: walk down through block scopes, stopping at
+    # the innermost function scope.
+    def __find_scope(self, var_name):
+        scopes = self.scopes
+        for i in range(len(scopes)):
+            env = scopes[-(i + 1)]
+            if env.isFunction is False:
+                if env.get(var_name) is not None:
+                    return -(i + 1)
+            else:
+                break
+        if var_name not in scopes[-(i + 1)].environment:
+            self.interpreter.error(ErrorType.NAME_ERROR, f"Variable {var_name} not found")
+        return -(i + 1)
+
+    # scope is only passed on where the tree walker passes it on (variables and
+    # arithmetic), everything else is evaluated against the innermost scope
+    def __compile_expr(self, expr_ast, scope=-1):
+        elem_type = expr_ast.elem_type
+        if elem_type in LITERAL_TYPES:
+            return self.__compile_const(Value(LITERAL_TYPES[elem_type], expr_ast.get("val")))
+        if elem_type == InterpreterBase.NIL_NODE:
+            return self.__compile_const(NIL_VALUE)
+        if elem_type == InterpreterBase.VAR_NODE:
+            return self.__compile_var(expr_ast.get("name"), scope)
+        if elem_type == InterpreterBase.FCALL_NODE:
+            return self.__compile_call(expr_ast)
+        if elem_type in ARITH_OPS:
+            return self.__compile_arith(expr_ast, scope)
+        if elem_type in UNARY_OPS:
+            return self.__compile_unary(expr_ast)
+        if elem_type in COMP_OPS:
+            return self.__compile_comp(expr_ast)
+        return self.__compile_const(None)
+
+    # Values are never mutated in v2, so one instance per literal is enough
+    def __compile_const(self, value_obj):
+        def const():
+            return value_obj
+
+        return const
+
+    def __compile_var(self, var_name, scope):
+        scopes = self.scopes
+        find_scope = self.__find_scope
+
+        def load_var():
+            environment = scopes[scope].environment
+            if var_name in environment:
+                return environment[var_name]
+            return scopes[find_scope(var_name)].get(var_name)
+
+        return load_var
+
+    # the tree walker evaluates a missing operand (a for or if condition that
+    # isn't a binary operation) by reading elem_type off None
+    def __compile_operand(self, operand_ast, scope=-1):
+        if operand_ast is None:
+            def missing_operand():
+                raise AttributeError("'NoneType' object has no attribute 'elem_type'")
+
+            return missing_operand
+        return self.__compile_expr(operand_ast, scope)
+
+    def __op_table(self, op):
+        return {value_type: ops.get(op) for value_type, ops in self.op_to_lambda.items()}
+
+    def __compile_arith(self, arith_ast, scope):
+        op = arith_ast.elem_type
+        left = self.__compile_expr(arith_ast.get("op1"), scope)
+        right = self.__compile_expr(arith_ast.get("op2"), scope)
+        op_table = self.__op_table(op)
+        error = self.interpreter.error
+
+        def arith():
+            left_value_obj = left()
+            right_value_obj = right()
+            if left_value_obj.t != right_value_obj.t:
+                error(ErrorType.TYPE_ERROR, f"Incompatible types for {op} operation")
+            f = op_table[left_value_obj.t]
+            if f is None:
+                error(ErrorType.TYPE_ERROR, f"Incompatible operator {op} for type {left_value_obj.t}")
+            return f(left_value_obj, right_value_obj)
+
+        return arith
+
+    def __compile_unary(self, unary_ast):
+        op = unary_ast.elem_type
+        operand = self.__compile_expr(unary_ast.get("op1"))
+        op_table = self.__op_table(op)
+        error = self.interpreter.error
+
+        def unary():
+            value_obj = operand()
+            f = op_table[value_obj.t]
+            if f is None:
+                error(ErrorType.TYPE_ERROR, f"Incompatible operator {op} for type {value_obj.t}")
+            return f(value_obj)
+
+        return unary
+
+    # also used for if/for conditions, which the tree walker runs through
+    # __eval_comp whatever kind of expression they are
+    def __compile_comp(self, comp_ast):
+        op = comp_ast.elem_type
+        left = self.__compile_operand(comp_ast.get("op1"))
+        right = self.__compile_operand(comp_ast.get("op2"))
+        op_table = self.__op_table(op)
+        error = self.interpreter.error
+
+        def comp():
+            left_value_obj = left()
+            right_value_obj = right()
+            f = op_table[left_value_obj.t]
+            if f is None:
+                error(ErrorType.TYPE_ERROR, f"Incompatible operator {op} for type {left_value_obj.t}")
+            if left_value_obj.t is not right_value_obj.t:
+                if op == "==":
+                    return FALSE_VALUE
+                elif op == "!=":
+                    return TRUE_VALUE
+                error(ErrorType.TYPE_ERROR, f"Incompatible operator {op} for type {left_value_obj.t}")
+            return f(left_value_obj, right_value_obj)
+
+        return comp
@@ -1,14 +1,57 @@
+# AST nodes.
+#
+# Element(elem_type, **fields) still works the way it always has, but it hands
+# back an instance of the typed, slotted node class for that elem_type (BinOp,
+# Var, FCall, If, ...) whenever the fields match, so the tree doesn't carry a dict
+# per node. Every node keeps the old surface: elem_type, get(key), .dict and
+# str(), and also has an integer kind tag for cheap dispatch. Anything that
+# doesn't fit a typed node (an unknown elem_type or a different set of fields)
+# falls back to DictElement, which stores its fields in a dict like before.
+import sys
+from collections.abc import MutableMapping
+
+from intbase import InterpreterBase
+
+BIN_OPS = ("+", "-", "*", "/", "==", "!=", ">", ">=", "<", "<=", "||", "&&")
+UNARY_OPS = (InterpreterBase.NEG_NODE, InterpreterBase.NOT_NODE)
+
+# integer node kind tags, one per elem_type
+ELEM_TYPES = (
+    InterpreterBase.PROGRAM_NODE,
+    InterpreterBase.STRUCT_NODE,
+    InterpreterBase.FIELD_DEF_NODE,
+    InterpreterBase.FUNC_NODE,
+    InterpreterBase.ARG_NODE,
+    InterpreterBase.VAR_DEF_NODE,
+    "=",
+    InterpreterBase.IF_NODE,
+    InterpreterBase.FOR_NODE,
+    InterpreterBase.TRY_NODE,
+    InterpreterBase.CATCH_NODE,
+    InterpreterBase.RAISE_NODE,
+    InterpreterBase.RETURN_NODE,
+    InterpreterBase.FCALL_NODE,
+    InterpreterBase.VAR_NODE,
+    InterpreterBase.NEW_NODE,
+    InterpreterBase.INT_NODE,
+    InterpreterBase.STRING_NODE,
+    InterpreterBase.BOOL_NODE,
+    InterpreterBase.NIL_NODE,
+) + UNARY_OPS + BIN_OPS
+NODE_KIND = {elem_type: kind for kind, elem_type in enumerate(ELEM_TYPES)}
+UNKNOWN_KIND = -1
+
+
 class Element:
-    def __init__(self, elem_type, **kwargs):
-        self.elem_type = elem_type
-        self.dict = {}
-        for key, value in kwargs.items():
-            self.dict[key] = value
+    __slots__ = ("elem_type", "kind")
 
-    def get(self, key):
-        if key not in self.dict:
-            return None
-        return self.dict[key]
+    def __new__(cls, elem_type=None, **kwargs):
+        if cls is not Element:
+            return object.__new__(cls)
+        node_class = NODE_CLASSES.get(elem_type)
+        if node_class is not None and kwargs.keys() == node_class.FIELD_SET:
+            return object.__new__(node_class)
+        return object.__new__(DictElement)
 
     def __str__(self):
         s = f"{self.elem_type}: "
@@ -27,3 +70,302 @@ class Element:
                 return "[" + s[0:-2] + "]"
             return "[" + s + "]"
         return str(v)
+
+
+class DictElement(Element):
+    __slots__ = ("dict",)
+
+    def __init__(self, elem_type, **kwargs):
+        self.elem_type = elem_type
+        self.kind = NODE_KIND.get(elem_type, UNKNOWN_KIND)
+        self.dict = {}
+        for key, value in kwargs.items():
+            self.dict[key] = value
+
+    def get(self, key):
+        if key not in self.dict:
+            return None
+        return self.dict[key]
+
+
+class Node(Element):
+    __slots__ = ()
+    FIELDS = ()
+    FIELD_SET = frozenset()
+
+    # only the node's fields, like the old dict: anything else (elem_type, kind,
+    # site, methods) is None
+    def get(self, key):
+        if key in self.FIELD_SET:
+            return getattr(self, key)
+        return None
+
+    @property
+    def dict(self):
+        return FieldView(self)
+
+
+# node.dict for a typed node: its fields as a mapping that reads and writes the
+# node itself, so node.dict[key] = value still changes the node. A typed node
+# has a fixed set of fields, so adding or removing one raises.
+class FieldView(MutableMapping):
+    __slots__ = ("node",)
+
+    def __init__(self, node):
+        self.node = node
+
+    def __getitem__(self, key):
+        if key not in self.node.FIELD_SET:
+            raise KeyError(key)
+        return getattr(self.node, key)
+
+    def __setitem__(self, key, value):
+        if key not in self.node.FIELD_SET:
+            raise KeyError(f"{self.node.elem_type} nodes have no field {key}")
+        setattr(self.node, key, value)
+
+    def __delitem__(self, key):
+        raise TypeError(f"can't remove field {key} from a {self.node.elem_type} node")
+
+    def __iter__(self):
+        return iter(self.node.FIELDS)
+
+    def __len__(self):
+        return len(self.node.FIELDS)
+
+
+class Program(Node):
+    __slots__ = FIELDS = ("structs", "functions")
+
+    def __init__(self, elem_type, structs=None, functions=None):
+        self.elem_type = elem_type
+        self.kind = NODE_KIND[elem_type]
+        self.structs = structs
+        self.functions = functions
+
+
+class Struct(Node):
+    __slots__ = FIELDS = ("name", "fields")
+
+    def __init__(self, elem_type, name=None, fields=None):
+        self.elem_type = elem_type
+        self.kind = NODE_KIND[elem_type]
+        self.name = name
+        self.fields = fields
+
+
+# also used for formal args and var definitions, they all carry a name and a type
+class TypedName(Node):
+    __slots__ = FIELDS = ("name", "var_type")
+
+    def __init__(self, elem_type, name=None, var_type=None):
+        self.elem_type = elem_type
+        self.kind = NODE_KIND[elem_type]
+        self.name = name
+        self.var_type = var_type
+
+
+class Func(Node):
+    __slots__ = FIELDS = ("name", "args", "return_type", "statements")
+
+    def __init__(self, elem_type, name=None, args=None, return_type=None, statements=None):
+        self.elem_type = elem_type
+        self.kind = NODE_KIND[elem_type]
+        self.name = name
+        self.args = args
+        self.return_type = return_type
+        self.statements = statements
+
+
+class Assign(Node):
+    __slots__ = FIELDS = ("name", "expression")
+
+    def __init__(self, elem_type, name=None, expression=None):
+        self.elem_type = elem_type
+        self.kind = NODE_KIND[elem_type]
+        self.name = name
+        self.expression = expression
+
+
+class If(Node):
+    __slots__ = FIELDS = ("condition", "statements", "else_statements")
+
+    def __init__(self, elem_type, condition=None, statements=None, else_statements=None):
+        self.elem_type = elem_type
+        self.kind = NODE_KIND[elem_type]
+        self.condition = condition
+        self.statements = statements
+        self.else_statements = else_statements
+
+
+class For(Node):
+    __slots__ = FIELDS = ("init", "condition", "update", "statements")
+
+    def __init__(self, elem_type, init=None, condition=None, update=None, statements=None):
+        self.elem_type = elem_type
+        self.kind = NODE_KIND[elem_type]
+        self.init = init
+        self.condition = condition
+        self.update = update
+        self.statements = statements
+
+
+class Try(Node):
+    __slots__ = FIELDS = ("statements", "catchers")
+
+    def __init__(self, elem_type, statements=None, catchers=None):
+        self.elem_type = elem_type
+        self.kind = NODE_KIND[elem_type]
+        self.statements = statements
+        self.catchers = catchers
+
+
+class Catch(Node):
+    __slots__ = FIELDS = ("exception_type", "statements")
+
+    def __init__(self, elem_type, exception_type=None, statements=None):
+        self.elem_type = elem_type
+        self.kind = NODE_KIND[elem_type]
+        self.exception_type = exception_type
+        self.statements = statements
+
+
+class Raise(Node):
+    __slots__ = FIELDS = ("exception_type",)
+
+    def __init__(self, elem_type, exception_type=None):
+        self.elem_type = elem_type
+        self.kind = NODE_KIND[elem_type]
+        self.exception_type = exception_type
+
+
+class Return(Node):
+    __slots__ = FIELDS = ("expression",)
+
+    def __init__(self, elem_type, expression=None):
+        self.elem_type = elem_type
+        self.kind = NODE_KIND[elem_type]
+        self.expression = expression
+
+
+class FCall(Node):
+    __slots__ = FIELDS = ("name", "args")
+
+    def __init__(self, elem_type, name=None, args=None):
+        self.elem_type = elem_type
+        self.kind = NODE_KIND[elem_type]
+        self.name = name
+        self.args = args
+
+
+class Var(Node):
+    __slots__ = FIELDS = ("name",)
+
+    def __init__(self, elem_type, name=None):
+        self.elem_type = elem_type
+        self.kind = NODE_KIND[elem_type]
+        self.name = name
+
+
+class New(Node):
+    __slots__ = FIELDS = ("var_type",)
+
+    def __init__(self, elem_type, var_type=None):
+        self.elem_type = elem_type
+        self.kind = NODE_KIND[elem_type]
+        self.var_type = var_type
+
+
+# int, string and bool literals
+class Literal(Node):
+    __slots__ = FIELDS = ("val",)
+
+    def __init__(self, elem_type, val=None):
+        self.elem_type = elem_type
+        self.kind = NODE_KIND[elem_type]
+        self.val = val
+
+
+class Nil(Node):
+    __slots__ = ()
+
+    def __init__(self, elem_type):
+        self.elem_type = elem_type
+        self.kind = NODE_KIND[elem_type]
+
+
+class UnaryOp(Node):
+    __slots__ = FIELDS = ("op1",)
+
+    def __init__(self, elem_type, op1=None):
+        self.elem_type = elem_type
+        self.kind = NODE_KIND[elem_type]
+        self.op1 = op1
+
+
+# site is the parsed node a copy was made from (the v4 interpreter copies
+# expressions into its thunks), so per-node caches can be shared by the copies.
+# It isn't a field.
+class BinOp(Node):
+    FIELDS = ("op1", "op2")
+    __slots__ = FIELDS + ("site",)
+
+    def __init__(self, elem_type, op1=None, op2=None):
+        self.elem_type = elem_type
+        self.kind = NODE_KIND[elem_type]
+        self.op1 = op1
+        self.op2 = op2
+        self.site = self
+
+
+NODE_CLASSES = {
+    InterpreterBase.PROGRAM_NODE: Program,
+    InterpreterBase.STRUCT_NODE: Struct,
+    InterpreterBase.FIELD_DEF_NODE: TypedName,
+    InterpreterBase.FUNC_NODE: Func,
+    InterpreterBase.ARG_NODE: TypedName,
+    InterpreterBase.VAR_DEF_NODE: TypedName,
+    "=": Assign,
+    InterpreterBase.IF_NODE: If,
+    InterpreterBase.FOR_NODE: For,
+    InterpreterBase.TRY_NODE: Try,
+    InterpreterBase.CATCH_NODE: Catch,
+    InterpreterBase.RAISE_NODE: Raise,
+    InterpreterBase.RETURN_NODE: Return,
+    InterpreterBase.FCALL_NODE: FCall,
+    InterpreterBase.VAR_NODE: Var,
+    InterpreterBase.NEW_NODE: New,
+    InterpreterBase.INT_NODE: Literal,
+    InterpreterBase.STRING_NODE: Literal,
+    InterpreterBase.BOOL_NODE: Literal,
+    InterpreterBase.NIL_NODE: Nil,
+}
+for op in UNARY_OPS:
+    NODE_CLASSES[op] = UnaryOp
+for op in BIN_OPS:
+    NODE_CLASSES[op] = BinOp
+for node_class in set(NODE_CLASSES.values()):
+    node_class.FIELD_SET = frozenset(node_class.FIELDS)
+
+
+# The name of a struct field path like a.b.c, as the parser hands it to
+# assignments and variable nodes. It's still the dotted string (for messages and
+# anywhere a name is expected), but it also keeps the root variable name and the
+# field names, interned, so nothing has to split it again. Plain variable names
+# stay plain strings.
+class DottedName(str):
+    def __new__(cls, root, fields):
+        name = str.__new__(cls, ".".join((root,) + fields))
+        name.root = sys.intern(root)
+        name.fields = tuple(sys.intern(field_name) for field_name in fields)
+        return name
+
+    def __getnewargs__(self):
+        return (self.root, self.fields)
+
+
+# name followed by field_name, which is a DottedName
+def dotted_name(name, field_name):
+    if isinstance(name, DottedName):
+        return DottedName(name.root, name.fields + (field_name,))
+    return DottedName(name, (field_name,))
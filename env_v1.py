@@ -3,8 +3,28 @@
 # anything you like. In our implementation we pass in a Value object which holds a type
 # and a value (e.g., Int, 10).
 class EnvironmentManager:
+    # block scopes that have been left, ready to be handed out again
+    free_scopes = []
+
     def __init__(self):
         self.environment = {}
+        self.isFunction = False  # True for the scope holding a function's parameters
+
+    # an empty block scope, recycled if possible so loops don't allocate one per iteration
+    @classmethod
+    def acquire(cls):
+        if cls.free_scopes:
+            return cls.free_scopes.pop()
+        return cls()
+
+    # give back a block scope that nothing refers to anymore
+    def release(self):
+        self.environment.clear()
+        self.isFunction = False
+        EnvironmentManager.free_scopes.append(self)
+
+    def checkisFunction(self):
+        return self.isFunction
 
     # Gets the data associated a variable name
     def get(self, symbol):
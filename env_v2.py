@@ -1,48 +1,26 @@
-# The EnvironmentManager class keeps a mapping between each variable name (aka symbol)
-# in a brewin program and the Value object, which stores a type, and a value.
+# The EnvironmentManager class keeps the variables of the brewin functions that are
+# currently running. Every variable is resolved to a slot in its function's frame
+# before the program runs (see resolver.py), so each call gets one flat list of
+# Value objects indexed by slot, and there is nothing to do for blocks.
 class EnvironmentManager:
     def __init__(self):
         self.environment = []
+        self.frame = None  # the running function's frame
 
-    # returns a VariableDef object
-    def get(self, symbol):
-        cur_func_env = self.environment[-1]
-        for env in reversed(cur_func_env):
-            if symbol in env:
-                return env[symbol]
+    # returns the Value object in slot of the current frame
+    def get(self, slot):
+        return self.frame[slot]
 
-        return None
+    def set(self, slot, value):
+        self.frame[slot] = value
 
-    def set(self, symbol, value):
-        cur_func_env = self.environment[-1]
-        for env in reversed(cur_func_env):
-            if symbol in env:
-                env[symbol] = value
-                return True
+    # used when we enter a new function - one empty slot per variable it has
+    def push_func(self, num_slots):
+        self.frame = [None] * num_slots
+        self.environment.append(self.frame)
+        return self.frame
 
-        return False
-
-    # create a new symbol in the top-most environment, regardless of whether that symbol exists
-    # in a lower environment
-    def create(self, symbol, value):
-        cur_func_env = self.environment[-1]
-        if symbol in cur_func_env[-1]:   # symbol already defined in current scope
-            return False
-        cur_func_env[-1][symbol] = value
-        return True
-
-    # used when we enter a new function - start with empty dictionary to hold parameters.
-    def push_func(self):
-        self.environment.append([{}])  # [[...]] -> [[...], [{}]]
-
-    def push_block(self):
-        cur_func_env = self.environment[-1]
-        cur_func_env.append({})  # [[...],[{....}] -> [[...],[{...}, {}]]
-
-    def pop_block(self):
-        cur_func_env = self.environment[-1]
-        cur_func_env.pop() 
-
-    # used when we exit a nested block to discard the environment for that block
+    # used when we leave a function, the caller's frame becomes current again
     def pop_func(self):
-        self.environment.pop()
\ No newline at end of file
+        self.environment.pop()
+        self.frame = self.environment[-1] if self.environment else None
@@ -3,6 +3,7 @@
 class EnvironmentManager:
     def __init__(self):
         self.environment = []
+        self.free_blocks = []  # dicts of blocks that have been left, reused by push_block
 
     # returns a VariableDef object
     def get(self, symbol):
@@ -37,11 +38,14 @@ class EnvironmentManager:
 
     def push_block(self):
         cur_func_env = self.environment[-1]
-        cur_func_env.append({})  # [[...],[{....}] -> [[...],[{...}, {}]]
+        block = self.free_blocks.pop() if self.free_blocks else {}
+        cur_func_env.append(block)  # [[...],[{....}] -> [[...],[{...}, {}]]
 
     def pop_block(self):
         cur_func_env = self.environment[-1]
-        cur_func_env.pop() 
+        block = cur_func_env.pop()
+        block.clear()
+        self.free_blocks.append(block)
 
     # used when we exit a nested block to discard the environment for that block
     def pop_func(self):
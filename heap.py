@@ -0,0 +1,77 @@
+# Managed heap for v3 struct instances.
+#
+# Every struct made by new is allocated through the Heap of the running
+# program as a StructObject: the list of its field slots (laid out by its
+# Shape, see shapes.py) that struct Values hold as their value, while nil
+# structs hold None. A StructObject is the handle for the instance, so it
+# compares and hashes by identity: two struct references are equal exactly
+# when they refer to the same instance or are both nil, which is a single `is`
+# whatever the instances hold or reach, and is safe on cyclic structures.
+#
+# Each struct type has a prototype, the slots of a new instance with the
+# default value of every field made once when the heap is set up (Values are
+# never mutated, so instances can share them), and new clones it in one go.
+# allocator() binds all that for one type, for the engines to look up once per
+# new in the program rather than on every allocation.
+#
+# The heap makes a StructObject subclass for each struct type, so an instance
+# costs no more than its list and the heap never has to track (or keep alive)
+# the instances it hands out: stats() finds the live ones among the objects
+# Python's collector tracks. Instances on a reference cycle stay live until the
+# collector gets to them.
+import gc
+import sys
+
+
+class StructObject(list):
+    __slots__ = ()
+
+    __eq__ = object.__eq__
+    __ne__ = object.__ne__
+    __hash__ = object.__hash__
+
+
+class Heap:
+    # default_value(field type) is the value a field of that type starts with
+    def __init__(self, shapes, default_value):
+        self.prototypes = {
+            struct_name: [default_value(field_type) for field_type in shape.field_types]
+            for struct_name, shape in shapes.items()
+        }
+        self.classes = {
+            struct_name: type(f"StructObject_{struct_name}", (StructObject,), {"__slots__": ()})
+            for struct_name in shapes
+        }
+        self.struct_names = {cls: struct_name for struct_name, cls in self.classes.items()}
+        self.allocated = dict.fromkeys(shapes, 0)
+
+    # a new instance of struct_name with every field at its default value
+    def new(self, struct_name):
+        self.allocated[struct_name] += 1
+        return self.classes[struct_name](self.prototypes[struct_name])
+
+    # a function making new instances of struct_name like new(struct_name), each
+    # returned as make_value(struct_name, instance)
+    def allocator(self, struct_name, make_value):
+        cls = self.classes[struct_name]
+        prototype = self.prototypes[struct_name]
+        allocated = self.allocated
+
+        def allocate():
+            allocated[struct_name] += 1
+            return make_value(struct_name, cls(prototype))
+        return allocate
+
+    # struct name -> allocated, live (instances not freed yet) and bytes (taken
+    # by the slot lists of the live instances, not the values in them)
+    def stats(self):
+        stats = {
+            struct_name: {"allocated": allocated, "live": 0, "bytes": 0}
+            for struct_name, allocated in self.allocated.items()
+        }
+        for obj in gc.get_objects():
+            struct_name = self.struct_names.get(type(obj))
+            if struct_name is not None:
+                stats[struct_name]["live"] += 1
+                stats[struct_name]["bytes"] += sys.getsizeof(obj)
+        return stats
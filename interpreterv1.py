@@ -16,8 +16,8 @@ class Interpreter(InterpreterBase):
         self.run_func(main_func_node)
 
     def get_main_func_node(self, ast):
-        for node in ast.dict['functions']:
-            if node.dict['name'] == 'main':
+        for node in ast.get('functions'):
+            if node.get('name') == 'main':
                 return node
         super().error(
             ErrorType.NAME_ERROR,
@@ -25,7 +25,7 @@ class Interpreter(InterpreterBase):
         )
             
     def run_func(self, func_node):
-        for statement_node in func_node.dict['statements']:
+        for statement_node in func_node.get('statements'):
             self.run_statement(statement_node)
         
     def run_statement(self, statement_node):
@@ -37,36 +37,36 @@ class Interpreter(InterpreterBase):
             self.function_call(statement_node)
     
     def variable_definition(self, statement_node):
-        if statement_node.dict['name'] in self.variable_names:
+        if statement_node.get('name') in self.variable_names:
             super().error(
                     ErrorType.NAME_ERROR,
-                    f"Variable {statement_node.dict['name']} defined more than once",
+                    f"Variable {statement_node.get('name')} defined more than once",
                     )
-        self.variable_names.append(statement_node.dict['name'])
-        self.variable_name_to_value[statement_node.dict['name']] = None   
+        self.variable_names.append(statement_node.get('name'))
+        self.variable_name_to_value[statement_node.get('name')] = None   
 
     def do_assignment(self, assignment_node):
-        if assignment_node.dict['name'] not in self.variable_names:
+        if assignment_node.get('name') not in self.variable_names:
                 super().error(
                     ErrorType.NAME_ERROR,
-                    f"Variable {assignment_node.dict['name']} not defined yet",
+                    f"Variable {assignment_node.get('name')} not defined yet",
                     )
-        self.variable_name_to_value[assignment_node.dict['name']] = self.evaluate_expression(assignment_node.dict['expression'])
+        self.variable_name_to_value[assignment_node.get('name')] = self.evaluate_expression(assignment_node.get('expression'))
 
     def evaluate_expression(self, expression_node):
         if expression_node.elem_type == 'var':
-            if expression_node.dict['name'] not in self.variable_names:
+            if expression_node.get('name') not in self.variable_names:
                 super().error(
                     ErrorType.NAME_ERROR,
-                    f"variable {expression_node.dict['name']} undefined"
+                    f"variable {expression_node.get('name')} undefined"
                 )
-            return self.variable_name_to_value[expression_node.dict['name']]
+            return self.variable_name_to_value[expression_node.get('name')]
         elif expression_node.elem_type == 'int':
-            return int(expression_node.dict['val'])
+            return int(expression_node.get('val'))
         elif expression_node.elem_type == 'string':
-            return expression_node.dict['val']
+            return expression_node.get('val')
         elif expression_node.elem_type == '+' or expression_node.elem_type == '-':
-            return self.handle_expression(expression_node.dict['op1'], expression_node.dict['op2'], expression_node.elem_type)
+            return self.handle_expression(expression_node.get('op1'), expression_node.get('op2'), expression_node.elem_type)
         elif expression_node.elem_type == 'fcall':
             return self.function_call(expression_node)
 
@@ -76,21 +76,21 @@ class Interpreter(InterpreterBase):
         # if both sides are expressions
         if op1.elem_type in ['+', '-'] and op2.elem_type in ['+', '-']:
             if operation == '+':
-                return self.handle_expression(op1.dict['op1'], op1.dict['op2'], op1.elem_type) + self.handle_expression(op2.dict['op1'], op2.dict['op2'], op2.elem_type)
-            return self.handle_expression(op1.dict['op1'], op1.dict['op2'], op1.elem_type) - self.handle_expression(op2.dict['op1'], op2.dict['op2'], op2.elem_type)
+                return self.handle_expression(op1.get('op1'), op1.get('op2'), op1.elem_type) + self.handle_expression(op2.get('op1'), op2.get('op2'), op2.elem_type)
+            return self.handle_expression(op1.get('op1'), op1.get('op2'), op1.elem_type) - self.handle_expression(op2.get('op1'), op2.get('op2'), op2.elem_type)
         # if the expression is only on left side
         elif op1.elem_type in ['+', '-']:
             # recursively call expression thing on the expression
             if operation == '+':
-                return self.handle_expression(op1.dict['op1'], op1.dict['op2'], op1.elem_type) + self.evaluate_expression(op2)
+                return self.handle_expression(op1.get('op1'), op1.get('op2'), op1.elem_type) + self.evaluate_expression(op2)
             elif operation == '-':
-                return self.handle_expression(op1.dict['op1'], op1.dict['op2'], op1.elem_type) - self.evaluate_expression(op2)
+                return self.handle_expression(op1.get('op1'), op1.get('op2'), op1.elem_type) - self.evaluate_expression(op2)
         # if the expression is only on the right side
         elif op2.elem_type in ['+', '-']:
             if operation == '+':
-                return self.evaluate_expression(op1) + self.handle_expression(op2.dict['op1'], op2.dict['op2'], op2.elem_type)
+                return self.evaluate_expression(op1) + self.handle_expression(op2.get('op1'), op2.get('op2'), op2.elem_type)
             elif operation == '-':
-                return self.evaluate_expression(op1) - self.handle_expression(op2.dict['op1'], op2.dict['op2'], op2.elem_type)
+                return self.evaluate_expression(op1) - self.handle_expression(op2.get('op1'), op2.get('op2'), op2.elem_type)
         # if any of the operators are strings
         elif op1.elem_type == 'string' or op2.elem_type == 'string':
             super().error(
@@ -127,13 +127,13 @@ class Interpreter(InterpreterBase):
         # if both operators are ints
         elif op1.elem_type == 'int':
             if operation == '+':
-                return int(op1.dict['val']) + self.evaluate_expression(op2)
-            return int(op1.dict['val']) - self.evaluate_expression(op2)
+                return int(op1.get('val')) + self.evaluate_expression(op2)
+            return int(op1.get('val')) - self.evaluate_expression(op2)
         
         elif op2.elem_type == 'int':
             if operation == '+':
-                return int(op2.dict['val']) + self.evaluate_expression(op1)
-            return self.evaluate_expression(op1) - int(op2.dict['val'])
+                return int(op2.get('val')) + self.evaluate_expression(op1)
+            return self.evaluate_expression(op1) - int(op2.get('val'))
         else:
             super().error(
                     ErrorType.NAME_ERROR,
@@ -141,17 +141,17 @@ class Interpreter(InterpreterBase):
                 )
             
     def function_call(self, function_node):
-        if function_node.dict['name'] == 'print':
-            self.handle_print(function_node.dict['args'])
-        elif function_node.dict['name'] == 'inputi':
-            if function_node.dict['args'] != None:
-                for argument in function_node.dict['args']:
+        if function_node.get('name') == 'print':
+            self.handle_print(function_node.get('args'))
+        elif function_node.get('name') == 'inputi':
+            if function_node.get('args') != None:
+                for argument in function_node.get('args'):
                     InterpreterBase.output(self, str(self.evaluate_expression(argument)))
             return int(self.get_input())
         else:
             super().error(
                     ErrorType.NAME_ERROR,
-                    f"function type {function_node.dict['name']} not supported",
+                    f"function type {function_node.get('name')} not supported",
                 )
             
     def handle_print(self, argument_nodes):
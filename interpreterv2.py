@@ -2,9 +2,12 @@
 # - printing out a nil value is undefined
 
 from env_v1 import EnvironmentManager
-from type_valuev1 import Type, Value, create_value, get_printable
+from type_valuev1 import Type, Value, NIL_VALUE, TRUE_VALUE, FALSE_VALUE, bool_value, int_value, create_value, get_printable
 from intbase import InterpreterBase, ErrorType
 from brewparse import parse_program
+from closurev2 import ClosureCompiler
+from optimizer import PassManager
+from element import Element
 
 
 # Main interpreter class
@@ -13,12 +16,18 @@ class Interpreter(InterpreterBase):
     BIN_OPS = {"+", "-", "*", "/"}
     UNARY_OPS = {"!", "neg"}
     COMP_OPS = {'==', '<', '<=', '>', '>=', '!=', '&&', '||'}
+    INPUT_FUNCS = {"print", "inputi", "inputs"}
     scopes = []
 
     # methods
-    def __init__(self, console_output=True, inp=None, trace_output=False):
+    # engine picks how the program is executed: "tree" walks the AST, "closure"
+    # compiles it to Python closures first (see closurev2.py). opt_level is the
+    # optimizer level, 0 to 2 (see optimizer.py).
+    def __init__(self, console_output=True, inp=None, trace_output=False, engine="tree", opt_level=0):
         super().__init__(console_output, inp)
         self.trace_output = trace_output
+        self.engine = engine
+        self.opt_level = opt_level
         self.__setup_ops()
 
     # run a program that's provided in a string
@@ -26,12 +35,18 @@ class Interpreter(InterpreterBase):
     # into an abstract syntax tree (ast)
     def run(self, program):
         ast = parse_program(program)
+        self.optimizer = PassManager(self.opt_level, version=2, needs_scope=self.makes_scope)
+        self.optimizer.optimize(ast)
+        self.block_needs_scope = {}
         self.__set_up_function_table(ast)
         main_func = self.__get_func_by_name_args("main", 0)
         self.env = EnvironmentManager()
         self.scopes.append(self.env)
         self.scopes[-1].isFunction = True
-        self.__run_statements(main_func.get("statements"))
+        if self.engine == "closure":
+            ClosureCompiler(self).run_main()
+        else:
+            self.__run_statements(main_func.get("statements"))
 
     def __set_up_function_table(self, ast):
         self.func_name_to_ast = {}
@@ -64,20 +79,54 @@ class Interpreter(InterpreterBase):
                     return val
             elif statement.elem_type == InterpreterBase.RETURN_NODE:
                 if statement.get("expression") == None:
-                    return (True, Value(Type.NONE, None))
+                    return (True, NIL_VALUE)
                 returned_expression = self.__eval_expr(statement.get("expression"))
                 return (True, returned_expression)
         return (False, 0)
 
+    # A block only gets a scope of its own if something could tell it apart
+    # from the enclosing one: a variable defined directly in it, or a call that
+    # passes arguments (those are looked up one scope below the callee's, which
+    # would be the enclosing block's scope instead of this one). Loop bodies
+    # that need one reuse recycled scope objects.
+    def needs_scope(self, statements):
+        needs_scope = self.block_needs_scope.get(id(statements))
+        if needs_scope is None:
+            needs_scope = self.makes_scope(statements)
+            self.block_needs_scope[id(statements)] = needs_scope
+        return needs_scope
+
+    # needs_scope without the cache, for the optimizer (see optimizer.py), which
+    # runs while the blocks are still being rewritten
+    def makes_scope(self, statements):
+        return any(
+            statement.elem_type == InterpreterBase.VAR_DEF_NODE or self.__passes_args(statement)
+            for statement in statements
+        )
+
+    def __passes_args(self, node):
+        if isinstance(node, list):
+            return any(self.__passes_args(item) for item in node)
+        if not isinstance(node, Element):
+            return False
+        if node.elem_type == InterpreterBase.FCALL_NODE and node.get("name") not in self.INPUT_FUNCS and node.get("args"):
+            return True
+        return any(self.__passes_args(value) for value in node.dict.values())
+
+    def __run_block(self, statements):
+        if not self.needs_scope(statements):
+            return self.__run_statements(statements)
+        self.scopes.append(EnvironmentManager.acquire())
+        value = self.__run_statements(statements)
+        self.scopes.pop().release()
+        return value
+
     def __run_for(self, for_node):
         self.__assign(for_node.get("init"))
         while (self.__eval_comp(for_node.get("condition")).value() is True):
-            self.scopes.append(EnvironmentManager())
-            value = self.__run_statements(for_node.get("statements"))
+            value = self.__run_block(for_node.get("statements"))
             if value is not None and value[0] is True:
-                self.scopes.pop()
                 return value
-            self.scopes.pop()
             self.__assign(for_node.get("update"))
 
     def __run_if(self, if_node):
@@ -85,41 +134,29 @@ class Interpreter(InterpreterBase):
             super().error(ErrorType.TYPE_ERROR, f"")
 
         elif (self.__eval_expr(if_node.get("condition")).value() == True ):
-            self.scopes.append(EnvironmentManager())
-            value = self.__run_statements(if_node.get("statements"))
+            value = self.__run_block(if_node.get("statements"))
             if value is not None and value[0] is True:
-                self.scopes.pop()
                 return value
-            self.scopes.pop()
         
         elif (self.__eval_expr(if_node.get("condition")).value() == False ):
             if if_node.get("else_statements") is None:
                 return None
-            self.scopes.append(EnvironmentManager())
-            value = self.__run_statements(if_node.get("else_statements"))
+            value = self.__run_block(if_node.get("else_statements"))
             if value is not None and value[0] is True:
-                self.scopes.pop()
                 return value
-            self.scopes.pop()
 
         elif (self.__eval_comp(if_node.get("condition")).value()):
-            self.scopes.append(EnvironmentManager())
-            value = self.__run_statements(if_node.get("statements"))
+            value = self.__run_block(if_node.get("statements"))
             if value is not None and value[0] is True:
-                self.scopes.pop()
                 return value
-            self.scopes.pop()
             # add what's supposed to happen if one of the statements had a return
         
         elif (self.__eval_comp(if_node.get("condition")).value() is False):
             if if_node.get("else_statements") is None:
                 return None
-            self.scopes.append(EnvironmentManager())
-            value = self.__run_statements(if_node.get("else_statements"))
+            value = self.__run_block(if_node.get("else_statements"))
             if value is not None and value[0] is True:
-                self.scopes.pop()
                 return value
-            self.scopes.pop()
         else:
             super().error(ErrorType.TYPE_ERROR, f"If statement not boolean expression")
 
@@ -146,7 +183,7 @@ class Interpreter(InterpreterBase):
                 self.scopes.pop()
                 return returned[1]
             self.scopes.pop()
-            return Value(Type.NONE, None)
+            return NIL_VALUE
 
 
 
@@ -158,7 +195,7 @@ class Interpreter(InterpreterBase):
             result = self.__eval_expr(arg)  # result is a Value object
             output = output + get_printable(result)
         super().output(output)
-        return Value(Type.NONE, None)
+        return NIL_VALUE
 
     def __call_input(self, call_ast):
         args = call_ast.get("args")
@@ -171,7 +208,7 @@ class Interpreter(InterpreterBase):
             )
         inp = super().get_input()
         if call_ast.get("name") == "inputi":
-            return Value(Type.INT, int(inp))
+            return int_value(int(inp))
         if call_ast.get("name") == "inputs":
             return Value(Type.STRING, str(inp))
         # we can support inputs here later
@@ -200,20 +237,20 @@ class Interpreter(InterpreterBase):
 
     def __var_def(self, var_ast, scope=-1):
         var_name = var_ast.get("name")
-        if not self.scopes[scope].create(var_name, Value(Type.INT, 0)):
+        if not self.scopes[scope].create(var_name, int_value(0)):
             super().error(
                 ErrorType.NAME_ERROR, f"Duplicate definition for variable {var_name}"
             )
 
     def __eval_expr(self, expr_ast, scope=-1):
         if expr_ast.elem_type == InterpreterBase.INT_NODE:
-            return Value(Type.INT, expr_ast.get("val"))
+            return int_value(expr_ast.get("val"))
         if expr_ast.elem_type == InterpreterBase.STRING_NODE:
             return Value(Type.STRING, expr_ast.get("val"))
         if expr_ast.elem_type == InterpreterBase.NIL_NODE:
-            return Value(Type.NONE, None)
+            return NIL_VALUE
         if expr_ast.elem_type == InterpreterBase.BOOL_NODE:
-            return Value(Type.BOOL, expr_ast.get("val"))
+            return bool_value(expr_ast.get("val"))
         if expr_ast.elem_type == InterpreterBase.VAR_NODE:
             var_name = expr_ast.get("name")
             return self.scopes[self.__find_which_previous_scope(var_name, scope)].get(var_name)
@@ -270,9 +307,9 @@ class Interpreter(InterpreterBase):
 
         if left_value_obj.type() is not right_value_obj.type():
             if comp_ast.elem_type == '==':
-                return Value(Type.BOOL, False)
+                return FALSE_VALUE
             elif comp_ast.elem_type == '!=':
-                return Value(Type.BOOL, True)
+                return TRUE_VALUE
             else:
                 
                 super().error(
@@ -287,40 +324,40 @@ class Interpreter(InterpreterBase):
         # set up operations on integers
         self.op_to_lambda[Type.INT] = {}
         # arithmetic operatoins
-        self.op_to_lambda[Type.INT]["+"] = lambda x, y: Value(
-            x.type(), x.value() + y.value()
+        self.op_to_lambda[Type.INT]["+"] = lambda x, y: int_value(
+            x.value() + y.value()
         )
-        self.op_to_lambda[Type.INT]["-"] = lambda x, y: Value(
-            x.type(), x.value() - y.value()
+        self.op_to_lambda[Type.INT]["-"] = lambda x, y: int_value(
+            x.value() - y.value()
         )
-        self.op_to_lambda[Type.INT]["*"] = lambda x, y: Value(
-            x.type(), x.value() * y.value()
+        self.op_to_lambda[Type.INT]["*"] = lambda x, y: int_value(
+            x.value() * y.value()
         )
-        self.op_to_lambda[Type.INT]["/"] = lambda x, y: Value(
-            x.type(), x.value() // y.value()
+        self.op_to_lambda[Type.INT]["/"] = lambda x, y: int_value(
+            x.value() // y.value()
         )
         # unary operators
-        self.op_to_lambda[Type.INT]['neg'] = lambda x: Value(
-            x.type(), -1 * x.value()
+        self.op_to_lambda[Type.INT]['neg'] = lambda x: int_value(
+            -1 * x.value()
         )
         # comparison operators
-        self.op_to_lambda[Type.INT]['=='] = lambda x, y: Value(
-            Type.BOOL, x.value() == y.value()
+        self.op_to_lambda[Type.INT]['=='] = lambda x, y: bool_value(
+            x.value() == y.value()
         )
-        self.op_to_lambda[Type.INT]['!='] = lambda x, y: Value(
-            Type.BOOL, x.value() != y.value()
+        self.op_to_lambda[Type.INT]['!='] = lambda x, y: bool_value(
+            x.value() != y.value()
         )
-        self.op_to_lambda[Type.INT]['<'] = lambda x, y: Value(
-            Type.BOOL, x.value() < y.value()
+        self.op_to_lambda[Type.INT]['<'] = lambda x, y: bool_value(
+            x.value() < y.value()
         )
-        self.op_to_lambda[Type.INT]["<="] = lambda x, y: Value(
-            Type.BOOL, x.value() <= y.value()
+        self.op_to_lambda[Type.INT]["<="] = lambda x, y: bool_value(
+            x.value() <= y.value()
         )
-        self.op_to_lambda[Type.INT]['>'] = lambda x, y: Value(
-            Type.BOOL, x.value() > y.value()
+        self.op_to_lambda[Type.INT]['>'] = lambda x, y: bool_value(
+            x.value() > y.value()
         )
-        self.op_to_lambda[Type.INT][">="] = lambda x, y: Value(
-            Type.BOOL, x.value() >= y.value()
+        self.op_to_lambda[Type.INT][">="] = lambda x, y: bool_value(
+            x.value() >= y.value()
         )
 
         # set up operations on booleans
@@ -333,25 +370,25 @@ class Interpreter(InterpreterBase):
             x.type(), x.value() and y.value()
         )
         # logical unary operators
-        self.op_to_lambda[Type.BOOL]["!"] = lambda x: Value(
-            x.type(), not x.value()
+        self.op_to_lambda[Type.BOOL]["!"] = lambda x: bool_value(
+            not x.value()
         )
         # comparison operators
-        self.op_to_lambda[Type.BOOL]['=='] = lambda x, y: Value(
-            x.type(), x.value() == y.value()
+        self.op_to_lambda[Type.BOOL]['=='] = lambda x, y: bool_value(
+            x.value() == y.value()
         )
-        self.op_to_lambda[Type.BOOL]['!='] = lambda x, y: Value(
-            x.type(), x.value() != y.value()
+        self.op_to_lambda[Type.BOOL]['!='] = lambda x, y: bool_value(
+            x.value() != y.value()
         )
 
         # set up operations on None
         self.op_to_lambda[Type.NONE] = {}
          # comparison operators
-        self.op_to_lambda[Type.NONE]['=='] = lambda x, y: Value(
-            Type.BOOL, x.value() == y.value()
+        self.op_to_lambda[Type.NONE]['=='] = lambda x, y: bool_value(
+            x.value() == y.value()
         )
-        self.op_to_lambda[Type.NONE]['!='] = lambda x, y: Value(
-            Type.BOOL, x.value() != y.value()
+        self.op_to_lambda[Type.NONE]['!='] = lambda x, y: bool_value(
+            x.value() != y.value()
         )
 
         # set up operations on strings
@@ -362,9 +399,9 @@ class Interpreter(InterpreterBase):
             x.type(), x.value() + y.value()
         )
         #comparison operators
-        self.op_to_lambda[Type.STRING]["=="] = lambda x, y: Value(
-            Type.BOOL, x.value() == y.value()
+        self.op_to_lambda[Type.STRING]["=="] = lambda x, y: bool_value(
+            x.value() == y.value()
         )
-        self.op_to_lambda[Type.STRING]["!="] = lambda x, y: Value(
-            Type.BOOL, x.value() != y.value()
+        self.op_to_lambda[Type.STRING]["!="] = lambda x, y: bool_value(
+            x.value() != y.value()
         )
\ No newline at end of file
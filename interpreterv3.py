@@ -1,15 +1,25 @@
-import copy
 from enum import Enum
 
 from brewparse import parse_program
+from bytecodev3 import VM
+from element import DottedName
+from heap import Heap
+from pythonv3 import Transpiler
+from resolver import Resolver
+from shapes import FieldPath, Shape
+from typecheckv3 import TypeChecker
+from opcache import OpCaches, specialized_ops
+from optimizer import PassManager
+from purity import MemoCache, PurityAnalysis
 from env_v2 import EnvironmentManager
 from intbase import InterpreterBase, ErrorType
-from type_valuev2 import Type, Value, create_value, get_printable
+from type_valuev2 import Type, Value, TRUE_VALUE, FALSE_VALUE, VOID_VALUE, bool_value, int_value, create_value, get_printable
 
 
 class ExecStatus(Enum):
     CONTINUE = 1
     RETURN = 2
+    TAIL_CALL = 3  # the value is (callee's func_ast, its coerced arguments)
 
 
 # Main interpreter class
@@ -19,24 +29,56 @@ class Interpreter(InterpreterBase):
     TRUE_VALUE = create_value(InterpreterBase.TRUE_DEF)
     BIN_OPS = {"+", "-", "*", "/", "==", "!=", ">", ">=", "<", "<=", "||", "&&"}
     PRIMITIVES = [Type.INT, Type.BOOL, Type.STRING, Type.NIL]
+    BUILTIN_FUNCS = {"print", "inputi", "inputs"}
 
     # methods
-    def __init__(self, console_output=True, inp=None, trace_output=False):
+    # engine picks how the program is executed: "tree" walks the AST, "vm"
+    # compiles it to bytecode first (see bytecodev3.py) and "python" translates
+    # it to Python (see pythonv3.py). With check_types the type errors the
+    # checker (see typecheckv3.py) finds are reported before the program runs,
+    # otherwise only when the program gets to them. opt_level is the optimizer
+    # level, 0 to 2 (see optimizer.py). memo_size bounds the number of results of
+    # pure function calls kept (see purity.py), 0 turns memoization off.
+    def __init__(self, console_output=True, inp=None, trace_output=False, engine="tree", check_types=False, opt_level=0,
+                 memo_size=1024):
         super().__init__(console_output, inp)
         self.trace_output = trace_output
+        self.engine = engine
+        self.opt_level = opt_level
+        self.memo_size = memo_size
+        self.check_types = check_types
         self.structs = {}
+        self.shapes = {}  # struct name -> its Shape (see shapes.py)
+        self.field_paths = {}  # (dotted path, struct type of its root) -> its FieldPath
         self.__setup_ops()
+        self.specialized_ops = specialized_ops(Value, int_value, bool_value)
 
     # run a program that's provided in a string
     # usese the provided Parser found in brewparse.py to parse the program
     # into an abstract syntax tree (ast)
     def run(self, program):
         ast = parse_program(program)
+        self.optimizer = PassManager(self.opt_level, version=3)
+        self.optimizer.optimize(ast)
         self.__parse_structs(ast)
+        self.heap = Heap(self.shapes, self.get_default_value)  # struct instances, see heap.py
         self.__setup_struct_ops()
         self.__set_up_function_table(ast)
+        self.resolver = Resolver().resolve_program(self.func_name_to_ast)
+        self.checker = TypeChecker(self).check_program()
+        self.op_caches = OpCaches(self.specialize_op, self.apply_binary_op)
+        self.purity = PurityAnalysis(self).analyze_program()
+        self.memo = MemoCache(self.memo_size, self.purity.memoizable)
+        if self.check_types and self.checker.errors:
+            _, description = self.checker.errors[0]
+            super().error(ErrorType.TYPE_ERROR, description)
         self.env = EnvironmentManager()
-        self.__call_func_aux("main", [])
+        if self.engine == "vm":
+            VM(self).run_main()
+        elif self.engine == "python":
+            Transpiler(self).run_main()
+        else:
+            self.__call_func_aux("main", [])
 
     def __parse_structs(self, program_node):
         for struct_node in program_node.get("structs"):
@@ -58,6 +100,7 @@ class Interpreter(InterpreterBase):
                             )
                 fields[field_node.get("name")] = field_node.get("var_type")
             self.structs[struct_name] = fields
+            self.shapes[struct_name] = Shape(struct_name, fields)
 
     def __set_up_function_table(self, ast):
         self.func_name_to_ast = {}
@@ -74,7 +117,7 @@ class Interpreter(InterpreterBase):
                     )
             # check if the return value is a valid type
             return_type = func_def.get("return_type")
-            if return_type not in self.structs and return_type not in self.PRIMITIVES:
+            if return_type not in self.structs and return_type not in self.PRIMITIVES and return_type != Interpreter.VOID_DEF:
                 super().error(
                     ErrorType.TYPE_ERROR,
                     f"invalid return type {return_type}"
@@ -83,7 +126,7 @@ class Interpreter(InterpreterBase):
                 self.func_name_to_ast[func_name] = {}
             self.func_name_to_ast[func_name][num_params] = func_def
 
-    def __get_func_by_name(self, name, num_params):
+    def get_func_by_name(self, name, num_params):
         if name not in self.func_name_to_ast:
             super().error(ErrorType.NAME_ERROR, f"Function {name} not found")
         candidate_funcs = self.func_name_to_ast[name]
@@ -94,17 +137,16 @@ class Interpreter(InterpreterBase):
             )
         return candidate_funcs[num_params]
 
+    # blocks need no bookkeeping, the resolver already gave their variables
+    # slots of their own
     def __run_statements(self, statements):
-        self.env.push_block()
         for statement in statements:
             if self.trace_output:
                 print(statement)
             status, return_val = self.__run_statement(statement)
-            if status == ExecStatus.RETURN:
-                self.env.pop_block()
+            if status != ExecStatus.CONTINUE:
                 return (status, return_val)
 
-        self.env.pop_block()
         return (ExecStatus.CONTINUE, Interpreter.NIL_VALUE)
 
     def __run_statement(self, statement):
@@ -135,7 +177,7 @@ class Interpreter(InterpreterBase):
             return self.__call_print(actual_args)
         if func_name == "inputi" or func_name == "inputs":
             return self.__call_input(func_name, actual_args)
-        func_ast = self.__get_func_by_name(func_name, len(actual_args))
+        func_ast = self.get_func_by_name(func_name, len(actual_args))
         formal_args = func_ast.get("args")
         if len(actual_args) != len(formal_args):
             super().error(
@@ -143,50 +185,105 @@ class Interpreter(InterpreterBase):
                 f"Function {func_ast.get('name')} with {len(actual_args)} args not found",
             )
 
-        # first evaluate all of the actual parameters and associate them with the formal parameter names
-        args = {}
+        # first evaluate all of the actual parameters
+        args = self.__eval_args(func_ast, actual_args)
+        memo_key = self.memo.key(func_ast, args)
+        if memo_key is not None:
+            cached = self.memo.lookup(memo_key)
+            if cached is not None:
+                return cached
+
+        # a tail call leaves its function before the callee runs, so the
+        # return types of the functions that were left are kept here to coerce
+        # the final value with, innermost last
+        pending_return_types = []
+        while True:
+            # create the new activation record
+            frame = self.env.push_func(self.resolver.frame_sizes[id(func_ast)])
+            # and put the formal arguments in their slots
+            for slot, value in zip(self.resolver.param_slots[id(func_ast)], args):
+                frame[slot] = value
+            return_type = func_ast.get("return_type")
+            status, return_val = self.__run_statements(func_ast.get("statements"))
+            self.env.pop_func()
+            if status != ExecStatus.TAIL_CALL:
+                break
+            func_ast, args = return_val
+            if func_ast.get("return_type") != return_type:
+                pending_return_types.append(return_type)
+        return_val = self.finish_call(return_type, return_val)
+        for caller_return_type in reversed(pending_return_types):
+            return_val = self.finish_tail_call(caller_return_type, return_val)
+        if memo_key is not None:
+            self.memo.store(memo_key, return_val)
+        return return_val
 
-        for formal_ast, actual_ast in zip(formal_args, actual_args):
-            formal_arg_type = formal_ast.get("var_type")
-            result = self.__eval_expr(actual_ast)
-            result = self.__coerce_value(formal_arg_type, result)
+    def __eval_args(self, func_ast, actual_args):
+        args = []
+        exact_args = self.checker.exact_args
+        for formal_ast, actual_ast in zip(func_ast.get("args"), actual_args):
+            if actual_ast in exact_args:
+                # already a primitive of the formal type
+                args.append(self.__eval_expr(actual_ast))
+            else:
+                args.append(self.coerce_arg(formal_ast, self.__eval_expr(actual_ast)))
+        return args
 
-            # if the thing being passed through isn't a struct
-            if formal_arg_type not in self.structs:
+    # The helpers below hold the runtime semantics that don't depend on how the
+    # program is executed, so the other execution engines (see bytecodev3.py and
+    # pythonv3.py)
+    # share them with the tree walker and behave identically.
 
-                # if the thing being passed through isn't a primitive
-                if formal_arg_type not in self.PRIMITIVES:
-                    super().error(
-                        ErrorType.TYPE_ERROR,
-                        f"Invalid Types called with function: formal type {formal_arg_type} and actual argument {actual_arg_type}"
-                    )
-                # the argument passed through is a primitive, so make a copy of it to pass by value
-                result = copy.copy(result)
-            arg_name = formal_ast.get("name")
-            args[arg_name] = result
-
-        # then create the new activation record 
-        self.env.push_func()
-        # and add the formal arguments to the activation record
-        for arg_name, value in args.items():
-          self.env.create(arg_name, value)
-        return_type = func_ast.get("return_type")
-        _, return_val = self.__run_statements(func_ast.get("statements"))
-        self.env.pop_func()
+    # evaluated actual argument -> the value bound to the formal parameter
+    def coerce_arg(self, formal_ast, result):
+        formal_arg_type = formal_ast.get("var_type")
+        result = self.coerce_value(formal_arg_type, result)
 
+        # if the thing being passed through isn't a struct
+        if formal_arg_type not in self.structs:
+
+            # if the thing being passed through isn't a primitive
+            if formal_arg_type not in self.PRIMITIVES:
+                super().error(
+                    ErrorType.TYPE_ERROR,
+                    f"Invalid Types called with function: formal type {formal_arg_type} and actual argument {actual_arg_type}"
+                )
+        # primitives are passed by value, which takes no copy as Values are never
+        # changed
+        return result
+
+    # the function a return expression calls in tail position, or None if it
+    # isn't a call to a function that returns a value. Such a call is made
+    # after its caller is left.
+    def tail_callee(self, expr_ast):
+        func_name = expr_ast.get("name")
+        if expr_ast.elem_type != InterpreterBase.FCALL_NODE or func_name in Interpreter.BUILTIN_FUNCS:
+            return None
+        func_ast = self.func_name_to_ast.get(func_name, {}).get(len(expr_ast.get("args")))
+        if func_ast is None or func_ast.get("return_type") == Interpreter.VOID_DEF:
+            return None
+        return func_ast
+
+    # value of a tail call -> value of the call expression of a function that
+    # was left for it, as if the function had returned it
+    def finish_tail_call(self, return_type, return_val):
+        return self.finish_call(return_type, self.return_value(return_val))
+
+    # value returned by the function body -> value of the call expression
+    def finish_call(self, return_type, return_val):
         # if it returns nothing and the return type indicates that it should return something
         if return_val == Interpreter.NIL_VALUE and return_type != Interpreter.VOID_DEF:
             return self.get_default_value(return_type)
         if return_val == Interpreter.NIL_VALUE and return_type == Interpreter.VOID_DEF:
-            return Value(Type.VOID, None)
-        return_val = self.__coerce_value(return_type, return_val)
+            return VOID_VALUE
+        return_val = self.coerce_value(return_type, return_val)
         return return_val
-    
-    def __coerce_value(self, coercer_type, coercee):
+
+    def coerce_value(self, coercer_type, coercee):
         if coercer_type == Type.BOOL and coercee.type() == Type.INT:
             if coercee.value() == 0:
-                return Value(Type.BOOL, False)
-            return Value(Type.BOOL, True)
+                return FALSE_VALUE
+            return TRUE_VALUE
         if coercer_type != coercee.type():
             if coercer_type in self.structs and coercee.type() == Type.NIL:
                 return Value(Type.NIL, None)
@@ -201,118 +298,82 @@ class Interpreter(InterpreterBase):
         output = ""
         for arg in args:
             result = self.__eval_expr(arg)  # result is a Value object
-            output = output + get_printable(result, self.structs)
+            output = output + get_printable(result)
+        super().output(output)
+        return Interpreter.NIL_VALUE
+
+    def print_values(self, values):
+        output = ""
+        for result in values:
+            output = output + get_printable(result)
         super().output(output)
         return Interpreter.NIL_VALUE
 
     def __call_input(self, name, args):
         if args is not None and len(args) == 1:
             result = self.__eval_expr(args[0])
-            super().output(get_printable(result, self.structs))
+            super().output(get_printable(result))
         elif args is not None and len(args) > 1:
             super().error(
                 ErrorType.NAME_ERROR, "No inputi() function that takes > 1 parameter"
             )
+        return self.read_input(name)
+
+    def read_input(self, name):
         inp = super().get_input()
         if name == "inputi":
-            return Value(Type.INT, int(inp))
+            return int_value(int(inp))
         if name == "inputs":
             return Value(Type.STRING, inp)
 
     def __assign(self, assign_ast):
         var_name = assign_ast.get("name")
         value_obj = self.__eval_expr(assign_ast.get("expression"))
-        if '.' in var_name:
-            struct_var = var_name.split('.')
-            root_var_name = struct_var[0]
-            struct = self.env.get(root_var_name)
-            if struct.type() not in self.structs:
-                    super().error(
-                        ErrorType.TYPE_ERROR, f"Undefined dot operator access {root_var_name}"
-                    )
-            if struct is None:
-                super().error(
-                    ErrorType.NAME_ERROR, f"Undefined struct variable {root_var_name}"
-                )
-            current = struct
-            for field_name in struct_var[1:-1]:
-                if field_name not in current.value().keys():
-                    super().error(
-                        ErrorType.NAME_ERROR, f"field {field_name} does not exist"
-                    )
-                current = current.value().get(field_name)
-                if current is None:
-                    super().error(
-                        ErrorType.NAME_ERROR, f"field {field_name} is undefined"
-                    )
-            final_field = struct_var[-1]
-            if current.value() is None:
-                super().error(ErrorType.FAULT_ERROR, f"Object {root_var_name} has not been initialized yet")
-            if final_field not in current.value().keys():
-                super().error(ErrorType.NAME_ERROR, f"Field {final_field} does not exist in {root_var_name}")
-            assigned_value = self.__coerce_value(current.value().get(final_field).type(), value_obj)
-            current.value()[final_field] = assigned_value
+        self.assign_var(var_name, self.resolver.slots[assign_ast], value_obj)
 
+    # slot is where the resolver put var_name (or its root variable), None if
+    # there is no such variable
+    def assign_var(self, var_name, slot, value_obj):
+        if isinstance(var_name, DottedName):
+            self.assign_field(None if slot is None else self.env.frame[slot], var_name, value_obj)
         else:
-            if not self.env.set(var_name, value_obj):
+            if slot is None:
                 super().error(
                     ErrorType.NAME_ERROR, f"Undefined variable {var_name} in assignment"
                 )
+            self.env.frame[slot] = value_obj
+
+    # struct is the value of the root variable of the dotted var_name (None if
+    # it isn't defined)
+    def assign_field(self, struct, var_name, value_obj):
+        fields = self.__field_slots(struct, var_name)
+        slot = self.field_paths[var_name, struct.t].slot
+        assigned_value = self.coerce_value(fields[slot].type(), value_obj)
+        fields[slot] = assigned_value
     
     def __var_def(self, var_ast):
-        var_name = var_ast.get("name")
-        var_type = var_ast.get("var_type")
+        self.define_var(var_ast.get("name"), self.resolver.slots[var_ast], var_ast.get("var_type"))
+
+    # slot is None when var_name is already defined in the same block
+    def define_var(self, var_name, slot, var_type):
         default_value = self.get_default_value(var_type)
-        if not self.env.create(var_name, default_value):
+        if slot is None:
             super().error(
                 ErrorType.NAME_ERROR, f"Duplicate definition for variable {var_name}"
             )
+        self.env.frame[slot] = default_value
 
     def __eval_expr(self, expr_ast):
         if expr_ast.elem_type == InterpreterBase.NIL_NODE:
             return Interpreter.NIL_VALUE
         if expr_ast.elem_type == InterpreterBase.INT_NODE:
-            return Value(Type.INT, expr_ast.get("val"))
+            return int_value(expr_ast.get("val"))
         if expr_ast.elem_type == InterpreterBase.STRING_NODE:
             return Value(Type.STRING, expr_ast.get("val"))
         if expr_ast.elem_type == InterpreterBase.BOOL_NODE:
-            return Value(Type.BOOL, expr_ast.get("val"))
+            return bool_value(expr_ast.get("val"))
         if expr_ast.elem_type == InterpreterBase.VAR_NODE:
-            var_name = expr_ast.get("name")
-            if '.' in var_name:
-                struct_var = var_name.split('.')
-                root_var_name = struct_var[0]
-                struct = self.env.get(root_var_name)
-                if struct.type() not in self.structs:
-                    super().error(
-                        ErrorType.TYPE_ERROR, f"Undefined dot operator access {root_var_name}"
-                    )
-                if struct is None:
-                    super().error(
-                        ErrorType.NAME_ERROR, f"Undefined struct variable {root_var_name}"
-                    )
-                current = struct
-                for field_name in struct_var[1:-1]:
-                    if field_name not in current.value().keys():
-                        super().error(
-                            ErrorType.NAME_ERROR, f"field {field_name} does not exist"
-                        )
-                    current = current.value().get(field_name)
-                    if current is None:
-                        super().error(
-                            ErrorType.NAME_ERROR, f"field {field_name} is undefined"
-                        )
-                final_field = struct_var[-1]
-                if current.value() is None:
-                    super().error(ErrorType.FAULT_ERROR, f"Object {root_var_name} has not been initialized yet")
-                if final_field not in current.value().keys():
-                    super().error(ErrorType.NAME_ERROR, f"Field {final_field} does not exist in {root_var_name}")
-                return current.value().get(final_field)
-            else:
-                val = self.env.get(var_name)
-                if val is None:
-                    super().error(ErrorType.NAME_ERROR, f"Variable {var_name} not found")
-                return val
+            return self.lookup_var(expr_ast.get("name"), self.resolver.slots[expr_ast])
         if expr_ast.elem_type == InterpreterBase.FCALL_NODE:
             # MAKE IT SO VOID FUNCTIONS CANNOT BE RETURNED
             returned_val = self.__call_func(expr_ast)
@@ -326,25 +387,68 @@ class Interpreter(InterpreterBase):
         if expr_ast.elem_type == Interpreter.NOT_NODE:
             return self.__eval_unary(expr_ast, Type.BOOL, lambda x: not x)
         if expr_ast.elem_type == Interpreter.NEW_NODE:
-            return self.__execute_new(expr_ast.get("var_type"))
+            return self.execute_new(expr_ast.get("var_type"))
         
-    def __execute_new(self, struct_name):
+    def lookup_var(self, var_name, slot):
+        if isinstance(var_name, DottedName):
+            return self.lookup_field(None if slot is None else self.env.frame[slot], var_name)
+        else:
+            if slot is None:
+                super().error(ErrorType.NAME_ERROR, f"Variable {var_name} not found")
+            return self.env.frame[slot]
+
+    # struct is the value of the root variable of the dotted var_name (None if
+    # it isn't defined)
+    def lookup_field(self, struct, var_name):
+        fields = self.__field_slots(struct, var_name)
+        return fields[self.field_paths[var_name, struct.t].slot]
+
+    # the slots of the struct holding the last field of the dotted var_name,
+    # whose root variable has the value struct, once the path is known to lead
+    # to a field
+    def __field_slots(self, struct, var_name):
+        if struct.type() not in self.structs:
+            super().error(
+                ErrorType.TYPE_ERROR, f"Undefined dot operator access {var_name.root}"
+            )
+        path = self.field_paths.get((var_name, struct.t))
+        if path is None:
+            path = self.field_paths[var_name, struct.t] = FieldPath(var_name, self.shapes[struct.t], self.shapes)
+        current = struct
+        for field_name, slot in path.steps:
+            if current.value() is None:
+                super().error(ErrorType.FAULT_ERROR, f"Object {path.root} has not been initialized yet")
+            if slot is None:
+                super().error(
+                    ErrorType.NAME_ERROR, f"field {field_name} does not exist"
+                )
+            current = current.value()[slot]
+        if current.value() is None:
+            super().error(ErrorType.FAULT_ERROR, f"Object {path.root} has not been initialized yet")
+        if path.slot is None:
+            super().error(ErrorType.NAME_ERROR, f"Field {path.field} does not exist in {path.root}")
+        return current.value()
+
+    def execute_new(self, struct_name):
         if struct_name not in self.structs:
             super().error(
                 ErrorType.TYPE_ERROR,
                 f"Undefined Struct Type: {struct_name}"
             )
-        struct_fields = self.structs[struct_name]
-        struct_instance = {}
-        for field_name, field_type in struct_fields.items():
-            struct_instance[field_name] = self.get_default_value(field_type)
-        return Value(struct_name, struct_instance)
+        return Value(struct_name, self.heap.new(struct_name))
+
+    # a function doing execute_new(struct_name), for the engines to bind once per
+    # new (see heap.py)
+    def struct_allocator(self, struct_name):
+        if struct_name not in self.structs:
+            return lambda: self.execute_new(struct_name)
+        return self.heap.allocator(struct_name, Value)
 
     def get_default_value(self, var_type):
         if var_type == Type.INT:
-            return Value(Type.INT, 0)
+            return int_value(0)
         elif var_type == Type.BOOL:
-            return Value(Type.BOOL, False)
+            return FALSE_VALUE
         elif var_type == Type.STRING:
             return Value(Type.STRING, "")
         elif var_type in self.structs:
@@ -356,31 +460,43 @@ class Interpreter(InterpreterBase):
     def __eval_op(self, arith_ast):
         left_value_obj = self.__eval_expr(arith_ast.get("op1"))
         right_value_obj = self.__eval_expr(arith_ast.get("op2"))
+        f = self.checker.fast_ops.get(arith_ast)
+        if f is not None:
+            return f(left_value_obj, right_value_obj)
+        return self.op_caches.apply(arith_ast, left_value_obj, right_value_obj)
+
+    # the inline cache handler for op on two operands of type t (see opcache.py)
+    def specialize_op(self, op, t):
+        if op not in self.op_to_lambda.get(t, {}):
+            return None
+        return self.specialized_ops.get(t, {}).get(op)
+
+    def apply_binary_op(self, op, left_value_obj, right_value_obj):
         # probably add coercion of ints to bools and bools to ints somewhere here
 
         if not self.__compatible_types(
-            arith_ast.elem_type, left_value_obj, right_value_obj
+            op, left_value_obj, right_value_obj
         ):
             if left_value_obj.type() == Type.BOOL and right_value_obj.type() == Type.INT:
-                right_value_obj = self.__coerce_value(left_value_obj.type(), right_value_obj)
+                right_value_obj = self.coerce_value(left_value_obj.type(), right_value_obj)
             elif left_value_obj.type() == Type.INT and right_value_obj.type() == Type.BOOL:
-                left_value_obj = self.__coerce_value(right_value_obj.type(), left_value_obj)
+                left_value_obj = self.coerce_value(right_value_obj.type(), left_value_obj)
             else:
                 super().error(
                     ErrorType.TYPE_ERROR,
-                    f"Incompatible types for {arith_ast.elem_type} operation",
+                    f"Incompatible types for {op} operation",
                 )
         if left_value_obj.type() == Type.BOOL and right_value_obj.type() == Type.INT:
-            right_value_obj = self.__coerce_value(left_value_obj.type(), right_value_obj)
+            right_value_obj = self.coerce_value(left_value_obj.type(), right_value_obj)
         if left_value_obj.type() == Type.INT and right_value_obj.type() == Type.BOOL:
-            left_value_obj = self.__coerce_value(right_value_obj.type(), left_value_obj)
+            left_value_obj = self.coerce_value(right_value_obj.type(), left_value_obj)
 
-        if arith_ast.elem_type not in self.op_to_lambda[left_value_obj.type()]:
+        if op not in self.op_to_lambda[left_value_obj.type()]:
             super().error(
                 ErrorType.TYPE_ERROR,
-                f"Incompatible operator {arith_ast.elem_type} for type {left_value_obj.type()}",
+                f"Incompatible operator {op} for type {left_value_obj.type()}",
             )
-        f = self.op_to_lambda[left_value_obj.type()][arith_ast.elem_type]
+        f = self.op_to_lambda[left_value_obj.type()][op]
         return f(left_value_obj, right_value_obj)
 
     def __compatible_types(self, oper, obj1, obj2):
@@ -391,48 +507,52 @@ class Interpreter(InterpreterBase):
 
     def __eval_unary(self, arith_ast, t, f):
         value_obj = self.__eval_expr(arith_ast.get("op1"))
+        return self.apply_unary_op(arith_ast.elem_type, t, f, value_obj)
+
+    def apply_unary_op(self, op, t, f, value_obj):
         if value_obj.type() != t:
-            value_obj = self.__coerce_value(t, value_obj)
+            value_obj = self.coerce_value(t, value_obj)
             if value_obj.type() != t:
                 super().error(
                     ErrorType.TYPE_ERROR,
-                    f"Incompatible type for {arith_ast.elem_type} operation",
+                    f"Incompatible type for {op} operation",
                 )
-        return Value(t, f(value_obj.value()))
+        result = f(value_obj.value())
+        return int_value(result) if t == Type.INT else bool_value(result)
 
     def __setup_ops(self):
         self.op_to_lambda = {}
         # set up operations on integers
         self.op_to_lambda[Type.INT] = {}
-        self.op_to_lambda[Type.INT]["+"] = lambda x, y: Value(
-            x.type(), x.value() + y.value()
+        self.op_to_lambda[Type.INT]["+"] = lambda x, y: int_value(
+            x.value() + y.value()
         )
-        self.op_to_lambda[Type.INT]["-"] = lambda x, y: Value(
-            x.type(), x.value() - y.value()
+        self.op_to_lambda[Type.INT]["-"] = lambda x, y: int_value(
+            x.value() - y.value()
         )
-        self.op_to_lambda[Type.INT]["*"] = lambda x, y: Value(
-            x.type(), x.value() * y.value()
+        self.op_to_lambda[Type.INT]["*"] = lambda x, y: int_value(
+            x.value() * y.value()
         )
-        self.op_to_lambda[Type.INT]["/"] = lambda x, y: Value(
-            x.type(), x.value() // y.value()
+        self.op_to_lambda[Type.INT]["/"] = lambda x, y: int_value(
+            x.value() // y.value()
         )
-        self.op_to_lambda[Type.INT]["=="] = lambda x, y: Value(
-            Type.BOOL, x.type() == y.type() and x.value() == y.value()
+        self.op_to_lambda[Type.INT]["=="] = lambda x, y: bool_value(
+            x.type() == y.type() and x.value() == y.value()
         )
-        self.op_to_lambda[Type.INT]["!="] = lambda x, y: Value(
-            Type.BOOL, x.type() != y.type() or x.value() != y.value()
+        self.op_to_lambda[Type.INT]["!="] = lambda x, y: bool_value(
+            x.type() != y.type() or x.value() != y.value()
         )
-        self.op_to_lambda[Type.INT]["<"] = lambda x, y: Value(
-            Type.BOOL, x.value() < y.value()
+        self.op_to_lambda[Type.INT]["<"] = lambda x, y: bool_value(
+            x.value() < y.value()
         )
-        self.op_to_lambda[Type.INT]["<="] = lambda x, y: Value(
-            Type.BOOL, x.value() <= y.value()
+        self.op_to_lambda[Type.INT]["<="] = lambda x, y: bool_value(
+            x.value() <= y.value()
         )
-        self.op_to_lambda[Type.INT][">"] = lambda x, y: Value(
-            Type.BOOL, x.value() > y.value()
+        self.op_to_lambda[Type.INT][">"] = lambda x, y: bool_value(
+            x.value() > y.value()
         )
-        self.op_to_lambda[Type.INT][">="] = lambda x, y: Value(
-            Type.BOOL, x.value() >= y.value()
+        self.op_to_lambda[Type.INT][">="] = lambda x, y: bool_value(
+            x.value() >= y.value()
         )
         self.op_to_lambda[Type.INT]['&&'] = lambda x, y: Value(
             Type.BOOL, x.value() and y.value()
@@ -446,11 +566,11 @@ class Interpreter(InterpreterBase):
         self.op_to_lambda[Type.STRING]["+"] = lambda x, y: Value(
             x.type(), x.value() + y.value()
         )
-        self.op_to_lambda[Type.STRING]["=="] = lambda x, y: Value(
-            Type.BOOL, x.value() == y.value()
+        self.op_to_lambda[Type.STRING]["=="] = lambda x, y: bool_value(
+            x.value() == y.value()
         )
-        self.op_to_lambda[Type.STRING]["!="] = lambda x, y: Value(
-            Type.BOOL, x.value() != y.value()
+        self.op_to_lambda[Type.STRING]["!="] = lambda x, y: bool_value(
+            x.value() != y.value()
         )
         #  set up operations on bools
         self.op_to_lambda[Type.BOOL] = {}
@@ -460,38 +580,39 @@ class Interpreter(InterpreterBase):
         self.op_to_lambda[Type.BOOL]["||"] = lambda x, y: Value(
             x.type(), x.value() or y.value()
         )
-        self.op_to_lambda[Type.BOOL]["=="] = lambda x, y: Value(
-            Type.BOOL, x.type() == y.type() and x.value() == y.value()
+        self.op_to_lambda[Type.BOOL]["=="] = lambda x, y: bool_value(
+            x.type() == y.type() and x.value() == y.value()
         )
-        self.op_to_lambda[Type.BOOL]["!="] = lambda x, y: Value(
-            Type.BOOL, x.type() != y.type() or x.value() != y.value()
+        self.op_to_lambda[Type.BOOL]["!="] = lambda x, y: bool_value(
+            x.type() != y.type() or x.value() != y.value()
         )
 
         #  set up operations on nil
         self.op_to_lambda[Type.NIL] = {}
-        self.op_to_lambda[Type.NIL]["=="] = lambda x, y: Value(
-            Type.BOOL, x.type() == y.type() and x.value() == y.value()
+        self.op_to_lambda[Type.NIL]["=="] = lambda x, y: bool_value(
+            x.type() == y.type() and x.value() == y.value()
         )
-        self.op_to_lambda[Type.NIL]["!="] = lambda x, y: Value(
-            Type.BOOL, x.type() != y.type() or x.value() != y.value()
+        self.op_to_lambda[Type.NIL]["!="] = lambda x, y: bool_value(
+            x.type() != y.type() or x.value() != y.value()
         )
     
     def __setup_struct_ops(self):
-        # set up operations on structs
+        # set up operations on structs: references are equal when they refer to
+        # the same instance or are both nil (see heap.py)
         for struct_name in self.structs.keys():
             self.op_to_lambda[struct_name] = {}
-            self.op_to_lambda[struct_name]['=='] = lambda x, y: Value(
-                Type.BOOL, x.value() == y.value()
+            self.op_to_lambda[struct_name]['=='] = lambda x, y: bool_value(
+                x.value() is y.value()
             )
-            self.op_to_lambda[struct_name]['!='] = lambda x, y: Value(
-                Type.BOOL, x.value() != y.value()
+            self.op_to_lambda[struct_name]['!='] = lambda x, y: bool_value(
+                x.value() is not y.value()
             )
 
     def __do_if(self, if_ast):
         cond_ast = if_ast.get("condition")
         result = self.__eval_expr(cond_ast)
         if result.type() != Type.BOOL:
-            result = self.__coerce_value(Type.BOOL, result)
+            result = self.coerce_value(Type.BOOL, result)
             # this should already have thrown an error if it couldn't coerce
         if result.value():
             statements = if_ast.get("statements")
@@ -515,12 +636,12 @@ class Interpreter(InterpreterBase):
         while run_for.value():
             run_for = self.__eval_expr(cond_ast)  # check for-loop condition
             if run_for.type() != Type.BOOL:
-                run_for = self.__coerce_value(Type.BOOL, run_for)
+                run_for = self.coerce_value(Type.BOOL, run_for)
                 # this should throw an error if it can't coerce
             if run_for.value():
                 statements = for_ast.get("statements")
                 status, return_val = self.__run_statements(statements)
-                if status == ExecStatus.RETURN:
+                if status != ExecStatus.CONTINUE:
                     return status, return_val
                 self.__run_statement(update_ast)  # update counter variable
 
@@ -530,12 +651,21 @@ class Interpreter(InterpreterBase):
         expr_ast = return_ast.get("expression")
         if expr_ast is None:
             return (ExecStatus.RETURN, Interpreter.NIL_VALUE)
-        value_obj = self.__eval_expr(expr_ast)
-        if value_obj.type() not in self.structs:
-            if value_obj.type() not in self.PRIMITIVES:
-                super().error(
-                    ErrorType.TYPE_ERROR,
-                    f"Invalid Type returned {value_obj.type()}"
-                )
-            value_obj = copy.copy(self.__eval_expr(expr_ast))
-        return (ExecStatus.RETURN, value_obj)
\ No newline at end of file
+        callee_ast = self.tail_callee(expr_ast)
+        if callee_ast is not None:
+            return (ExecStatus.TAIL_CALL, (callee_ast, self.__eval_args(callee_ast, expr_ast.get("args"))))
+        return (ExecStatus.RETURN, self.return_value(self.__eval_expr(expr_ast)))
+
+    # the value a return statement hands back for value_obj. Primitives and
+    # structs go back as they are (Values are never changed, structs are passed
+    # by reference), except that an explicit nil gets a Value of its own, so
+    # finish_call can tell it from a function that returned nothing.
+    def return_value(self, value_obj):
+        if value_obj.type() not in self.structs and value_obj.type() not in self.PRIMITIVES:
+            super().error(
+                ErrorType.TYPE_ERROR,
+                f"Invalid Type returned {value_obj.type()}"
+            )
+        if value_obj is Interpreter.NIL_VALUE:
+            return Value(Type.NIL, None)
+        return value_obj
\ No newline at end of file
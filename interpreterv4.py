@@ -1,19 +1,39 @@
 # document that we won't have a return inside the init/update of a for loop
 
-import copy
 from enum import Enum
 
 from brewparse import parse_program
 from env_v4 import EnvironmentManager
 from intbase import InterpreterBase, ErrorType
-from type_valuev4 import Type, Value, create_value, get_printable
-from lazy_val import LazyExpr
+from type_valuev4 import Type, Value, TRUE_VALUE, FALSE_VALUE, bool_value, int_value, create_value, get_printable
+from lazy_val import BLACKHOLE, LazyExpr, free_vars
 from element import Element
+from opcache import OpCaches, specialized_ops
+from optimizer import PassManager
+from strictness import StrictnessAnalysis
 
 class ExecStatus(Enum):
     CONTINUE = 1
     RETURN = 2
-    EXCEPTION = 3
+
+
+# A Brewin exception, from a raise statement or a division by zero. It's a
+# Python exception, so the statements, calls and lazy expressions it leaves
+# don't check for it: each one that has something to undo (a block or a call
+# leaving its scope, lazy expressions keeping the exception as their value)
+# catches it, does that and raises it again, and a try statement with a
+# catcher for it stops it.
+class BrewinException(Exception):
+    def __init__(self, value):
+        super().__init__(value)
+        self.value = value  # the exception's string Value, or nil
+
+
+# unary operator -> (operand type, function of the operand's Python value)
+UNARY_OPS = {
+    InterpreterBase.NEG_NODE: (Type.INT, lambda x: -1 * x),
+    InterpreterBase.NOT_NODE: (Type.BOOL, lambda x: not x),
+}
 
 
 # Main interpreter class
@@ -22,22 +42,48 @@ class Interpreter(InterpreterBase):
     NIL_VALUE = create_value(InterpreterBase.NIL_DEF)
     TRUE_VALUE = create_value(InterpreterBase.TRUE_DEF)
     BIN_OPS = {"+", "-", "*", "/", "==", "!=", ">", ">=", "<", "<=", "||", "&&"}
+    LITERAL_NODES = {InterpreterBase.STRING_NODE, InterpreterBase.INT_NODE, InterpreterBase.BOOL_NODE, InterpreterBase.NIL_NODE}
 
     # methods
-    def __init__(self, console_output=True, inp=None, trace_output=False):
+    # engine picks how the program is executed: "tree" walks the AST, "stack"
+    # runs it on an explicit stack (see stackv4.py) so deep recursion doesn't
+    # run out of Python stack. opt_level is the optimizer level, 0 to 2 (see
+    # optimizer.py).
+    def __init__(self, console_output=True, inp=None, trace_output=False, engine="tree", opt_level=0):
         super().__init__(console_output, inp)
         self.trace_output = trace_output
+        self.engine = engine
+        self.opt_level = opt_level
         self.__setup_ops()
+        self.specialized_ops = specialized_ops(Value, int_value, bool_value)
 
     # run a program that's provided in a string
     # usese the provided Parser found in brewparse.py to parse the program
     # into an abstract syntax tree (ast)
     def run(self, program):
         ast = parse_program(program)
+        self.optimizer = PassManager(self.opt_level, version=4)
+        self.optimizer.optimize(ast)
         self.__set_up_function_table(ast)
         self.env = EnvironmentManager()
-        exception_status, exception_value = self.__call_func_aux("main", [])
-        if (exception_status == ExecStatus.EXCEPTION):
+        self.block_has_vars = {}
+        self.op_caches = OpCaches(self.specialize_op, self.apply_binary_op)
+        self.strictness = StrictnessAnalysis(self.func_name_to_ast).analyze_program()
+        self.thunks_avoided = 0  # eager sites that got a value instead of a lazy expression
+        self.thunk_templates = {}  # expression -> the names of the variables it reads
+        self.catch_tables = {}  # try node -> exception name -> statements of its catcher
+        exception_value = None
+        try:
+            if self.engine == "stack":
+                # imported here, stackv4 needs ExecStatus from this module
+                from stackv4 import StackMachine
+
+                StackMachine(self).run_main()
+            else:
+                self.__call_func_aux("main", [])
+        except BrewinException as exception:
+            exception_value = exception.value
+        if exception_value is not None:
             super().error(
                 ErrorType.FAULT_ERROR,
                 f"Exception {exception_value.value()} thrown but not handled",
@@ -52,7 +98,7 @@ class Interpreter(InterpreterBase):
                 self.func_name_to_ast[func_name] = {}
             self.func_name_to_ast[func_name][num_params] = func_def
 
-    def __get_func_by_name(self, name, num_params):
+    def get_func_by_name(self, name, num_params):
         if name not in self.func_name_to_ast:
             super().error(ErrorType.NAME_ERROR, f"Function {name} not found")
         candidate_funcs = self.func_name_to_ast[name]
@@ -63,19 +109,36 @@ class Interpreter(InterpreterBase):
             )
         return candidate_funcs[num_params]
 
+    # a block that defines no variables of its own looks exactly like the
+    # enclosing one, so it doesn't get a scope
+    def has_var_defs(self, statements):
+        has_vars = self.block_has_vars.get(id(statements))
+        if has_vars is None:
+            has_vars = any(statement.elem_type == InterpreterBase.VAR_DEF_NODE for statement in statements)
+            self.block_has_vars[id(statements)] = has_vars
+        return has_vars
+
     def __run_statements(self, statements):
-        self.env.push_block()
-        for statement in statements:
-            if self.trace_output:
-                print(statement)
-            status, return_val = self.__run_statement(statement)
-            # if the status is either RETURN or EXCEPTION, then we return that
-            if status == ExecStatus.RETURN or status == ExecStatus.EXCEPTION:
-                print("RETURNED OR EXCEPTION")
+        has_vars = self.has_var_defs(statements)
+        if has_vars:
+            self.env.push_block()
+        try:
+            for statement in statements:
+                if self.trace_output:
+                    print(statement)
+                status, return_val = self.__run_statement(statement)
+                # if the status is RETURN, then we return that
+                if status == ExecStatus.RETURN:
+                    if has_vars:
+                        self.env.pop_block()
+                    return (status, return_val)
+        except BrewinException:
+            if has_vars:
                 self.env.pop_block()
-                return (status, return_val)
+            raise
 
-        self.env.pop_block()
+        if has_vars:
+            self.env.pop_block()
         return (ExecStatus.CONTINUE, Interpreter.NIL_VALUE)
 
     def __run_statement(self, statement):
@@ -85,13 +148,13 @@ class Interpreter(InterpreterBase):
         # print statements are eagerly evaluated
 
         if statement.elem_type == InterpreterBase.FCALL_NODE:
-            status, return_val = self.__call_func(statement)
+            return_val = self.__call_func(statement)
         elif statement.elem_type == "=":
-            status, return_val = self.__assign(statement)
+            status, return_val = self.assign(statement)
         elif statement.elem_type == InterpreterBase.VAR_DEF_NODE:
-            self.__var_def(statement)
+            self.var_def(statement)
         elif statement.elem_type == InterpreterBase.RETURN_NODE:
-            status, return_val = self.__do_return(statement)
+            status, return_val = self.do_return(statement)
 
         # these are eagerly evaluated
         elif statement.elem_type == Interpreter.IF_NODE:
@@ -108,28 +171,27 @@ class Interpreter(InterpreterBase):
     
     def __try_block(self, try_node):
         # going through a try block
-        status, return_val = self.__run_statements(try_node.get("statements"))
-        # if the status is exception, look through current list of catchers
-        if status == ExecStatus.EXCEPTION:
-            for catcher in try_node.get("catchers"):
-                # if the string value of the exception is the same as one of the catchers, do it
-                if return_val.value() == catcher.get("exception_type"):
-                    status, return_val = self.__run_statements(catcher.get("statements"))
-                    return (status,return_val)
-            # if all the catchers have been gone through, but it still hasn't been found, just propagate the exception upward by returning
-            return (status, return_val)
-        # if the status is not an exception, just return that status instead, it is either a continue or a return
-        else:
-            return (status, return_val)
+        try:
+            return self.__run_statements(try_node.get("statements"))
+        except BrewinException as exception:
+            # if the string value of the exception is the same as one of the catchers, do it
+            statements = self.catch_table(try_node).get(exception.value.value())
+            # if none of the catchers is for it, just propagate the exception upward
+            if statements is None:
+                raise
+        return self.__run_statements(statements)
     
 # EAGER EVALUATION HERE
     def __do_raise(self, raise_ast):
         expr_ast = raise_ast.get("exception_type")
         # if the exception raised has no string in it, then we return an exception type with a nil value
         if expr_ast is None:
-            return (ExecStatus.EXCEPTION, Interpreter.NIL_VALUE)
-        # otherwise we evaluate the expression
-        _, value_obj = copy.copy(self.__eval_expr(expr_ast))
+            raise BrewinException(Interpreter.NIL_VALUE)
+        # otherwise we evaluate the expression, an exception doing that is raised in its place
+        try:
+            value_obj = self.__eval_expr(expr_ast)
+        except BrewinException as exception:
+            value_obj = exception.value
         # make sure that it's a string for the evaluation
         if value_obj.type() != Type.STRING:
             super().error(
@@ -137,20 +199,22 @@ class Interpreter(InterpreterBase):
                 "incompatible type for raise statement",
             )
 
-        # return that we've hit an exception
-        return (ExecStatus.EXCEPTION, value_obj)
+        # raise it
+        raise BrewinException(value_obj)
     
-    def __call_func(self, call_node):
+    # bindings are those of the lazy expression the call is part of, if any
+    # (see make_lazy_expr)
+    def __call_func(self, call_node, bindings=None):
         func_name = call_node.get("name")
         actual_args = call_node.get("args")
-        return self.__call_func_aux(func_name, actual_args)
+        return self.__call_func_aux(func_name, actual_args, bindings)
 
-    def __call_func_aux(self, func_name, actual_args):
+    def __call_func_aux(self, func_name, actual_args, bindings=None):
         if func_name == "print":
-            return self.__call_print(actual_args)
+            return self.__call_print(actual_args, bindings)
         if func_name == "inputi" or func_name == "inputs":
-            return self.__call_input(func_name, actual_args)
-        func_ast = self.__get_func_by_name(func_name, len(actual_args))
+            return self.__call_input(func_name, actual_args, bindings)
+        func_ast = self.get_func_by_name(func_name, len(actual_args))
         formal_args = func_ast.get("args")
         if len(actual_args) != len(formal_args):
             super().error(
@@ -161,10 +225,7 @@ class Interpreter(InterpreterBase):
         # first evaluate all of the actual parameters and associate them with the formal parameter names
         args = {}
         for formal_ast, actual_ast in zip(formal_args, actual_args):
-            # exception_status, 
-            result = copy.copy(self.__make_lazy_expr(actual_ast))
-            # if (exception_status == ExecStatus.EXCEPTION):
-            #     return (exception_status, result)
+            result = self.strict_value(formal_ast, actual_ast, bindings) or self.make_lazy_expr(actual_ast, bindings)
             arg_name = formal_ast.get("name")
             args[arg_name] = result
 
@@ -175,66 +236,75 @@ class Interpreter(InterpreterBase):
           self.env.create(arg_name, value)
 
         # the return value of the function
-        # now can either continue to return an exception or actually return a value
-        exception_status, return_val = self.__run_statements(func_ast.get("statements"))
-        print(exception_status, "EXCEPTION")
-        # if an exception wasn't handled inside the thing and it propagated upwards, we return the exception to be handled
+        try:
+            status, return_val = self.__run_statements(func_ast.get("statements"))
+        except BrewinException:
+            # an exception that wasn't handled inside the function propagates upwards
+            self.env.pop_func()
+            raise
         self.env.pop_func()
-        if (exception_status == ExecStatus.RETURN):
-            exception_status = ExecStatus.CONTINUE
-        return (exception_status, return_val)
+        return return_val
 
 
 # EAGER EVALUATION HERE
-    def __call_print(self, args):
+    def __call_print(self, args, bindings=None):
         output = ""
         for arg in args:
-            exception_status, result = self.__eval_lazy_expr(self.__make_lazy_expr(arg))  # result is a Value object
-            if (exception_status == ExecStatus.EXCEPTION):
-                return (ExecStatus.EXCEPTION, result)
+            result = self.forced_value(arg, bindings)
+            if result is None:
+                result = self.__eval_lazy_expr(self.make_lazy_expr(arg, bindings))  # result is a Value object
             output = output + get_printable(result)
         super().output(output)
-        return (ExecStatus.CONTINUE, Interpreter.NIL_VALUE)
+        return Interpreter.NIL_VALUE
 
-    def __call_input(self, name, args):
+    def __call_input(self, name, args, bindings=None):
         if args is not None and len(args) == 1:
-            exception_status, result = self.__eval_lazy_expr(self.__make_lazy_expr(args[0]))
-            if (exception_status == ExecStatus.EXCEPTION):
-                return (ExecStatus.EXCEPTION, result)
+            result = self.__eval_lazy_expr(self.make_lazy_expr(args[0], bindings))
             super().output(get_printable(result))
         elif args is not None and len(args) > 1:
             super().error(
                 ErrorType.NAME_ERROR, "No inputi() function that takes > 1 parameter"
             )
+        return self.read_input(name)
+
+    def read_input(self, name):
         inp = super().get_input()
         if name == "inputi":
-            return (ExecStatus.CONTINUE, Value(Type.INT, int(inp)))
+            return int_value(int(inp))
         if name == "inputs":
-            return (ExecStatus.CONTINUE, Value(Type.STRING, inp))
+            return Value(Type.STRING, inp)
 
-    def __assign(self, assign_ast):
+    def assign(self, assign_ast):
         var_name = assign_ast.get("name")
-        # exception_status, 
-        value_obj = self.__make_lazy_expr(assign_ast.get("expression"))
-        # if (exception_status == ExecStatus.EXCEPTION):
-        #     return (ExecStatus.EXCEPTION, value_obj)
+        value_obj = self.strict_value(assign_ast, assign_ast.get("expression")) or self.make_lazy_expr(
+            assign_ast.get("expression")
+        )
         if not self.env.set(var_name, value_obj):
             super().error(
                 ErrorType.NAME_ERROR, f"Undefined variable {var_name} in assignment"
             )
-        return (ExecStatus.CONTINUE, Value(Type.BOOL, True))
+        return (ExecStatus.CONTINUE, TRUE_VALUE)
     
-    def __var_def(self, var_ast):
+    def var_def(self, var_ast):
         var_name = var_ast.get("name")
 
         # probably an issue here, since it's not associating it with a lazy value, so we're gonna change it for now
         # if not self.env.create(var_name, Interpreter.NIL_VALUE):
-        if not self.env.create(var_name, self.__make_lazy_expr(var_ast)):
+        if not self.env.create(var_name, self.make_lazy_expr(var_ast)):
             super().error(
                 ErrorType.NAME_ERROR, f"Duplicate definition for variable {var_name}"
             )
 
-    def __make_lazy_expr(self, expression):
+    # A lazy expression for expression, an expression of the program, a lazy
+    # expression or a Value. For an expression of the program each site is
+    # compiled once into its template, the names of the variables it reads
+    # (see lazy_val.free_vars), and the lazy expression only keeps the parsed
+    # expression and the lazy expressions those variables refer to now, so
+    # making one takes as long as the expression has variables rather than as
+    # long as the expression is. bindings is given for a part of an expression
+    # that's already lazy: its variables are looked up there instead, and its
+    # lazy expression is made once and kept there.
+    def make_lazy_expr(self, expression, bindings=None):
         # if it's already a lazy expression, just return it
         if isinstance(expression, LazyExpr):
             return expression
@@ -243,54 +313,51 @@ class Interpreter(InterpreterBase):
             assert(isinstance(expression, Value))
             return LazyExpr(value=expression)
         
-        # for the rest of these instances, it must be an element object, so we make a new node
+        # for the rest of these instances, it must be an element object
 
         # first is the Value Node
-        if (expression.elem_type in {Interpreter.STRING_NODE, Interpreter.INT_NODE, Interpreter.BOOL_NODE, Interpreter.NIL_NODE}):
+        if (expression.elem_type in Interpreter.LITERAL_NODES):
             if (expression.elem_type is Interpreter.BOOL_NODE):
-                return LazyExpr(value=Value(Type.BOOL, expression.get("val")))
+                return LazyExpr(value=bool_value(expression.get("val")))
             elif (expression.elem_type is Interpreter.NIL_NODE):
                 return LazyExpr(value=self.NIL_VALUE)
             elif (expression.elem_type is Interpreter.STRING_NODE):
                 return LazyExpr(value=Value(Type.STRING, expression.get("val")))
             elif (expression.elem_type is Interpreter.INT_NODE):
-                return LazyExpr(value=Value(Type.INT, expression.get("val")))
+                return LazyExpr(value=int_value(expression.get("val")))
             else:
                 super().error(
                     ErrorType.TYPE_ERROR,
                     f"How tf did you get in here"
                 )
-        # has to be equal to a variable (stored as lazy expression), function (stored as lazy expression), or Expression with binops
-        
-        #making the dict
-        new_node_dict = {}
-        if (expression.get("op1") is not None):
-            new_node_dict["op1"] = self.__make_lazy_expr(expression.get("op1"))
-        if (expression.get("op2") is not None):
-            new_node_dict["op2"] = self.__make_lazy_expr(expression.get("op2"))
 
         # all vars should be associated with a lazy expression, or not exist
         if (expression.elem_type is Interpreter.VAR_NODE):
             name = expression.get("name")
+            if bindings is not None:
+                return bindings[name]
             # if the var exists
-            if (self.env.get(name) is not None):
-                return self.env.get(name)
+            lazy_expr = self.env.get(name)
+            if lazy_expr is not None:
+                return lazy_expr
             # if it doesn't exist, mark it so we can error out later
             return LazyExpr(unknown_var=name)
-        
-        # doesn't actually call the function
-        if (expression.elem_type is Interpreter.FCALL_NODE):
-            # set the function name
-            new_node_dict["name"] = expression.get("name")
-            # set the args that it was called with
-            # make each arg its own lazy expression
-            new_func_args = []
-            for arg in expression.get("args"):
-                new_func_args.append(self.__make_lazy_expr(arg))
-            new_node_dict["args"] = new_func_args
-
-        # we have the parts of the element now, so we have it's ast, store it under a new lazy node and make it the ast
-        return LazyExpr(expr_ast=Element(expression.elem_type, **new_node_dict))
+
+        if bindings is not None:
+            lazy_expr = bindings.get(expression)
+            if lazy_expr is None:
+                lazy_expr = bindings[expression] = LazyExpr(expr_ast=expression, bindings=bindings)
+            return lazy_expr
+
+        # has to be a function call (which isn't made yet) or an expression with operators
+        names = self.thunk_templates.get(expression)
+        if names is None:
+            names = self.thunk_templates[expression] = free_vars(expression)
+        bindings = {}
+        for name in names:
+            lazy_expr = self.env.get(name)
+            bindings[name] = lazy_expr if lazy_expr is not None else LazyExpr(unknown_var=name)
+        return LazyExpr(expr_ast=expression, bindings=bindings)
 
     def __eval_lazy_expr(self, expression: LazyExpr):
         # 3 different cases, either has unknown var so crash, has a value, so just return the value, or has an expression tree that needs to be evaluated
@@ -299,33 +366,99 @@ class Interpreter(InterpreterBase):
             super().error(
                 ErrorType.NAME_ERROR, f"undefined variable {expression.unknown_var}"
             )
-        # already been evaluated, returning a VALUE TYPE, probably add something about the execution status being CONTINUE
+        # already been evaluated, returning a VALUE TYPE
         if expression.value() is not None:
-            return ExecStatus.CONTINUE, expression.value()
+            return expression.value()
         
         # third case, handle the expression tree, also returning a VALUE type
+        if expression.expr_ast() is BLACKHOLE:
+            super().error(
+                ErrorType.FAULT_ERROR,
+                f"Lazy expression depends on its own value"
+            )
         if expression.expr_ast() is not None:
-            exception_status, result = self.__eval_expr(expression.expr_ast())
-            expression.v = result
-            expression.ea = None
-            return exception_status, result
+            return self.__force(expression)
         
         super().error(
             ErrorType.FAULT_ERROR,
             f"There were no fields found in the lazy expression"
         )
 
-        
-    def __eval_expr(self, expr_ast):
+    # Forces a lazy expression whose value isn't known yet. `s = s + i;` in a
+    # loop builds a chain of lazy expressions as long as the loop, each one's
+    # op1 the one before, so the operators and their operands are forced with
+    # a work stack here instead of recursing through __eval_expr for every
+    # link. Each entry is a lazy expression being forced, the expression it
+    # had, and the values of its operands so far; while it's on the stack its
+    # expr_ast is BLACKHOLE. Once done it keeps its value in v and loses its
+    # expression and bindings, like before, and an exception is kept as the
+    # value of it and of every entry below it before it's passed on. Anything
+    # but an operator (calls, literals) is still evaluated by __eval_expr.
+    def __force(self, expression):
+        bin_ops = Interpreter.BIN_OPS
+        apply_op = self.op_caches.apply
+        work = []  # the entries waiting for the one being forced
+        thunk, expr_ast, operands = expression, expression.ea, []
+        expression.ea = BLACKHOLE
+        try:
+            while True:
+                kind = expr_ast.elem_type
+                if kind in bin_ops:
+                    if not operands:
+                        operand = expr_ast.get("op1")
+                    elif len(operands) == 1:
+                        result = self.short_circuit(kind, operands[0])
+                        operand = expr_ast.get("op2") if result is None else None
+                    else:
+                        operand = None
+                        result = apply_op(expr_ast.site, operands[0], operands[1])
+                elif kind in UNARY_OPS:
+                    if not operands:
+                        operand = expr_ast.get("op1")
+                    else:
+                        operand = None
+                        t, f = UNARY_OPS[kind]
+                        result = self.apply_unary_op(kind, t, f, operands[0])
+                else:
+                    operand = None
+                    result = self.__eval_expr(expr_ast, thunk.b)
+                if operand is not None:
+                    operand = self.make_lazy_expr(operand, thunk.b)
+                    if operand.v is not None:
+                        operands.append(operand.v)
+                        continue
+                    if operand.uv is not None or operand.ea is None or operand.ea is BLACKHOLE:
+                        # reports the error
+                        self.__eval_lazy_expr(operand)
+                    work.append((thunk, expr_ast, operands))
+                    thunk, expr_ast, operands = operand, operand.ea, []
+                    operand.ea = BLACKHOLE
+                    continue
+                thunk.v = result
+                thunk.ea = None
+                thunk.b = None
+                if not work:
+                    return result
+                thunk, expr_ast, operands = work.pop()
+                operands.append(result)
+        except BrewinException as exception:
+            work.append((thunk, expr_ast, operands))
+            for thunk, _, _ in work:
+                thunk.v = exception.value
+                thunk.ea = None
+                thunk.b = None
+            raise
+
+    def __eval_expr(self, expr_ast, bindings=None):
         # these should be left untouched, it returns the final value if evaluated without errors
         if expr_ast.elem_type == InterpreterBase.NIL_NODE:
-            return ExecStatus.CONTINUE, Interpreter.NIL_VALUE
+            return Interpreter.NIL_VALUE
         if expr_ast.elem_type == InterpreterBase.INT_NODE:
-            return ExecStatus.CONTINUE, Value(Type.INT, expr_ast.get("val"))
+            return int_value(expr_ast.get("val"))
         if expr_ast.elem_type == InterpreterBase.STRING_NODE:
-            return ExecStatus.CONTINUE, Value(Type.STRING, expr_ast.get("val"))
+            return Value(Type.STRING, expr_ast.get("val"))
         if expr_ast.elem_type == InterpreterBase.BOOL_NODE:
-            return ExecStatus.CONTINUE, Value(Type.BOOL, expr_ast.get("val"))
+            return bool_value(expr_ast.get("val"))
         
         # honestly not too sure if this is needed anymore
         if expr_ast.elem_type == InterpreterBase.VAR_NODE:
@@ -336,91 +469,220 @@ class Interpreter(InterpreterBase):
             # all variable should be stored as lazy values
             assert(isinstance(val, LazyExpr))
 
-            exception_status, return_val = self.__eval_lazy_expr(self.__make_lazy_expr(val))
-            # if val.value() is not None:
-            #     return ExecStatus.CONTINUE, val.value()
-            # if val.unknown_var() is not None:
-            #     super().error(
-            #         ErrorType.NAME_ERROR,
-            #         f"variable {val.unknown_var()} is undefined"
-            #     )
-            # if val.expr_ast() is not None:
-            #     value = 
-            return ExecStatus.CONTINUE, return_val
+            # an exception while forcing a variable is passed on as a plain value
+            try:
+                return self.__eval_lazy_expr(self.make_lazy_expr(val))
+            except BrewinException as exception:
+                return exception.value
         
 
         if expr_ast.elem_type == InterpreterBase.FCALL_NODE:
-            exception_status, return_val = self.__call_func(expr_ast)
-            # return val is LazyExpression
-            other_exception_status, new_return_val = self.__eval_lazy_expr(self.__make_lazy_expr(return_val))
-            if (other_exception_status == ExecStatus.EXCEPTION):
-                return other_exception_status, new_return_val
-            return exception_status, new_return_val
+            # a function that returns a call returns it unevaluated, so forcing
+            # the result makes a tail call. Those are made here, one after the
+            # other, instead of recursing, and the lazy expressions they came
+            # from all get the value of the last one (or its exception)
+            tail_calls = []
+            try:
+                while True:
+                    # return val is LazyExpression
+                    return_val = self.make_lazy_expr(self.__call_func(expr_ast, bindings))
+                    if self.tail_call(return_val) is None:
+                        break
+                    tail_calls.append(return_val)
+                    expr_ast = return_val.expr_ast()
+                    bindings = return_val.bindings()
+                new_return_val = self.__eval_lazy_expr(return_val)
+            except BrewinException as exception:
+                self.finish_tail_calls(tail_calls, exception.value)
+                raise
+            self.finish_tail_calls(tail_calls, new_return_val)
+            return new_return_val
         
 
         if expr_ast.elem_type in Interpreter.BIN_OPS:
-            return self.__eval_op(expr_ast)
+            return self.__eval_op(expr_ast, bindings)
         
 
-        if expr_ast.elem_type == Interpreter.NEG_NODE:
-            return self.__eval_unary(expr_ast, Type.INT, lambda x: -1 * x)
-        if expr_ast.elem_type == Interpreter.NOT_NODE:
-            return self.__eval_unary(expr_ast, Type.BOOL, lambda x: not x)
-
-    def __eval_op(self, arith_ast):
-        left_exception_status, left_value_obj = self.__eval_lazy_expr(self.__make_lazy_expr(arith_ast.get("op1")))
-        # check the exception statsus
-        if (left_exception_status == ExecStatus.EXCEPTION):
-            return (ExecStatus.EXCEPTION, left_value_obj)
+        if expr_ast.elem_type in UNARY_OPS:
+            t, f = UNARY_OPS[expr_ast.elem_type]
+            return self.__eval_unary(expr_ast, t, f, bindings)
 
+    def __eval_op(self, arith_ast, bindings=None):
+        value_obj = self.forced_value(arith_ast, bindings)
+        if value_obj is not None:
+            return value_obj
+        left_value_obj = self.__eval_lazy_expr(self.make_lazy_expr(arith_ast.get("op1"), bindings))
 
-        # Short Circuiting
-
-        # checking the expression type
+        short_circuit_value = self.short_circuit(arith_ast.elem_type, left_value_obj)
+        if short_circuit_value is not None:
+            return short_circuit_value
 
+        # if none of the short circuits worked, evaluate the right value object
+        right_value_obj = self.__eval_lazy_expr(self.make_lazy_expr(arith_ast.get("op2"), bindings))
+
+        return self.op_caches.apply(arith_ast.site, left_value_obj, right_value_obj)
+
+    # The helpers below hold the runtime semantics that don't depend on how the
+    # program is executed, so the explicit-stack engine (see stackv4.py) shares
+    # them with the tree walker.
+
+    # the value for expr_ast at site, already computed, if site is an eager
+    # site (see strictness.py) and computing it right away can't be told apart
+    # from doing it later, otherwise None
+    def strict_value(self, site, expr_ast, bindings=None):
+        if site not in self.strictness.eager:
+            return None
+        value_obj = self.forced_value(expr_ast, bindings)
+        if value_obj is None:
+            return None
+        self.thunks_avoided += 1
+        return LazyExpr(value=value_obj)
+
+    # the value of an expression that's needed right away, if it can be computed
+    # without making a lazy expression for it (see eager_value), otherwise
+    # None. Literals and variables don't get one anyway, so they're left alone.
+    # bindings are those of the lazy expression expr_ast is part of, if any (a
+    # call made by forcing a lazy expression).
+    def forced_value(self, expr_ast, bindings=None):
+        if expr_ast.elem_type in Interpreter.LITERAL_NODES or expr_ast.elem_type == InterpreterBase.VAR_NODE:
+            return None
+        return self.eager_value(expr_ast, bindings)
+
+    # the value of expr_ast if it needs no function calls, the variables (or
+    # lazy expressions) in it have already been forced and it neither fails nor
+    # raises, otherwise None. The parts of an expression that's already lazy
+    # aren't looked into, so this never goes further than the expression itself.
+    def eager_value(self, expr_ast, bindings=None):
+        kind = expr_ast.elem_type
+        if kind == InterpreterBase.VAR_NODE:
+            lazy_expr = self.env.get(expr_ast.get("name")) if bindings is None else bindings[expr_ast.get("name")]
+            return None if lazy_expr is None else lazy_expr.value()
+        if kind in Interpreter.BIN_OPS:
+            left_value_obj = self.__eager_operand(expr_ast.get("op1"), bindings)
+            if left_value_obj is None:
+                return None
+            if kind == "&&" or kind == "||":
+                if left_value_obj.type() != Type.BOOL:
+                    return None
+                short_circuit_value = self.short_circuit(kind, left_value_obj)
+                if short_circuit_value is not None:
+                    return short_circuit_value
+            right_value_obj = self.__eager_operand(expr_ast.get("op2"), bindings)
+            if right_value_obj is None:
+                return None
+            if kind not in ("==", "!=") and left_value_obj.type() != right_value_obj.type():
+                return None
+            if kind not in self.op_to_lambda.get(left_value_obj.type(), {}):
+                return None
+            if kind == "/" and right_value_obj.value() == 0:
+                return None
+            return self.op_caches.apply(expr_ast.site, left_value_obj, right_value_obj)
+        if kind in UNARY_OPS:
+            value_obj = self.__eager_operand(expr_ast.get("op1"), bindings)
+            t, f = UNARY_OPS[kind]
+            if value_obj is None or value_obj.type() != t:
+                return None
+            return self.apply_unary_op(kind, t, f, value_obj)
+        if kind in Interpreter.LITERAL_NODES:
+            return self.make_lazy_expr(expr_ast).value()
+        return None
+
+    def __eager_operand(self, expr_ast, bindings):
+        if bindings is None or expr_ast.elem_type in Interpreter.LITERAL_NODES:
+            return self.eager_value(expr_ast, bindings)
+        # an operand of an expression that's already lazy only has a value if
+        # its lazy expression was forced
+        if expr_ast.elem_type == InterpreterBase.VAR_NODE:
+            lazy_expr = bindings[expr_ast.get("name")]
+        else:
+            lazy_expr = bindings.get(expr_ast)
+        return None if lazy_expr is None else lazy_expr.value()
+
+    # exception name -> the statements of the catcher of try_node that handles
+    # it (the first one for the name), worked out the first time the try
+    # statement catches something
+    def catch_table(self, try_node):
+        table = self.catch_tables.get(try_node)
+        if table is None:
+            table = {}
+            for catcher in try_node.get("catchers"):
+                table.setdefault(catcher.get("exception_type"), catcher.get("statements"))
+            self.catch_tables[try_node] = table
+        return table
+
+    # the call a function returned if it hasn't been made yet, otherwise None
+    def tail_call(self, lazy_expr):
+        if lazy_expr.unknown_var() is not None or lazy_expr.value() is not None:
+            return None
+        expr_ast = lazy_expr.expr_ast()
+        if expr_ast is None or expr_ast.elem_type != InterpreterBase.FCALL_NODE:
+            return None
+        return expr_ast
+
+    # the lazy expressions of a chain of tail calls are forced all at once
+    def finish_tail_calls(self, tail_calls, value_obj):
+        for lazy_expr in tail_calls:
+            lazy_expr.v = value_obj
+            lazy_expr.ea = None
+            lazy_expr.b = None
+
+    # the value of op once its left operand is known, or None if the right
+    # operand is needed
+    def short_circuit(self, op, left_value_obj):
         # if it's &&, check if left value is False, just return False
-        if (arith_ast.elem_type == "&&"):
+        if (op == "&&"):
             if (left_value_obj.type() != Type.BOOL):
                 super().error(
                     ErrorType.TYPE_ERROR,
-                    f"Incompatible left type for {arith_ast.elem_type} operation",
+                    f"Incompatible left type for {op} operation",
                 )
             if left_value_obj.value() == False:
-                return ExecStatus.CONTINUE, Value(Type.BOOL, False)
+                return FALSE_VALUE
 
         # if it's ||, check if left value is True, just return True
-        if (arith_ast.elem_type == "||"):
+        if (op == "||"):
             if (left_value_obj.type() != Type.BOOL):
                 super().error(
                     ErrorType.TYPE_ERROR,
-                    f"Incompatible left type for {arith_ast.elem_type} operation",
+                    f"Incompatible left type for {op} operation",
                 )
             if left_value_obj.value() == True:
-                return ExecStatus.CONTINUE, Value(Type.BOOL, True)
-
-        # if none of the short circuits worked, evaluate the right value object
-        right_exception_status, right_value_obj = self.__eval_lazy_expr(self.__make_lazy_expr(arith_ast.get("op2")))
-
-        # check exception status
-        if (right_exception_status == ExecStatus.EXCEPTION):
-            return (ExecStatus.EXCEPTION, right_value_obj)
-
+                return TRUE_VALUE
+        return None
+
+    # the inline cache handler for op on two operands of type t (see
+    # opcache.py), raising div0 like apply_binary_op
+    def specialize_op(self, op, t):
+        if op not in self.op_to_lambda.get(t, {}):
+            return None
+        f = self.specialized_ops.get(t, {}).get(op)
+        if f is None or op != "/":
+            return f
+
+        def divide(x, y):
+            if y.v == 0:
+                raise BrewinException(Value(Type.STRING, "div0"))
+            return f(x, y)
+
+        return divide
+
+    def apply_binary_op(self, op, left_value_obj, right_value_obj):
         if not self.__compatible_types(
-            arith_ast.elem_type, left_value_obj, right_value_obj
+            op, left_value_obj, right_value_obj
         ):
             super().error(
                 ErrorType.TYPE_ERROR,
-                f"Incompatible types for {arith_ast.elem_type} operation",
+                f"Incompatible types for {op} operation",
             )
-        if arith_ast.elem_type not in self.op_to_lambda[left_value_obj.type()]:
+        if op not in self.op_to_lambda[left_value_obj.type()]:
             super().error(
                 ErrorType.TYPE_ERROR,
-                f"Incompatible operator {arith_ast.elem_type} for type {left_value_obj.type()}",
+                f"Incompatible operator {op} for type {left_value_obj.type()}",
             )
-        f = self.op_to_lambda[left_value_obj.type()][arith_ast.elem_type]
-        if (arith_ast.elem_type == "/" and right_value_obj.type() == Type.INT and right_value_obj.value() == 0):
-            return ExecStatus.EXCEPTION, Value(Type.STRING, "div0")
-        return ExecStatus.CONTINUE, f(left_value_obj, right_value_obj)
+        f = self.op_to_lambda[left_value_obj.type()][op]
+        if (op == "/" and right_value_obj.type() == Type.INT and right_value_obj.value() == 0):
+            raise BrewinException(Value(Type.STRING, "div0"))
+        return f(left_value_obj, right_value_obj)
 
     def __compatible_types(self, oper, obj1, obj2):
         # DOCUMENT: allow comparisons ==/!= of anything against anything
@@ -428,62 +690,63 @@ class Interpreter(InterpreterBase):
             return True
         return obj1.type() == obj2.type()
 
-    def __eval_unary(self, arith_ast, t, f):
-        exception_status, value_obj = self.__eval_lazy_expr(self.__make_lazy_expr(arith_ast.get("op1")))
-        if (exception_status == ExecStatus.EXCEPTION):
-            return (ExecStatus.EXCEPTION, value_obj)
+    def __eval_unary(self, arith_ast, t, f, bindings=None):
+        value_obj = self.__eval_lazy_expr(self.make_lazy_expr(arith_ast.get("op1"), bindings))
+        return self.apply_unary_op(arith_ast.elem_type, t, f, value_obj)
 
+    def apply_unary_op(self, op, t, f, value_obj):
         if value_obj.type() != t:
             super().error(
                 ErrorType.TYPE_ERROR,
-                f"Incompatible type for {arith_ast.elem_type} operation",
+                f"Incompatible type for {op} operation",
             )
-        return ExecStatus.CONTINUE, Value(t, f(value_obj.value()))
+        result = f(value_obj.value())
+        return int_value(result) if t == Type.INT else bool_value(result)
 
     def __setup_ops(self):
         self.op_to_lambda = {}
         # set up operations on integers
         self.op_to_lambda[Type.INT] = {}
-        self.op_to_lambda[Type.INT]["+"] = lambda x, y: Value(
-            x.type(), x.value() + y.value()
+        self.op_to_lambda[Type.INT]["+"] = lambda x, y: int_value(
+            x.value() + y.value()
         )
-        self.op_to_lambda[Type.INT]["-"] = lambda x, y: Value(
-            x.type(), x.value() - y.value()
+        self.op_to_lambda[Type.INT]["-"] = lambda x, y: int_value(
+            x.value() - y.value()
         )
-        self.op_to_lambda[Type.INT]["*"] = lambda x, y: Value(
-            x.type(), x.value() * y.value()
+        self.op_to_lambda[Type.INT]["*"] = lambda x, y: int_value(
+            x.value() * y.value()
         )
-        self.op_to_lambda[Type.INT]["/"] = lambda x, y: Value(
-            x.type(), x.value() // y.value()
+        self.op_to_lambda[Type.INT]["/"] = lambda x, y: int_value(
+            x.value() // y.value()
         )
-        self.op_to_lambda[Type.INT]["=="] = lambda x, y: Value(
-            Type.BOOL, x.type() == y.type() and x.value() == y.value()
+        self.op_to_lambda[Type.INT]["=="] = lambda x, y: bool_value(
+            x.type() == y.type() and x.value() == y.value()
         )
-        self.op_to_lambda[Type.INT]["!="] = lambda x, y: Value(
-            Type.BOOL, x.type() != y.type() or x.value() != y.value()
+        self.op_to_lambda[Type.INT]["!="] = lambda x, y: bool_value(
+            x.type() != y.type() or x.value() != y.value()
         )
-        self.op_to_lambda[Type.INT]["<"] = lambda x, y: Value(
-            Type.BOOL, x.value() < y.value()
+        self.op_to_lambda[Type.INT]["<"] = lambda x, y: bool_value(
+            x.value() < y.value()
         )
-        self.op_to_lambda[Type.INT]["<="] = lambda x, y: Value(
-            Type.BOOL, x.value() <= y.value()
+        self.op_to_lambda[Type.INT]["<="] = lambda x, y: bool_value(
+            x.value() <= y.value()
         )
-        self.op_to_lambda[Type.INT][">"] = lambda x, y: Value(
-            Type.BOOL, x.value() > y.value()
+        self.op_to_lambda[Type.INT][">"] = lambda x, y: bool_value(
+            x.value() > y.value()
         )
-        self.op_to_lambda[Type.INT][">="] = lambda x, y: Value(
-            Type.BOOL, x.value() >= y.value()
+        self.op_to_lambda[Type.INT][">="] = lambda x, y: bool_value(
+            x.value() >= y.value()
         )
         #  set up operations on strings
         self.op_to_lambda[Type.STRING] = {}
         self.op_to_lambda[Type.STRING]["+"] = lambda x, y: Value(
             x.type(), x.value() + y.value()
         )
-        self.op_to_lambda[Type.STRING]["=="] = lambda x, y: Value(
-            Type.BOOL, x.value() == y.value()
+        self.op_to_lambda[Type.STRING]["=="] = lambda x, y: bool_value(
+            x.value() == y.value()
         )
-        self.op_to_lambda[Type.STRING]["!="] = lambda x, y: Value(
-            Type.BOOL, x.value() != y.value()
+        self.op_to_lambda[Type.STRING]["!="] = lambda x, y: bool_value(
+            x.value() != y.value()
         )
         #  set up operations on bools
         self.op_to_lambda[Type.BOOL] = {}
@@ -493,28 +756,26 @@ class Interpreter(InterpreterBase):
         self.op_to_lambda[Type.BOOL]["||"] = lambda x, y: Value(
             x.type(), x.value() or y.value()
         )
-        self.op_to_lambda[Type.BOOL]["=="] = lambda x, y: Value(
-            Type.BOOL, x.type() == y.type() and x.value() == y.value()
+        self.op_to_lambda[Type.BOOL]["=="] = lambda x, y: bool_value(
+            x.type() == y.type() and x.value() == y.value()
         )
-        self.op_to_lambda[Type.BOOL]["!="] = lambda x, y: Value(
-            Type.BOOL, x.type() != y.type() or x.value() != y.value()
+        self.op_to_lambda[Type.BOOL]["!="] = lambda x, y: bool_value(
+            x.type() != y.type() or x.value() != y.value()
         )
 
         #  set up operations on nil
         self.op_to_lambda[Type.NIL] = {}
-        self.op_to_lambda[Type.NIL]["=="] = lambda x, y: Value(
-            Type.BOOL, x.type() == y.type() and x.value() == y.value()
+        self.op_to_lambda[Type.NIL]["=="] = lambda x, y: bool_value(
+            x.type() == y.type() and x.value() == y.value()
         )
-        self.op_to_lambda[Type.NIL]["!="] = lambda x, y: Value(
-            Type.BOOL, x.type() != y.type() or x.value() != y.value()
+        self.op_to_lambda[Type.NIL]["!="] = lambda x, y: bool_value(
+            x.type() != y.type() or x.value() != y.value()
         )
 
 # EAGER EVALUATION HERE FOR CONDITION
     def __do_if(self, if_ast):
         cond_ast = if_ast.get("condition")
-        exception_status, result = self.__eval_expr(cond_ast)
-        if exception_status == ExecStatus.EXCEPTION:
-            return (ExecStatus.EXCEPTION, result)
+        result = self.__eval_expr(cond_ast)
         if result.type() != Type.BOOL:
             super().error(
                 ErrorType.TYPE_ERROR,
@@ -538,14 +799,10 @@ class Interpreter(InterpreterBase):
         cond_ast = for_ast.get("condition")
         update_ast = for_ast.get("update") 
 
-        exception_status, return_value = self.__run_statement(init_ast)  # initialize counter variable
-        if (exception_status == ExecStatus.EXCEPTION):
-            return (ExecStatus.EXCEPTION, return_value)
+        self.__run_statement(init_ast)  # initialize counter variable
         run_for = Interpreter.TRUE_VALUE
         while run_for.value():
-            exception_status, run_for = self.__eval_expr(cond_ast)  # check for-loop condition
-            if (exception_status == ExecStatus.EXCEPTION):
-                return (ExecStatus.EXCEPTION, run_for)
+            run_for = self.__eval_expr(cond_ast)  # check for-loop condition
             if run_for.type() != Type.BOOL:
                 super().error(
                     ErrorType.TYPE_ERROR,
@@ -554,26 +811,17 @@ class Interpreter(InterpreterBase):
             if run_for.value():
                 statements = for_ast.get("statements")
                 status, return_val = self.__run_statements(statements)
-                if status == ExecStatus.EXCEPTION:
-                    return status, return_val
                 if status == ExecStatus.RETURN:
                     return status, return_val
-                status, return_val = self.__run_statement(update_ast)  # update counter variable
-                if status == ExecStatus.EXCEPTION:
-                    return status, return_val
+                self.__run_statement(update_ast)  # update counter variable
 
         return (ExecStatus.CONTINUE, Interpreter.NIL_VALUE)
 
-    def __do_return(self, return_ast):
+    def do_return(self, return_ast):
         expr_ast = return_ast.get("expression")
         if expr_ast is None:
             return (ExecStatus.RETURN, Interpreter.NIL_VALUE)
-        # exception_status, 
-        returned_value = self.__make_lazy_expr(expr_ast)
-        # print(returned_value)
-        # if returned_value.value() is not None:
-        #     print(returned_value.value().value())
-        # if (exception_status == ExecStatus.EXCEPTION):
-            # return (ExecStatus.EXCEPTION, returned_value)
-        value_obj = copy.copy(returned_value)
-        return (ExecStatus.RETURN, value_obj)
\ No newline at end of file
+        strict_value = self.strict_value(return_ast, expr_ast)
+        if strict_value is not None:
+            return (ExecStatus.RETURN, strict_value)
+        return (ExecStatus.RETURN, self.make_lazy_expr(expr_ast))
\ No newline at end of file
@@ -1,10 +1,25 @@
+from element import Element
+from intbase import InterpreterBase
 from type_valuev4 import Value
 
+# the expr_ast of a lazy expression while it's being forced, so one that needs
+# its own value can be told apart from one that hasn't been started
+BLACKHOLE = Element("blackhole")
+
+# A lazy expression made from an expression of the program keeps the parsed
+# expression itself as its expr_ast, and in bindings the lazy expressions its
+# variables referred to when it was made (see Interpreter.make_lazy_expr). The
+# parts of the expression get lazy expressions of their own when they're
+# forced, kept in bindings too under their node. Arguments and returned values
+# are passed as the lazy expressions themselves, not copies, so an expression
+# is only ever evaluated once, by whichever of the caller and the callee needs
+# its value first.
 class LazyExpr:
-    def __init__(self, value=None, unknown_var=None, expr_ast=None):
+    def __init__(self, value=None, unknown_var=None, expr_ast=None, bindings=None):
         self.v = value
         self.uv = unknown_var
         self.ea = expr_ast
+        self.b = bindings
 
     def value(self):
         return self.v
@@ -13,4 +28,26 @@ class LazyExpr:
         return self.uv
     
     def expr_ast(self):
-        return self.ea
\ No newline at end of file
+        return self.ea
+
+    def bindings(self):
+        return self.b
+
+
+# the names of the variables expr_ast reads, each once, in the order they're
+# read: the template of the lazy expressions made from expr_ast
+def free_vars(expr_ast, names=None):
+    if names is None:
+        names = []
+    kind = expr_ast.elem_type
+    if kind == InterpreterBase.VAR_NODE:
+        if expr_ast.get("name") not in names:
+            names.append(expr_ast.get("name"))
+    elif kind == InterpreterBase.FCALL_NODE:
+        for arg in expr_ast.get("args"):
+            free_vars(arg, names)
+    else:
+        for key in ("op1", "op2"):
+            if expr_ast.get(key) is not None:
+                free_vars(expr_ast.get(key), names)
+    return tuple(names)
@@ -0,0 +1,94 @@
+# Inline caches for binary operators.
+#
+# apply_binary_op checks that the operand types go together and then finds the
+# operator's function through op_to_lambda[left type][op], on every evaluation.
+# An OpCaches remembers, for each operator node, the operand types it saw last
+# and a handler specialized for them (an int + int handler works on the raw
+# Python values and doesn't look at the types at all), so as long as the node
+# keeps seeing the same types it calls that handler straight away. When the
+# types change the node falls back to the generic path, which does all the
+# checks and raises the errors, and is specialized again for the new types; a
+# node whose types keep changing stays on the generic path for good.
+#
+# Only operands of the same primitive type are specialized, everything else
+# (mixed types, coercions, structs, nil, errors) always takes the generic path.
+from type_valuev2 import Type
+
+MAX_RESPECIALIZATIONS = 4
+
+# entries value for nodes that are never specialized again
+MEGAMORPHIC = False
+
+
+# handlers for operands that both have the given type, giving the same results
+# as the interpreters' op_to_lambda tables for them; the value helpers come from
+# the interpreter's type_value module
+def specialized_ops(Value, int_value, bool_value):
+    return {
+        Type.INT: {
+            "+": lambda x, y: int_value(x.v + y.v),
+            "-": lambda x, y: int_value(x.v - y.v),
+            "*": lambda x, y: int_value(x.v * y.v),
+            "/": lambda x, y: int_value(x.v // y.v),
+            "==": lambda x, y: bool_value(x.v == y.v),
+            "!=": lambda x, y: bool_value(x.v != y.v),
+            "<": lambda x, y: bool_value(x.v < y.v),
+            "<=": lambda x, y: bool_value(x.v <= y.v),
+            ">": lambda x, y: bool_value(x.v > y.v),
+            ">=": lambda x, y: bool_value(x.v >= y.v),
+            "&&": lambda x, y: Value(Type.BOOL, x.v and y.v),
+            "||": lambda x, y: Value(Type.BOOL, x.v or y.v),
+        },
+        Type.STRING: {
+            "+": lambda x, y: Value(Type.STRING, x.v + y.v),
+            "==": lambda x, y: bool_value(x.v == y.v),
+            "!=": lambda x, y: bool_value(x.v != y.v),
+        },
+        Type.BOOL: {
+            "&&": lambda x, y: Value(Type.BOOL, x.v and y.v),
+            "||": lambda x, y: Value(Type.BOOL, x.v or y.v),
+            "==": lambda x, y: bool_value(x.v == y.v),
+            "!=": lambda x, y: bool_value(x.v != y.v),
+        },
+    }
+
+
+class OpCaches:
+    # specialize(op, operand type) gives the handler for two operands of that
+    # type or None, generic(op, left, right) is the interpreter's
+    # apply_binary_op; both return the same kind of result
+    def __init__(self, specialize, generic):
+        self.specialize = specialize
+        self.generic = generic
+        self.entries = {}  # op node -> (left type, right type, handler) or MEGAMORPHIC
+        self.respecializations = {}  # op node -> times its types changed
+        self.specializations = 0
+        self.despecializations = 0
+
+    def apply(self, op_ast, left_value_obj, right_value_obj):
+        entry = self.entries.get(op_ast)
+        if entry and entry[0] == left_value_obj.t and entry[1] == right_value_obj.t:
+            return entry[2](left_value_obj, right_value_obj)
+        return self.__miss(op_ast, entry, left_value_obj, right_value_obj)
+
+    def __miss(self, op_ast, entry, left_value_obj, right_value_obj):
+        op = op_ast.elem_type
+        if entry is MEGAMORPHIC:
+            return self.generic(op, left_value_obj, right_value_obj)
+        if entry is not None:
+            # the types changed, drop the specialized handler
+            self.despecializations += 1
+            del self.entries[op_ast]
+            count = self.respecializations.get(op_ast, 0) + 1
+            self.respecializations[op_ast] = count
+            if count > MAX_RESPECIALIZATIONS:
+                self.entries[op_ast] = MEGAMORPHIC
+                return self.generic(op, left_value_obj, right_value_obj)
+        handler = None
+        if left_value_obj.t == right_value_obj.t:
+            handler = self.specialize(op, left_value_obj.t)
+        if handler is None:
+            return self.generic(op, left_value_obj, right_value_obj)
+        self.entries[op_ast] = (left_value_obj.t, right_value_obj.t, handler)
+        self.specializations += 1
+        return handler(left_value_obj, right_value_obj)
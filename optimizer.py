@@ -0,0 +1,306 @@
+# AST optimizer, run between parse_program and execution.
+#
+# A PassManager runs a list of passes over every function of a parsed program,
+# rewriting the Element tree in place (parse_program and the parse cache hand
+# out a fresh tree every time, so that's safe). The level picks the passes:
+#   -O0  nothing
+#   -O1  constant folding, dead branch removal, unreachable code removal
+#   -O2  the -O1 passes, then copy propagation
+# Each pass only rewrites what it can prove gives the same output and the same
+# errors in the interpreter version it optimizes for: operations that fail at
+# run time (division by zero, which is a div0 exception in v4, mismatched
+# types, which v3 coerces in some cases and reports in others) are left for the
+# interpreter, so they still fail when and how they used to. Where the versions
+# disagree the passes follow the one they were given:
+#   - only v4 has exceptions; v2 and v3 skip raise and run what comes after it
+#   - v2 gives a block its own scope when it defines variables or passes
+#     arguments to a call, and looks call arguments up one scope out from the
+#     call, so blocks keep their scope and call arguments are left alone there
+#     (v3 and v4 give a block a scope when it defines variables)
+# The passes count what they did, and PassManager.stats has the totals for the
+# program.
+from element import DottedName, Element
+from intbase import InterpreterBase
+
+INT = InterpreterBase.INT_NODE
+STRING = InterpreterBase.STRING_NODE
+BOOL = InterpreterBase.BOOL_NODE
+BIN_OPS = {"+", "-", "*", "/", "==", "!=", ">", ">=", "<", "<=", "||", "&&"}
+
+# (operand literal kind, op) -> function of the two values giving (result
+# literal kind, value), or None when the interpreter has to do it; only
+# operands of the same type, where every interpreter agrees
+FOLDABLE_OPS = {
+    (INT, "+"): lambda x, y: (INT, x + y),
+    (INT, "-"): lambda x, y: (INT, x - y),
+    (INT, "*"): lambda x, y: (INT, x * y),
+    (INT, "/"): lambda x, y: (INT, x // y) if y != 0 else None,
+    (INT, "=="): lambda x, y: (BOOL, x == y),
+    (INT, "!="): lambda x, y: (BOOL, x != y),
+    (INT, "<"): lambda x, y: (BOOL, x < y),
+    (INT, "<="): lambda x, y: (BOOL, x <= y),
+    (INT, ">"): lambda x, y: (BOOL, x > y),
+    (INT, ">="): lambda x, y: (BOOL, x >= y),
+    (STRING, "+"): lambda x, y: (STRING, x + y),
+    (STRING, "=="): lambda x, y: (BOOL, x == y),
+    (STRING, "!="): lambda x, y: (BOOL, x != y),
+    (BOOL, "&&"): lambda x, y: (BOOL, x and y),
+    (BOOL, "||"): lambda x, y: (BOOL, x or y),
+    (BOOL, "=="): lambda x, y: (BOOL, x == y),
+    (BOOL, "!="): lambda x, y: (BOOL, x != y),
+}
+FOLDABLE_UNARY_OPS = {
+    (INT, InterpreterBase.NEG_NODE): lambda x: (INT, -x),
+    (BOOL, InterpreterBase.NOT_NODE): lambda x: (BOOL, not x),
+}
+
+
+# the statement lists nested directly in statement
+def nested_blocks(statement):
+    kind = statement.elem_type
+    if kind == InterpreterBase.IF_NODE:
+        blocks = [statement.get("statements")]
+        if statement.get("else_statements") is not None:
+            blocks.append(statement.get("else_statements"))
+        return blocks
+    if kind == InterpreterBase.FOR_NODE:
+        return [statement.get("statements")]
+    if kind == InterpreterBase.TRY_NODE:
+        return [statement.get("statements")] + [catcher.get("statements") for catcher in statement.get("catchers")]
+    return []
+
+
+# replaces every expression statement evaluates itself (not those of the
+# statements nested in it) with rewrite(expression)
+def rewrite_expressions(statement, rewrite):
+    kind = statement.elem_type
+    if kind == InterpreterBase.FCALL_NODE:
+        args = statement.get("args")
+        args[:] = [rewrite(arg) for arg in args]
+        return
+    key = {
+        "=": "expression",
+        InterpreterBase.RETURN_NODE: "expression",
+        InterpreterBase.IF_NODE: "condition",
+        InterpreterBase.FOR_NODE: "condition",
+        InterpreterBase.RAISE_NODE: "exception_type",
+    }.get(kind)
+    if key is not None and statement.get(key) is not None:
+        statement.dict[key] = rewrite(statement.get(key))
+    if kind == InterpreterBase.FOR_NODE:
+        rewrite_expressions(statement.get("init"), rewrite)
+        rewrite_expressions(statement.get("update"), rewrite)
+
+
+def literal(kind, value):
+    return Element(kind, val=value)
+
+
+def has_var_defs(statements):
+    return any(statement.elem_type == InterpreterBase.VAR_DEF_NODE for statement in statements)
+
+
+class ConstantFolding:
+    name = "constants folded"
+
+    # folds the same way for every version
+    def __init__(self, manager):
+        pass
+
+    def run(self, statements):
+        self.count = 0
+        self.__fold_block(statements)
+        return self.count
+
+    def __fold_block(self, statements):
+        for statement in statements:
+            rewrite_expressions(statement, self.__fold)
+            for block in nested_blocks(statement):
+                self.__fold_block(block)
+
+    def __fold(self, expr_ast):
+        kind = expr_ast.elem_type
+        if kind == InterpreterBase.FCALL_NODE:
+            args = expr_ast.get("args")
+            args[:] = [self.__fold(arg) for arg in args]
+            return expr_ast
+        if kind in BIN_OPS:
+            op1 = self.__fold(expr_ast.get("op1"))
+            op2 = self.__fold(expr_ast.get("op2"))
+            expr_ast.dict["op1"] = op1
+            expr_ast.dict["op2"] = op2
+            f = FOLDABLE_OPS.get((op1.elem_type, kind))
+            if f is None or op1.elem_type != op2.elem_type:
+                return expr_ast
+            result = f(op1.get("val"), op2.get("val"))
+        elif kind == InterpreterBase.NEG_NODE or kind == InterpreterBase.NOT_NODE:
+            op1 = self.__fold(expr_ast.get("op1"))
+            expr_ast.dict["op1"] = op1
+            f = FOLDABLE_UNARY_OPS.get((op1.elem_type, kind))
+            if f is None:
+                return expr_ast
+            result = f(op1.get("val"))
+        else:
+            return expr_ast
+        if result is None:
+            return expr_ast
+        self.count += 1
+        return literal(*result)
+
+
+# if statements with a true or false literal condition are replaced by the
+# branch that runs. A branch that needs a scope of its own keeps its block, as
+# an if (true) with no else.
+class DeadBranches:
+    name = "branches removed"
+
+    def __init__(self, manager):
+        self.needs_scope = manager.needs_scope
+
+    def run(self, statements):
+        self.count = 0
+        self.__block(statements)
+        return self.count
+
+    def __block(self, statements):
+        result = []
+        for statement in statements:
+            for block in nested_blocks(statement):
+                self.__block(block)
+            condition = statement.get("condition") if statement.elem_type == InterpreterBase.IF_NODE else None
+            if condition is None or condition.elem_type != BOOL:
+                result.append(statement)
+                continue
+            taken = statement.get("statements") if condition.get("val") else statement.get("else_statements")
+            if taken is None:
+                self.count += 1
+            elif not self.needs_scope(taken):
+                self.count += 1
+                result.extend(taken)
+            elif condition.get("val") and statement.get("else_statements") is None:
+                # already as small as it gets
+                result.append(statement)
+            else:
+                self.count += 1
+                result.append(Element(InterpreterBase.IF_NODE, condition=literal(BOOL, True), statements=taken,
+                                      else_statements=None))
+        statements[:] = result
+
+
+# statements after a return (or, in v4, a raise) in the same block never run
+class UnreachableCode:
+    name = "unreachable statements removed"
+
+    def __init__(self, manager):
+        self.terminators = {InterpreterBase.RETURN_NODE}
+        if manager.version >= 4:
+            self.terminators.add(InterpreterBase.RAISE_NODE)
+
+    def run(self, statements):
+        self.count = 0
+        self.__block(statements)
+        return self.count
+
+    def __block(self, statements):
+        for i, statement in enumerate(statements):
+            if statement.elem_type in self.terminators:
+                self.count += len(statements) - i - 1
+                del statements[i + 1:]
+                break
+        for statement in statements:
+            for block in nested_blocks(statement):
+                self.__block(block)
+
+
+# After `x = y;` later reads of x in the same block read y instead, until x
+# or y is assigned or defined again. Only the statements of the block itself
+# are rewritten: an if condition is, but the bodies of ifs, fors and trys
+# aren't, and since those may assign anything every copy is forgotten after
+# them. Functions can't see their caller's variables, so calls don't matter,
+# except that v2 looks call arguments up one scope out, where y may not be
+# visible, so in v2 they're left as they are. In v4 both names refer to the
+# same lazy expression, so it is still forced once.
+class CopyPropagation:
+    name = "copies propagated"
+
+    def __init__(self, manager):
+        self.into_calls = manager.version >= 3
+
+    def run(self, statements):
+        self.count = 0
+        self.__block(statements)
+        return self.count
+
+    def __block(self, statements):
+        copies = {}  # variable -> the variable it holds a copy of
+        for statement in statements:
+            kind = statement.elem_type
+            if kind != InterpreterBase.FOR_NODE and (self.into_calls or kind != InterpreterBase.FCALL_NODE):
+                self.copies = copies
+                rewrite_expressions(statement, self.__propagate)
+            for block in nested_blocks(statement):
+                self.__block(block)
+            if kind == "=" and not isinstance(statement.get("name"), DottedName):
+                name = statement.get("name")
+                self.__forget(copies, name)
+                expr_ast = statement.get("expression")
+                if (expr_ast.elem_type == InterpreterBase.VAR_NODE and not isinstance(expr_ast.get("name"), DottedName)
+                        and expr_ast.get("name") != name):
+                    copies[name] = expr_ast.get("name")
+            elif kind == InterpreterBase.VAR_DEF_NODE:
+                self.__forget(copies, statement.get("name"))
+            elif nested_blocks(statement):
+                copies.clear()
+
+    def __forget(self, copies, name):
+        for copy, source in list(copies.items()):
+            if copy == name or source == name:
+                del copies[copy]
+
+    def __propagate(self, expr_ast):
+        kind = expr_ast.elem_type
+        if kind == InterpreterBase.VAR_NODE:
+            name = expr_ast.get("name")
+            if isinstance(name, DottedName):
+                if name.root not in self.copies:
+                    return expr_ast
+                self.count += 1
+                return Element(InterpreterBase.VAR_NODE, name=DottedName(self.copies[name.root], name.fields))
+            if name not in self.copies:
+                return expr_ast
+            self.count += 1
+            return Element(InterpreterBase.VAR_NODE, name=self.copies[name])
+        if kind == InterpreterBase.FCALL_NODE:
+            if self.into_calls:
+                args = expr_ast.get("args")
+                args[:] = [self.__propagate(arg) for arg in args]
+        else:
+            for key in ("op1", "op2"):
+                if expr_ast.get(key) is not None:
+                    expr_ast.dict[key] = self.__propagate(expr_ast.get(key))
+        return expr_ast
+
+
+LEVELS = {
+    0: (),
+    1: (ConstantFolding, DeadBranches, UnreachableCode),
+    2: (ConstantFolding, DeadBranches, UnreachableCode, CopyPropagation),
+}
+
+
+class PassManager:
+    # passes overrides the level's list of pass classes. version is the
+    # interpreter version the program is optimized for, and needs_scope(block
+    # statements) tells whether that version runs the block in a scope of its
+    # own
+    def __init__(self, level=0, passes=None, version=4, needs_scope=has_var_defs):
+        self.version = version
+        self.needs_scope = needs_scope
+        self.passes = [pass_class(self) for pass_class in (LEVELS[level] if passes is None else passes)]
+        self.stats = {optimization.name: 0 for optimization in self.passes}
+
+    def optimize(self, ast):
+        for func_ast in ast.get("functions"):
+            for optimization in self.passes:
+                self.stats[optimization.name] += optimization.run(func_ast.get("statements"))
+        return ast
@@ -0,0 +1,165 @@
+# Content-addressed cache of parsed programs, so running the same brewin source
+# over and over doesn't re-lex and re-parse it every time.
+#
+# Entries are keyed by a hash of the grammar signature, the parser and the
+# program text, and the Element tree is stored marshalled (nested tuples/lists)
+# in an in-process LRU, and on disk too when a cache directory is given. The LRU
+# holds the serialized bytes rather than the tree itself, so every hit hands
+# back a fresh tree that callers are free to mutate. Trees a parser only got by
+# recovering from a syntax error are never stored, so the error is reported
+# again on every run.
+#
+# The disk layer is off unless asked for: whatever is in the directory is
+# loaded as a program, so it should be one only the user can write to. It's
+# created with mode 0700 if it doesn't exist.
+import hashlib
+import marshal
+import os
+import sys
+import tempfile
+import time
+from collections import OrderedDict
+
+from element import DottedName, Element
+
+# bump this whenever the shape of the trees built by the parser changes without
+# the grammar itself changing (the grammar signature won't catch that)
+AST_FORMAT_VERSION = "2"
+
+DEFAULT_MAX_ENTRIES = 128
+
+
+# a DottedName is stored as (root, field names, None), an Element as
+# (elem_type, fields)
+def encode_ast(node):
+    if isinstance(node, DottedName):
+        return (node.root, node.fields, None)
+    if isinstance(node, Element):
+        return (node.elem_type, tuple((key, encode_ast(value)) for key, value in node.dict.items()))
+    if isinstance(node, list):
+        return [encode_ast(item) for item in node]
+    return node
+
+
+def decode_ast(data):
+    if isinstance(data, tuple):
+        if len(data) == 3:
+            return DottedName(data[0], data[1])
+        elem_type, fields = data
+        return Element(sys.intern(elem_type), **{key: decode_ast(value) for key, value in fields})
+    if isinstance(data, list):
+        return [decode_ast(item) for item in data]
+    return data
+
+
+class ParseCache:
+    # cache_dir=None keeps the cache in memory only
+    def __init__(self, signature, max_entries=DEFAULT_MAX_ENTRIES, cache_dir=None):
+        self.signature = signature
+        self.max_entries = max_entries
+        self.cache_dir = cache_dir
+        self.entries = OrderedDict()
+        self.reset_stats()
+
+    def reset_stats(self):
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.load_time = 0.0  # seconds spent turning cached bytes back into trees
+        self.parse_time = 0.0  # seconds spent in the real parser on misses
+
+    def clear(self):
+        self.entries.clear()
+
+    def key(self, program, parser):
+        h = hashlib.sha256()
+        h.update(AST_FORMAT_VERSION.encode())
+        h.update(b"\0")
+        h.update(self.signature.encode())
+        h.update(b"\0")
+        h.update(parser.encode())
+        h.update(b"\0")
+        h.update(program.encode())
+        return h.hexdigest()
+
+    # returns the program parsed by parser, calling parse_func(program) only on
+    # a miss. parse_func returns the tree and whether it may be stored (False
+    # when the parser recovered from a syntax error).
+    def parse(self, program, parser, parse_func):
+        key = self.key(program, parser)
+        start = time.perf_counter()
+        data = self.entries.get(key)
+        from_disk = data is None
+        if from_disk:
+            data = self.__read_disk(key)
+        if data is not None:
+            try:
+                ast = decode_ast(marshal.loads(data))
+                if not isinstance(ast, Element):
+                    raise ValueError("not a parsed program")
+            except (EOFError, ValueError, TypeError):
+                # a truncated or foreign file on disk, just parse it again
+                self.entries.pop(key, None)
+            else:
+                if from_disk:
+                    self.disk_hits += 1
+                else:
+                    self.hits += 1
+                self.__remember(key, data)
+                self.load_time += time.perf_counter() - start
+                return ast
+
+        self.misses += 1
+        start = time.perf_counter()
+        ast, complete = parse_func(program)
+        self.parse_time += time.perf_counter() - start
+        if complete:
+            self.__store(key, marshal.dumps(encode_ast(ast)))
+        return ast
+
+    def __store(self, key, data):
+        self.__remember(key, data)
+        self.__write_disk(key, data)
+
+    def __remember(self, key, data):
+        self.entries[key] = data
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.max_entries:
+            self.entries.popitem(last=False)
+
+    def __path(self, key):
+        return os.path.join(self.cache_dir, key + ".ast")
+
+    def __read_disk(self, key):
+        if self.cache_dir is None:
+            return None
+        try:
+            with open(self.__path(key), "rb") as f:
+                return f.read()
+        except OSError:
+            return None
+
+    def __write_disk(self, key, data):
+        if self.cache_dir is None:
+            return
+        # write to a temp file first so a concurrent reader never sees half an entry
+        try:
+            os.makedirs(self.cache_dir, mode=0o700, exist_ok=True)
+            fd, tmp_path = tempfile.mkstemp(dir=self.cache_dir, suffix=".tmp")
+            with os.fdopen(fd, "wb") as f:
+                f.write(data)
+            os.replace(tmp_path, self.__path(key))
+        except OSError:
+            pass  # the disk layer is best effort, the LRU still works
+
+    def stats(self):
+        lookups = self.hits + self.disk_hits + self.misses
+        return {
+            "hits": self.hits,
+            "disk_hits": self.disk_hits,
+            "misses": self.misses,
+            "hit_rate": (self.hits + self.disk_hits) / lookups if lookups else 0.0,
+            "entries": len(self.entries),
+            "load_time": self.load_time,
+            "parse_time": self.parse_time,
+        }
@@ -0,0 +1,145 @@
+# Purity analysis and call memoization for the v3 interpreter.
+#
+# A function is pure if the only thing a call to it can change is its result:
+# it doesn't print, doesn't read input, doesn't assign to a struct field, and
+# only calls pure functions. Brewin functions can't see any variables but their
+# own, so a pure function given the same arguments always returns the same
+# value (or fails the same way). The analysis starts by taking every function
+# to be pure and drops the ones that do something impure, or call a function
+# that isn't pure, until nothing changes, so (mutually) recursive functions
+# stay pure.
+#
+# Calls to pure functions whose parameters and result are all ints, bools or
+# strings are memoized: the result is kept in a MemoCache under the function
+# and the types and values of its (already coerced) arguments, and the next
+# call with the same arguments returns it without running the function. Failed
+# calls aren't kept. The cache holds at most max_size results and forgets the
+# least recently used one to make room; a max_size of 0 turns it off.
+from collections import OrderedDict
+
+from element import DottedName
+from intbase import InterpreterBase
+from type_valuev2 import Type
+
+PRIMITIVE_TYPES = (Type.INT, Type.BOOL, Type.STRING)
+IMPURE_BUILTINS = {"print", "inputi", "inputs"}
+
+
+class PurityAnalysis:
+    def __init__(self, interpreter):
+        self.func_table = interpreter.func_name_to_ast
+        self.pure = set()  # func_ast nodes of the pure functions
+        self.memoizable = set()  # func_ast nodes whose calls can be memoized
+
+    def analyze_program(self):
+        functions = [func_ast for candidates in self.func_table.values() for func_ast in candidates.values()]
+        callees = {}  # func_ast -> the func_asts it calls
+        for func_ast in functions:
+            self.callees = set()
+            if self.__block_is_pure(func_ast.get("statements")):
+                self.pure.add(func_ast)
+                callees[func_ast] = self.callees
+        changed = True
+        while changed:
+            changed = False
+            for func_ast in list(self.pure):
+                if not callees[func_ast] <= self.pure:
+                    self.pure.discard(func_ast)
+                    changed = True
+        for func_ast in self.pure:
+            if func_ast.get("return_type") in PRIMITIVE_TYPES and all(
+                arg.get("var_type") in PRIMITIVE_TYPES for arg in func_ast.get("args")
+            ):
+                self.memoizable.add(func_ast)
+        return self
+
+    # False if the statements do something impure themselves, the functions
+    # they call are added to self.callees
+    def __block_is_pure(self, statements):
+        return all(self.__statement_is_pure(statement) for statement in statements)
+
+    def __statement_is_pure(self, statement):
+        kind = statement.elem_type
+        if kind == InterpreterBase.FCALL_NODE:
+            return self.__expr_is_pure(statement)
+        if kind == "=":
+            return not isinstance(statement.get("name"), DottedName) and self.__expr_is_pure(statement.get("expression"))
+        if kind == InterpreterBase.RETURN_NODE:
+            return statement.get("expression") is None or self.__expr_is_pure(statement.get("expression"))
+        if kind == InterpreterBase.IF_NODE:
+            return (
+                self.__expr_is_pure(statement.get("condition"))
+                and self.__block_is_pure(statement.get("statements"))
+                and self.__block_is_pure(statement.get("else_statements") or [])
+            )
+        if kind == InterpreterBase.FOR_NODE:
+            return (
+                self.__statement_is_pure(statement.get("init"))
+                and self.__expr_is_pure(statement.get("condition"))
+                and self.__statement_is_pure(statement.get("update"))
+                and self.__block_is_pure(statement.get("statements"))
+            )
+        return True
+
+    def __expr_is_pure(self, expr_ast):
+        if expr_ast.elem_type == InterpreterBase.FCALL_NODE:
+            func_name = expr_ast.get("name")
+            if func_name in IMPURE_BUILTINS:
+                return False
+            callee = self.func_table.get(func_name, {}).get(len(expr_ast.get("args")))
+            if callee is None:
+                return False
+            self.callees.add(callee)
+            return all(self.__expr_is_pure(arg) for arg in expr_ast.get("args"))
+        for key in ("op1", "op2"):
+            if expr_ast.get(key) is not None and not self.__expr_is_pure(expr_ast.get(key)):
+                return False
+        return True
+
+
+class MemoCache:
+    def __init__(self, max_size, memoizable):
+        self.max_size = max_size
+        self.memoizable = memoizable
+        self.entries = OrderedDict()  # key -> result, least recently used first
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    # the cache key for a call of func_ast with the coerced argument values, or
+    # None if the call isn't memoized
+    def key(self, func_ast, args):
+        if not self.max_size or func_ast not in self.memoizable:
+            return None
+        return (func_ast, tuple((arg.t, arg.v) for arg in args))
+
+    def lookup(self, key):
+        result = self.entries.get(key)
+        if result is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        self.entries.move_to_end(key)
+        return result
+
+    def store(self, key, result):
+        self.entries[key] = result
+        if len(self.entries) > self.max_size:
+            self.entries.popitem(last=False)
+            self.evictions += 1
+
+    # function, a compiled version of func_ast taking the coerced argument
+    # values, with its calls memoized
+    def wrap(self, func_ast, function):
+        if not self.max_size or func_ast not in self.memoizable:
+            return function
+
+        def memoized(*args):
+            key = (func_ast, tuple((arg.t, arg.v) for arg in args))
+            result = self.lookup(key)
+            if result is None:
+                result = function(*args)
+                self.store(key, result)
+            return result
+
+        return memoized
@@ -0,0 +1,398 @@
+# Brewin to Python transpiler for the v3 interpreter.
+#
+# Every Brewin function becomes a Python function: each frame slot the resolver
+# (see resolver.py) handed out becomes a Python local, so block scoping and
+# shadowing need no environment at run time, control flow
+# becomes Python if/while, and int/bool operations get inline fast paths. Values
+# are still type_valuev2.Value objects (structs stay Values holding a list of
+# field slots, see shapes.py and heap.py), and everything that isn't inlined
+# calls the same helpers on interpreterv3.Interpreter as the tree walker, so the
+# results and errors are the same. The generated source is kept in
+# Transpiler.source and parsed into an ast.Module, which is compiled with
+# compile() and run. Use it with Interpreter(engine="python").
+import ast
+
+from element import DottedName
+from intbase import InterpreterBase, ErrorType
+from type_valuev2 import Type, Value, TRUE_VALUE, FALSE_VALUE, int_value, get_printable
+
+INT_BIN_OPS = {
+    "+": "+",
+    "-": "-",
+    "*": "*",
+    "/": "//",
+    "<": "<",
+    "<=": "<=",
+    ">": ">",
+    ">=": ">=",
+    "==": "==",
+    "!=": "!=",
+}
+BOOL_BIN_OPS = {"&&": "and", "||": "or", "==": "==", "!=": "!="}
+# operators that always produce a bool Value, so conditions built from them
+# never need coercing
+BOOL_RESULT_OPS = {"==", "!=", "<", "<=", ">", ">=", "&&", "||", InterpreterBase.NOT_NODE}
+UNARY_OPS = {
+    InterpreterBase.NEG_NODE: (Type.INT, lambda x: -1 * x),
+    InterpreterBase.NOT_NODE: (Type.BOOL, lambda x: not x),
+}
+LITERAL_TYPES = {
+    InterpreterBase.INT_NODE: Type.INT,
+    InterpreterBase.STRING_NODE: Type.STRING,
+    InterpreterBase.BOOL_NODE: Type.BOOL,
+}
+
+
+class Transpiler:
+    def __init__(self, interpreter):
+        self.interpreter = interpreter
+        self.resolver = interpreter.resolver
+        self.constants = []  # objects the generated code refers to as K0, K1, ...
+        self.lines = []
+
+    # translates every function in the interpreter's function table
+    def transpile_program(self):
+        func_table = self.interpreter.func_name_to_ast
+        self.func_names = {}
+        for name, candidates in func_table.items():
+            for num_params, func_ast in candidates.items():
+                self.func_names[id(func_ast)] = f"brewin_{name}_{num_params}"
+        for candidates in func_table.values():
+            for func_ast in candidates.values():
+                self.__transpile_function(func_ast)
+        self.source = "\n".join(self.lines) + "\n"
+        self.module = ast.parse(self.source, filename="<brewin>")
+        return self.module
+
+    # the module's namespace after running it: one Python function per Brewin one
+    def load(self):
+        code = compile(self.transpile_program(), "<brewin>", "exec")
+        namespace = self.__runtime()  # after transpiling, which fills in the constants
+        exec(code, namespace)
+        # calls go through the namespace, so memoized functions are swapped in
+        # after the fact
+        for candidates in self.interpreter.func_name_to_ast.values():
+            for func_ast in candidates.values():
+                name = self.func_names[id(func_ast)]
+                namespace[name] = self.interpreter.memo.wrap(func_ast, namespace[name])
+        return namespace
+
+    def run_main(self):
+        namespace = self.load()
+        main_ast = self.interpreter.get_func_by_name("main", 0)
+        return namespace[self.func_names[id(main_ast)]]()
+
+    def __runtime(self):
+        interp = self.interpreter
+        namespace = {f"K{i}": obj for i, obj in enumerate(self.constants)}
+        namespace.update({
+            "Value": Value,
+            "ErrorType": ErrorType,
+            "NIL": interp.NIL_VALUE,
+            "TRUE": TRUE_VALUE,
+            "FALSE": FALSE_VALUE,
+            "int_value": int_value,
+            "error": interp.error,
+            "output": interp.output,
+            "get_printable": get_printable,
+            "coerce_value": interp.coerce_value,
+            "coerce_arg": interp.coerce_arg,
+            "finish_call": interp.finish_call,
+            "finish_tail_call": interp.finish_tail_call,
+            "return_value": interp.return_value,
+            "apply_binary_op": interp.apply_binary_op,
+            "apply_unary_op": interp.apply_unary_op,
+            "get_default_value": interp.get_default_value,
+            "read_input": interp.read_input,
+            "lookup_field": interp.lookup_field,
+            "assign_field": interp.assign_field,
+            "trace": print,
+        })
+        return namespace
+
+    def __const(self, obj):
+        self.constants.append(obj)
+        return f"K{len(self.constants) - 1}"
+
+    def __emit(self, line):
+        self.lines.append("    " * self.indent + line)
+
+    def __temp(self):
+        self.num_temps += 1
+        return f"_t{self.num_temps}"
+
+    def __transpile_function(self, func_ast):
+        self.indent = 0
+        self.num_temps = 0
+        self.loop_depth = 0
+        self.func_ast = func_ast
+        self.return_type = func_ast.get("return_type")
+        params = []
+        param_slots = self.resolver.param_slots[id(func_ast)]
+        for i, (formal_ast, slot) in enumerate(zip(func_ast.get("args"), param_slots)):
+            # repeated parameter names share a slot, the last argument wins
+            if slot in param_slots[i + 1 :]:
+                params.append(f"_unused{i}")
+            else:
+                params.append(self.__local(slot, formal_ast.get("name")))
+        self.params = params
+        self.__emit(f"def {self.func_names[id(func_ast)]}({', '.join(params)}):")
+        self.indent += 1
+        if self.__has_self_tail_call(func_ast.get("statements")):
+            # tail calls to the function itself jump back here
+            self.__emit("while True:")
+            self.indent += 1
+        self.__transpile_block(func_ast.get("statements"))
+        self.__emit(f"return finish_call({self.return_type!r}, NIL)")
+        self.lines.append("")
+
+    # True if a return outside of any for loop tail calls the function being
+    # transpiled, those become a jump back to the start of the function
+    def __has_self_tail_call(self, statements):
+        for statement in statements:
+            kind = statement.elem_type
+            if kind == InterpreterBase.RETURN_NODE:
+                expr_ast = statement.get("expression")
+                if expr_ast is not None and self.interpreter.tail_callee(expr_ast) is self.func_ast:
+                    return True
+            elif kind == InterpreterBase.IF_NODE:
+                if self.__has_self_tail_call(statement.get("statements")):
+                    return True
+                if statement.get("else_statements") is not None and self.__has_self_tail_call(
+                    statement.get("else_statements")
+                ):
+                    return True
+        return False
+
+    # the Python local for a frame slot, named after the variable as well to
+    # keep the generated source readable
+    def __local(self, slot, name):
+        if slot is None:
+            return None
+        if isinstance(name, DottedName):
+            name = name.root
+        return f"v{slot}_{name}"
+
+    def __transpile_block(self, statements):
+        start = len(self.lines)
+        for statement in statements:
+            if self.interpreter.trace_output:
+                self.__emit(f"trace({self.__const(statement)})")
+            self.__transpile_statement(statement)
+        if len(self.lines) == start:
+            self.__emit("pass")
+
+    def __transpile_statement(self, statement):
+        kind = statement.elem_type
+        if kind == InterpreterBase.FCALL_NODE:
+            self.__emit(self.__call(statement))
+        elif kind == "=":
+            self.__transpile_assign(statement)
+        elif kind == InterpreterBase.VAR_DEF_NODE:
+            self.__transpile_var_def(statement)
+        elif kind == InterpreterBase.RETURN_NODE:
+            self.__transpile_return(statement)
+        elif kind == InterpreterBase.IF_NODE:
+            self.__transpile_if(statement)
+        elif kind == InterpreterBase.FOR_NODE:
+            self.__transpile_for(statement)
+        # the tree walker ignores every other kind of statement, so do we
+
+    def __transpile_var_def(self, statement):
+        name = statement.get("name")
+        var_type = statement.get("var_type")
+        default = f"get_default_value({var_type!r})"
+        slot = self.resolver.slots[statement]
+        if slot is None:
+            self.__emit(default)
+            self.__emit(f"error(ErrorType.NAME_ERROR, {f'Duplicate definition for variable {name}'!r})")
+            return
+        if var_type in (Type.INT, Type.BOOL, Type.STRING):
+            # Values are never mutated, so one default per definition will do
+            default = self.__const(self.interpreter.get_default_value(var_type))
+        self.__emit(f"{self.__local(slot, name)} = {default}")
+
+    def __transpile_assign(self, statement):
+        name = statement.get("name")
+        value = self.__expr(statement.get("expression"))
+        local = self.__local(self.resolver.slots[statement], name)
+        if isinstance(name, DottedName):
+            self.__emit(f"assign_field({local}, {self.__const(name)}, {value})")
+            return
+        if local is None:
+            self.__emit(value)
+            self.__emit(f"error(ErrorType.NAME_ERROR, {f'Undefined variable {name} in assignment'!r})")
+            return
+        self.__emit(f"{local} = {value}")
+
+    def __transpile_return(self, statement):
+        expr_ast = statement.get("expression")
+        if expr_ast is None:
+            self.__emit(f"return finish_call({self.return_type!r}, NIL)")
+            return
+        callee_ast = self.interpreter.tail_callee(expr_ast)
+        if callee_ast is self.func_ast and self.loop_depth == 0:
+            args = self.__args(callee_ast, expr_ast.get("args"))
+            if args:
+                self.__emit(f"{', '.join(self.params)} = {', '.join(args)}")
+            self.__emit("continue")
+            return
+        if callee_ast is not None:
+            # the callee's value already has its return type, and isn't void
+            result = self.__temp()
+            self.__emit(f"{result} = {self.__call(expr_ast)}")
+            self.__emit(
+                f"return {result} if {result}.t == {self.return_type!r} "
+                f"else finish_tail_call({self.return_type!r}, {result})"
+            )
+            return
+        result = self.__temp()
+        self.__emit(f"{result} = return_value({self.__expr(expr_ast)})")
+        self.__emit(
+            f"return {result} if {result}.t == {self.return_type!r} "
+            f"else finish_call({self.return_type!r}, {result})"
+        )
+
+    # emits the statements that leave the condition's truth value in a local
+    def __condition(self, cond_ast):
+        cond = self.__temp()
+        self.__emit(f"{cond} = {self.__expr(cond_ast)}")
+        if cond_ast.elem_type not in BOOL_RESULT_OPS:
+            self.__emit(f"if {cond}.t != {Type.BOOL!r}:")
+            self.__emit(f"    {cond} = coerce_value({Type.BOOL!r}, {cond})")
+        return f"{cond}.v"
+
+    def __transpile_if(self, statement):
+        self.__emit(f"if {self.__condition(statement.get('condition'))}:")
+        self.indent += 1
+        self.__transpile_block(statement.get("statements"))
+        self.indent -= 1
+        else_statements = statement.get("else_statements")
+        if else_statements is not None:
+            self.__emit("else:")
+            self.indent += 1
+            self.__transpile_block(else_statements)
+            self.indent -= 1
+
+    def __transpile_for(self, statement):
+        self.__transpile_statement(statement.get("init"))
+        self.__emit("while True:")
+        self.indent += 1
+        self.loop_depth += 1
+        self.__emit(f"if not {self.__condition(statement.get('condition'))}:")
+        self.__emit("    break")
+        self.__transpile_block(statement.get("statements"))
+        self.__transpile_statement(statement.get("update"))
+        self.loop_depth -= 1
+        self.indent -= 1
+
+    def __call(self, call_ast):
+        func_name = call_ast.get("name")
+        actual_args = call_ast.get("args")
+        if func_name == "print":
+            # like the tree walker, each value is converted to text before the
+            # next argument is evaluated
+            printables = "".join(f" + get_printable({self.__expr(arg)})" for arg in actual_args)
+            return f"(output(''{printables}), NIL)[1]"
+        if func_name == "inputi" or func_name == "inputs":
+            if len(actual_args) > 1:
+                return "error(ErrorType.NAME_ERROR, 'No inputi() function that takes > 1 parameter')"
+            read = f"read_input({func_name!r})"
+            if actual_args:
+                return f"(output(get_printable({self.__expr(actual_args[0])})), {read})[1]"
+            return read
+
+        # the function table never changes while running, so resolve the callee
+        # now and only report a missing one when the call is reached
+        candidates = self.interpreter.func_name_to_ast.get(func_name)
+        if candidates is None:
+            return f"error(ErrorType.NAME_ERROR, {f'Function {func_name} not found'!r})"
+        func_ast = candidates.get(len(actual_args))
+        if func_ast is None:
+            message = f"Function {func_name} taking {len(actual_args)} params not found"
+            return f"error(ErrorType.NAME_ERROR, {message!r})"
+        return f"{self.func_names[id(func_ast)]}({', '.join(self.__args(func_ast, actual_args))})"
+
+    def __args(self, func_ast, actual_args):
+        args = []
+        exact_args = self.interpreter.checker.exact_args
+        for formal_ast, actual_ast in zip(func_ast.get("args"), actual_args):
+            if actual_ast in exact_args:
+                args.append(self.__expr(actual_ast))
+                continue
+            # an argument that already has the formal type comes through
+            # coerce_arg unchanged
+            arg = self.__temp()
+            args.append(
+                f"({arg} if ({arg} := {self.__expr(actual_ast)}).t == {formal_ast.get('var_type')!r} "
+                f"else coerce_arg({self.__const(formal_ast)}, {arg}))"
+            )
+        return args
+
+    def __expr(self, expr_ast):
+        kind = expr_ast.elem_type
+        if kind == InterpreterBase.NIL_NODE:
+            return "NIL"
+        if kind in LITERAL_TYPES:
+            return self.__const(Value(LITERAL_TYPES[kind], expr_ast.get("val")))
+        if kind == InterpreterBase.VAR_NODE:
+            return self.__var(expr_ast.get("name"), self.resolver.slots[expr_ast])
+        if kind == InterpreterBase.FCALL_NODE:
+            result = self.__temp()
+            return (
+                f"({result} if ({result} := {self.__call(expr_ast)}).t != {Type.VOID!r} "
+                f"else error(ErrorType.TYPE_ERROR, 'Void function cannot be assigned to anything and evaluated'))"
+            )
+        if kind in self.interpreter.BIN_OPS:
+            return self.__binary_op(kind, expr_ast)
+        if kind in UNARY_OPS:
+            return self.__unary_op(kind, expr_ast)
+        if kind == InterpreterBase.NEW_NODE:
+            return f"{self.__const(self.interpreter.struct_allocator(expr_ast.get('var_type')))}()"
+        return "None"
+
+    def __var(self, name, slot):
+        local = self.__local(slot, name)
+        if isinstance(name, DottedName):
+            return f"lookup_field({local}, {self.__const(name)})"
+        if local is None:
+            return f"error(ErrorType.NAME_ERROR, {f'Variable {name} not found'!r})"
+        return local
+
+    # Both operands are always evaluated, in order, before the types are looked
+    # at: the chained comparison evaluates left and then right and only then
+    # compares their types. Operands the type checker (see typecheckv3.py)
+    # proved to be ints or bools need no comparison at all.
+    def __binary_op(self, op, expr_ast):
+        checker = self.interpreter.checker
+        operand_type = checker.types.get(expr_ast.get("op1"))
+        fast_ops = {Type.INT: INT_BIN_OPS, Type.BOOL: BOOL_BIN_OPS}.get(operand_type, ())
+        if expr_ast in checker.fast_ops and op in fast_ops:
+            left, right = self.__temp(), self.__temp()
+            operands = f"({left} := {self.__expr(expr_ast.get('op1'))}, {right} := {self.__expr(expr_ast.get('op2'))})"
+            # && and || don't get to skip evaluating the right operand
+            return f"({self.__fast_op(op, operand_type, left, right)} if {operands} else None)"
+        left, right = self.__temp(), self.__temp()
+        operands = f"({left} := {self.__expr(expr_ast.get('op1'))}).t == ({right} := {self.__expr(expr_ast.get('op2'))}).t"
+        generic = f"apply_binary_op({op!r}, {left}, {right})"
+        operand_type = Type.INT if op in INT_BIN_OPS else Type.BOOL
+        return f"({self.__fast_op(op, operand_type, left, right)} if {operands} == {operand_type!r} else {generic})"
+
+    # op on the already evaluated locals left and right, which both have
+    # operand_type, using the shared Values for bools and small ints
+    def __fast_op(self, op, operand_type, left, right):
+        if operand_type == Type.INT:
+            if op in ("+", "-", "*", "/"):
+                return f"int_value({left}.v {INT_BIN_OPS[op]} {right}.v)"
+            return f"(TRUE if {left}.v {INT_BIN_OPS[op]} {right}.v else FALSE)"
+        if op in ("&&", "||"):
+            # bool Values made from ints by && and || may hold ints
+            return f"Value({Type.BOOL!r}, {left}.v {BOOL_BIN_OPS[op]} {right}.v)"
+        return f"(TRUE if {left}.v {BOOL_BIN_OPS[op]} {right}.v else FALSE)"
+
+    def __unary_op(self, op, expr_ast):
+        t, f = UNARY_OPS[op]
+        value = self.__temp()
+        fast = f"int_value(-1 * {value}.v)" if op == InterpreterBase.NEG_NODE else f"(FALSE if {value}.v else TRUE)"
+        generic = f"apply_unary_op({op!r}, {t!r}, {self.__const(f)}, {value})"
+        return f"({fast} if ({value} := {self.__expr(expr_ast.get('op1'))}).t == {t!r} else {generic})"
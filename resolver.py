@@ -0,0 +1,116 @@
+# Resolver pass for the v3 interpreter (lexical addressing).
+#
+# Brewin variables are block scoped but can only be seen from inside their own
+# function, so where each variable use lands is known before the program runs.
+# The resolver walks every function once and gives each variable definition a
+# slot in its function's frame; every use (variable reads, assignments, the root
+# of a dotted struct path) is mapped to the slot of the definition it refers to.
+# At run time each call then gets a flat list of values and a variable access is
+# a single index into it, instead of a search through a stack of block dicts.
+#
+# Blocks only exist here: a block's variables get slots above those of the
+# enclosing blocks, and once the block ends its slots are handed out again to the
+# next sibling block. A use that doesn't refer to any definition, and a second
+# definition of a name in the same block, resolve to None, and the interpreter
+# reports the same NAME_ERROR as before when it gets to them. Every use is also
+# mapped to the vardef or formal argument node that defines it, for the type
+# checker (see typecheckv3.py).
+from element import DottedName
+from intbase import InterpreterBase
+
+
+class Resolver:
+    def __init__(self):
+        self.slots = {}  # var/assign/vardef/arg node -> slot or None
+        self.definitions = {}  # var/assign node -> its vardef/arg node or None
+        self.frame_sizes = {}  # id(func_ast) -> number of slots its frame needs
+        self.param_slots = {}  # id(func_ast) -> slot of each formal argument
+
+    def resolve_program(self, func_table):
+        for candidates in func_table.values():
+            for func_ast in candidates.values():
+                self.resolve_function(func_ast)
+        return self
+
+    def resolve_function(self, func_ast):
+        self.scopes = [{}]
+        self.next_slot = 0
+        self.max_slots = 0
+        param_slots = []
+        for arg in func_ast.get("args"):
+            # a repeated parameter name binds the same variable, the last
+            # argument for it wins
+            definition = self.scopes[-1].get(arg.get("name"))
+            if definition is None:
+                self.slots[arg] = self.__define(arg.get("name"), arg)
+            else:
+                self.slots[arg] = self.slots[definition]
+            param_slots.append(self.slots[arg])
+        self.param_slots[id(func_ast)] = param_slots
+        self.__resolve_block(func_ast.get("statements"))
+        self.frame_sizes[id(func_ast)] = self.max_slots
+
+    def __define(self, name, definition):
+        slot = self.next_slot
+        self.next_slot += 1
+        self.max_slots = max(self.max_slots, self.next_slot)
+        self.scopes[-1][name] = definition
+        return slot
+
+    # maps node (a use of name, or of the root variable of a dotted struct
+    # path) to the innermost definition of that name visible right now
+    def __resolve_use(self, node, name):
+        if isinstance(name, DottedName):
+            name = name.root
+        for scope in reversed(self.scopes):
+            if name in scope:
+                definition = scope[name]
+                self.definitions[node] = definition
+                self.slots[node] = self.slots[definition]
+                return
+        self.definitions[node] = None
+        self.slots[node] = None
+
+    def __resolve_block(self, statements):
+        self.scopes.append({})
+        first_slot = self.next_slot
+        for statement in statements:
+            self.__resolve_statement(statement)
+        self.scopes.pop()
+        self.next_slot = first_slot
+
+    def __resolve_statement(self, statement):
+        kind = statement.elem_type
+        if kind == InterpreterBase.FCALL_NODE:
+            self.__resolve_expr(statement)
+        elif kind == "=":
+            self.__resolve_expr(statement.get("expression"))
+            self.__resolve_use(statement, statement.get("name"))
+        elif kind == InterpreterBase.VAR_DEF_NODE:
+            name = statement.get("name")
+            self.slots[statement] = None if name in self.scopes[-1] else self.__define(name, statement)
+        elif kind == InterpreterBase.RETURN_NODE:
+            if statement.get("expression") is not None:
+                self.__resolve_expr(statement.get("expression"))
+        elif kind == InterpreterBase.IF_NODE:
+            self.__resolve_expr(statement.get("condition"))
+            self.__resolve_block(statement.get("statements"))
+            if statement.get("else_statements") is not None:
+                self.__resolve_block(statement.get("else_statements"))
+        elif kind == InterpreterBase.FOR_NODE:
+            self.__resolve_statement(statement.get("init"))
+            self.__resolve_expr(statement.get("condition"))
+            self.__resolve_block(statement.get("statements"))
+            self.__resolve_statement(statement.get("update"))
+
+    def __resolve_expr(self, expr_ast):
+        kind = expr_ast.elem_type
+        if kind == InterpreterBase.VAR_NODE:
+            self.__resolve_use(expr_ast, expr_ast.get("name"))
+        elif kind == InterpreterBase.FCALL_NODE:
+            for arg in expr_ast.get("args"):
+                self.__resolve_expr(arg)
+        else:
+            for operand in (expr_ast.get("op1"), expr_ast.get("op2")):
+                if operand is not None:
+                    self.__resolve_expr(operand)
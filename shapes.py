@@ -0,0 +1,35 @@
+# Struct shapes for the v3 interpreter.
+#
+# Every struct type is compiled into a Shape when the program is loaded: its
+# fields in declaration order, each with a slot index and its type. A struct
+# instance is a Value whose value is a list with one slot per field (a
+# StructObject from the heap, see heap.py; nil structs keep None), so it holds
+# no field names at all. A dotted path like a.b.c (a DottedName from the
+# parser, see element.py) is resolved into slot indexes the first time it's
+# used with a given struct type as the type of a, by following the declared
+# types of the fields (a field of a struct type only ever holds that type or
+# nil), and the FieldPath is kept for every later use of the same path. Names
+# that don't resolve are kept as a None slot, so the error is still reported
+# only when the access gets that far.
+
+
+class Shape:
+    def __init__(self, name, fields):
+        self.name = name
+        self.field_names = tuple(fields)
+        self.field_types = tuple(fields.values())
+        self.slots = {field_name: slot for slot, field_name in enumerate(self.field_names)}
+
+
+class FieldPath:
+    # var_name is the DottedName of the path, shape that of the struct its root
+    # holds
+    def __init__(self, var_name, shape, shapes):
+        self.root = var_name.root
+        self.steps = []  # (field name, slot or None) for each field before the last one
+        for field_name in var_name.fields[:-1]:
+            slot = None if shape is None else shape.slots.get(field_name)
+            self.steps.append((field_name, slot))
+            shape = None if slot is None else shapes.get(shape.field_types[slot])
+        self.field = var_name.fields[-1]
+        self.slot = None if shape is None else shape.slots.get(self.field)
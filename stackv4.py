@@ -0,0 +1,306 @@
+# Explicit-stack execution engine for the v4 interpreter.
+#
+# The tree walker recurses in Python for every Brewin call and for every lazy
+# expression it forces, so a Brewin program only a few hundred calls deep runs
+# out of Python stack. Here every step that can recurse is a generator: instead
+# of calling the step it depends on, it yields it and gets the result sent back.
+# StackMachine.run keeps the suspended steps in a plain list (the Brewin call
+# stack and the chain of thunks being forced live on the heap), so the depth of
+# recursion is only limited by memory. The steps follow the tree walker exactly
+# and use its helpers for everything that doesn't recurse (building lazy
+# expressions, assignments, operators, errors), so the output is the same as
+# interpreterv4.Interpreter's. Use it with Interpreter(engine="stack").
+#
+# A Brewin exception raised by a step is thrown into the step that yielded it,
+# so the steps handle it with the same try statements the tree walker uses.
+from intbase import InterpreterBase, ErrorType
+from interpreterv4 import UNARY_OPS, BrewinException, ExecStatus
+from type_valuev4 import Type, Value, bool_value, int_value, get_printable
+
+CONTINUE = ExecStatus.CONTINUE
+RETURN = ExecStatus.RETURN
+
+
+class StackMachine:
+    def __init__(self, interpreter):
+        self.interpreter = interpreter
+        self.env = interpreter.env
+        self.max_depth = 0  # deepest the step stack got, for benchmarks
+
+    def run_main(self):
+        return self.run(self.call_func_aux("main", []))
+
+    # drives step and everything it yields to completion, returns its result
+    def run(self, step):
+        steps = [step]
+        result = None
+        exception = None  # raised by the last step, for the one that yielded it
+        while True:
+            try:
+                if exception is None:
+                    sub_step = steps[-1].send(result)
+                else:
+                    thrown, exception = exception, None
+                    sub_step = steps[-1].throw(thrown)
+            except StopIteration as done:
+                steps.pop()
+                if not steps:
+                    return done.value
+                result = done.value
+                continue
+            except BrewinException as raised:
+                steps.pop()
+                if not steps:
+                    raise
+                exception = raised
+                continue
+            steps.append(sub_step)
+            if len(steps) > self.max_depth:
+                self.max_depth = len(steps)
+            result = None
+
+    def run_statements(self, statements):
+        interp = self.interpreter
+        has_vars = interp.has_var_defs(statements)
+        if has_vars:
+            self.env.push_block()
+        try:
+            for statement in statements:
+                if interp.trace_output:
+                    print(statement)
+                status, return_val = yield self.run_statement(statement)
+                if status == RETURN:
+                    if has_vars:
+                        self.env.pop_block()
+                    return (status, return_val)
+        except BrewinException:
+            if has_vars:
+                self.env.pop_block()
+            raise
+        if has_vars:
+            self.env.pop_block()
+        return (CONTINUE, interp.NIL_VALUE)
+
+    def run_statement(self, statement):
+        interp = self.interpreter
+        kind = statement.elem_type
+        if kind == InterpreterBase.FCALL_NODE:
+            return (CONTINUE, (yield self.call_func_aux(statement.get("name"), statement.get("args"))))
+        if kind == "=":
+            return interp.assign(statement)
+        if kind == InterpreterBase.VAR_DEF_NODE:
+            interp.var_def(statement)
+        elif kind == InterpreterBase.RETURN_NODE:
+            return interp.do_return(statement)
+        elif kind == InterpreterBase.IF_NODE:
+            return (yield self.do_if(statement))
+        elif kind == InterpreterBase.FOR_NODE:
+            return (yield self.do_for(statement))
+        elif kind == InterpreterBase.RAISE_NODE:
+            return (yield self.do_raise(statement))
+        elif kind == InterpreterBase.TRY_NODE:
+            return (yield self.try_block(statement))
+        return (CONTINUE, None)
+
+    def try_block(self, try_node):
+        try:
+            return (yield self.run_statements(try_node.get("statements")))
+        except BrewinException as exception:
+            statements = self.interpreter.catch_table(try_node).get(exception.value.value())
+            if statements is None:
+                raise
+        return (yield self.run_statements(statements))
+
+    def do_raise(self, raise_ast):
+        interp = self.interpreter
+        expr_ast = raise_ast.get("exception_type")
+        if expr_ast is None:
+            raise BrewinException(interp.NIL_VALUE)
+        try:
+            value_obj = yield self.eval_expr(expr_ast)
+        except BrewinException as exception:
+            value_obj = exception.value
+        if value_obj.type() != Type.STRING:
+            interp.error(
+                ErrorType.TYPE_ERROR,
+                "incompatible type for raise statement",
+            )
+        raise BrewinException(value_obj)
+
+    def call_func_aux(self, func_name, actual_args, bindings=None):
+        interp = self.interpreter
+        if func_name == "print":
+            return (yield self.call_print(actual_args, bindings))
+        if func_name == "inputi" or func_name == "inputs":
+            return (yield self.call_input(func_name, actual_args, bindings))
+        func_ast = interp.get_func_by_name(func_name, len(actual_args))
+        formal_args = func_ast.get("args")
+        if len(actual_args) != len(formal_args):
+            interp.error(
+                ErrorType.NAME_ERROR,
+                f"Function {func_ast.get('name')} with {len(actual_args)} args not found",
+            )
+
+        args = {}
+        for formal_ast, actual_ast in zip(formal_args, actual_args):
+            args[formal_ast.get("name")] = (
+                interp.strict_value(formal_ast, actual_ast, bindings) or interp.make_lazy_expr(actual_ast, bindings)
+            )
+
+        self.env.push_func()
+        for arg_name, value in args.items():
+            self.env.create(arg_name, value)
+        try:
+            _, return_val = yield self.run_statements(func_ast.get("statements"))
+        except BrewinException:
+            self.env.pop_func()
+            raise
+        self.env.pop_func()
+        return return_val
+
+    def call_print(self, args, bindings=None):
+        interp = self.interpreter
+        output = ""
+        for arg in args:
+            result = interp.forced_value(arg, bindings)
+            if result is None:
+                result = yield self.eval_lazy_expr(interp.make_lazy_expr(arg, bindings))
+            output = output + get_printable(result)
+        interp.output(output)
+        return interp.NIL_VALUE
+
+    def call_input(self, name, args, bindings=None):
+        interp = self.interpreter
+        if args is not None and len(args) == 1:
+            result = yield self.eval_lazy_expr(interp.make_lazy_expr(args[0], bindings))
+            interp.output(get_printable(result))
+        elif args is not None and len(args) > 1:
+            interp.error(
+                ErrorType.NAME_ERROR, "No inputi() function that takes > 1 parameter"
+            )
+        return interp.read_input(name)
+
+    def eval_lazy_expr(self, expression):
+        if expression.unknown_var() is not None:
+            self.interpreter.error(
+                ErrorType.NAME_ERROR, f"undefined variable {expression.unknown_var()}"
+            )
+        if expression.value() is not None:
+            return expression.value()
+        if expression.expr_ast() is not None:
+            try:
+                result = yield self.eval_expr(expression.expr_ast(), expression.bindings())
+            except BrewinException as exception:
+                # an exception is kept as the value, like a result
+                expression.v = exception.value
+                expression.ea = None
+                expression.b = None
+                raise
+            expression.v = result
+            expression.ea = None
+            expression.b = None
+            return result
+        self.interpreter.error(
+            ErrorType.FAULT_ERROR,
+            f"There were no fields found in the lazy expression"
+        )
+
+    # bindings are those of the lazy expression expr_ast belongs to, if any
+    # (see Interpreter.make_lazy_expr)
+    def eval_expr(self, expr_ast, bindings=None):
+        interp = self.interpreter
+        kind = expr_ast.elem_type
+        if kind == InterpreterBase.NIL_NODE:
+            return interp.NIL_VALUE
+        if kind == InterpreterBase.INT_NODE:
+            return int_value(expr_ast.get("val"))
+        if kind == InterpreterBase.STRING_NODE:
+            return Value(Type.STRING, expr_ast.get("val"))
+        if kind == InterpreterBase.BOOL_NODE:
+            return bool_value(expr_ast.get("val"))
+        if kind == InterpreterBase.VAR_NODE:
+            var_name = expr_ast.get("name")
+            val = self.env.get(var_name)
+            if val is None:
+                interp.error(ErrorType.NAME_ERROR, f"Variable {var_name} not found")
+            # like the tree walker, an exception while forcing a variable is
+            # passed on as a plain value
+            try:
+                return (yield self.eval_lazy_expr(val))
+            except BrewinException as exception:
+                return exception.value
+        if kind == InterpreterBase.FCALL_NODE:
+            # tail calls are made one after the other, like the tree walker does
+            tail_calls = []
+            try:
+                while True:
+                    return_val = interp.make_lazy_expr(
+                        (yield self.call_func_aux(expr_ast.get("name"), expr_ast.get("args"), bindings))
+                    )
+                    if interp.tail_call(return_val) is None:
+                        break
+                    tail_calls.append(return_val)
+                    expr_ast = return_val.expr_ast()
+                    bindings = return_val.bindings()
+                new_return_val = yield self.eval_lazy_expr(return_val)
+            except BrewinException as exception:
+                interp.finish_tail_calls(tail_calls, exception.value)
+                raise
+            interp.finish_tail_calls(tail_calls, new_return_val)
+            return new_return_val
+        if kind in interp.BIN_OPS:
+            return (yield self.eval_op(expr_ast, bindings))
+        if kind in UNARY_OPS:
+            value_obj = yield self.eval_lazy_expr(interp.make_lazy_expr(expr_ast.get("op1"), bindings))
+            t, f = UNARY_OPS[kind]
+            return interp.apply_unary_op(kind, t, f, value_obj)
+        return None
+
+    def eval_op(self, arith_ast, bindings=None):
+        interp = self.interpreter
+        value_obj = interp.forced_value(arith_ast, bindings)
+        if value_obj is not None:
+            return value_obj
+        op = arith_ast.elem_type
+        left_value_obj = yield self.eval_lazy_expr(interp.make_lazy_expr(arith_ast.get("op1"), bindings))
+        short_circuit_value = interp.short_circuit(op, left_value_obj)
+        if short_circuit_value is not None:
+            return short_circuit_value
+        right_value_obj = yield self.eval_lazy_expr(interp.make_lazy_expr(arith_ast.get("op2"), bindings))
+        return interp.op_caches.apply(arith_ast.site, left_value_obj, right_value_obj)
+
+    def do_if(self, if_ast):
+        interp = self.interpreter
+        result = yield self.eval_expr(if_ast.get("condition"))
+        if result.type() != Type.BOOL:
+            interp.error(
+                ErrorType.TYPE_ERROR,
+                "Incompatible type for if condition",
+            )
+        if result.value():
+            return (yield self.run_statements(if_ast.get("statements")))
+        else_statements = if_ast.get("else_statements")
+        if else_statements is not None:
+            return (yield self.run_statements(else_statements))
+        return (CONTINUE, interp.NIL_VALUE)
+
+    def do_for(self, for_ast):
+        interp = self.interpreter
+        cond_ast = for_ast.get("condition")
+        update_ast = for_ast.get("update")
+        statements = for_ast.get("statements")
+
+        yield self.run_statement(for_ast.get("init"))
+        while True:
+            run_for = yield self.eval_expr(cond_ast)
+            if run_for.type() != Type.BOOL:
+                interp.error(
+                    ErrorType.TYPE_ERROR,
+                    "Incompatible type for for condition",
+                )
+            if not run_for.value():
+                return (CONTINUE, interp.NIL_VALUE)
+            status, return_val = yield self.run_statements(statements)
+            if status == RETURN:
+                return status, return_val
+            yield self.run_statement(update_ast)
@@ -0,0 +1,124 @@
+# Strictness analysis for the v4 interpreter.
+#
+# v4 keeps every assigned value, argument and returned value as a lazy
+# expression that's only evaluated when the value is needed. For a loop
+# counter, or a sum printed after the loop, the value is always needed, and
+# making the lazy expression (and later a chain of them) is wasted work. The analysis finds, for each function, the variables and
+# parameters whose values it forces: those in if and for conditions, printed,
+# raised or returned values, and in the left operand of && and || (both
+# operands of the other operators), then whatever is assigned to or passed for
+# a strict variable or parameter, until nothing changes. Assignments to strict
+# variables, arguments for strict parameters and return statements are the
+# eager sites; the interpreter computes the value at an eager site right away
+# instead of building a lazy expression when it can do that without calling a
+# function, failing or raising (see Interpreter.strict_value), so the output
+# and the order of errors and exceptions stay the same whether the analysis is
+# right about a site or not: a wrong guess only costs the time it takes to
+# compute a value that isn't used.
+from intbase import InterpreterBase
+
+BIN_OPS = {"+", "-", "*", "/", "==", "!=", ">", ">=", "<", "<=", "||", "&&"}
+SHORT_CIRCUIT_OPS = {"&&", "||"}
+
+
+class StrictnessAnalysis:
+    def __init__(self, func_table):
+        self.func_table = func_table
+        self.strict_vars = {}  # func_ast -> names of its strict variables and parameters
+        self.eager = set()  # assignment, formal argument and return nodes
+
+    def analyze_program(self):
+        functions = [func_ast for candidates in self.func_table.values() for func_ast in candidates.values()]
+        for func_ast in functions:
+            self.strict_vars[func_ast] = set()
+        changed = True
+        while changed:
+            changed = False
+            for func_ast in functions:
+                self.strict = self.strict_vars[func_ast]
+                before = len(self.strict)
+                self.__block(func_ast.get("statements"))
+                changed = changed or len(self.strict) != before
+        for func_ast in functions:
+            self.strict = self.strict_vars[func_ast]
+            for arg in func_ast.get("args"):
+                if arg.get("name") in self.strict:
+                    self.eager.add(arg)
+            self.__collect_sites(func_ast.get("statements"))
+        return self
+
+    def __block(self, statements):
+        for statement in statements:
+            kind = statement.elem_type
+            if kind == InterpreterBase.FCALL_NODE:
+                self.__call(statement)
+            elif kind == "=":
+                if statement.get("name") in self.strict:
+                    self.__force(statement.get("expression"))
+            elif kind == InterpreterBase.RETURN_NODE:
+                if statement.get("expression") is not None:
+                    self.__force(statement.get("expression"))
+            elif kind == InterpreterBase.RAISE_NODE:
+                if statement.get("exception_type") is not None:
+                    self.__force(statement.get("exception_type"))
+            elif kind == InterpreterBase.IF_NODE:
+                self.__force(statement.get("condition"))
+                self.__block(statement.get("statements"))
+                self.__block(statement.get("else_statements") or [])
+            elif kind == InterpreterBase.FOR_NODE:
+                self.__block([statement.get("init"), statement.get("update")])
+                self.__force(statement.get("condition"))
+                self.__block(statement.get("statements"))
+            elif kind == InterpreterBase.TRY_NODE:
+                self.__block(statement.get("statements"))
+                for catcher in statement.get("catchers"):
+                    self.__block(catcher.get("statements"))
+
+    # marks the variables evaluating expr_ast forces
+    def __force(self, expr_ast):
+        kind = expr_ast.elem_type
+        if kind == InterpreterBase.VAR_NODE:
+            self.strict.add(expr_ast.get("name"))
+        elif kind == InterpreterBase.FCALL_NODE:
+            self.__call(expr_ast)
+        elif kind in BIN_OPS:
+            self.__force(expr_ast.get("op1"))
+            if kind not in SHORT_CIRCUIT_OPS:
+                self.__force(expr_ast.get("op2"))
+        elif kind == InterpreterBase.NEG_NODE or kind == InterpreterBase.NOT_NODE:
+            self.__force(expr_ast.get("op1"))
+
+    def __call(self, call_ast):
+        func_name = call_ast.get("name")
+        args = call_ast.get("args")
+        if func_name == "print":
+            for arg in args:
+                self.__force(arg)
+        elif func_name == "inputi" or func_name == "inputs":
+            if len(args) == 1:
+                self.__force(args[0])
+        else:
+            callee = self.func_table.get(func_name, {}).get(len(args))
+            if callee is None:
+                return
+            for formal_ast, actual_ast in zip(callee.get("args"), args):
+                if formal_ast.get("name") in self.strict_vars[callee]:
+                    self.__force(actual_ast)
+
+    def __collect_sites(self, statements):
+        for statement in statements:
+            kind = statement.elem_type
+            if kind == "=" and statement.get("name") in self.strict:
+                self.eager.add(statement)
+            elif kind == InterpreterBase.RETURN_NODE and statement.get("expression") is not None:
+                self.eager.add(statement)
+            elif kind == InterpreterBase.IF_NODE:
+                self.__collect_sites(statement.get("statements"))
+                self.__collect_sites(statement.get("else_statements") or [])
+            elif kind == InterpreterBase.FOR_NODE:
+                self.__collect_sites([statement.get("init"), statement.get("update")])
+                self.__collect_sites(statement.get("statements"))
+            elif kind == InterpreterBase.TRY_NODE:
+                self.__collect_sites(statement.get("statements"))
+                for catcher in statement.get("catchers"):
+                    self.__collect_sites(catcher.get("statements"))
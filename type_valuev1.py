@@ -6,9 +6,13 @@ class Type:
     INT = "int"
     BOOL = "bool"
     STRING = "string"
+    NONE = "nil"
 
-# Represents a value, which has a type and its value
+# Represents a value, which has a type and its value. Values are never changed
+# once made, so the common ones below are shared instead of allocated again.
 class Value:
+    __slots__ = ("t", "v")
+
     def __init__(self, type, value=None):
         self.t = type
         self.v = value
@@ -20,26 +24,46 @@ class Value:
         return self.t
 
 
+# shared values for booleans, nil and small ints
+TRUE_VALUE = Value(Type.BOOL, True)
+FALSE_VALUE = Value(Type.BOOL, False)
+NIL_VALUE = Value(Type.NONE, None)
+SMALL_INT_MIN = -5
+SMALL_INT_MAX = 256
+SMALL_INTS = tuple(Value(Type.INT, i) for i in range(SMALL_INT_MIN, SMALL_INT_MAX + 1))
+
+
+def bool_value(b):
+    return TRUE_VALUE if b else FALSE_VALUE
+
+
+def int_value(i):
+    if SMALL_INT_MIN <= i <= SMALL_INT_MAX:
+        return SMALL_INTS[i - SMALL_INT_MIN]
+    return Value(Type.INT, i)
+
+
 def create_value(val):
     if val == InterpreterBase.TRUE_DEF:
-        return Value(Type.BOOL, True)
+        return TRUE_VALUE
     elif val == InterpreterBase.FALSE_DEF:
-        return Value(Type.BOOL, False)
+        return FALSE_VALUE
     elif isinstance(val, str):
         return Value(Type.STRING, val)
     elif isinstance(val, int):
-        return Value(Type.INT, val)
+        return int_value(val)
     else:
         raise ValueError("Unknown value type")
 
 
 def get_printable(val):
-    if val.type() == Type.INT:
-        return str(val.value())
-    if val.type() == Type.STRING:
-        return val.value()
-    if val.type() == Type.BOOL:
-        if val.value() is True:
+    t = val.t
+    if t == Type.INT:
+        return str(val.v)
+    if t == Type.STRING:
+        return val.v
+    if t == Type.BOOL:
+        if val.v is True:
             return "true"
         return "false"
     return None
\ No newline at end of file
@@ -0,0 +1,280 @@
+# Static type checker for the v3 interpreter.
+#
+# Every v3 variable, parameter, field and function result has a declared type,
+# but the interpreter still looks at the types of the operands of every
+# operator and of every argument it passes. The checker works out the type of
+# each expression before the program runs, from literals, declarations and
+# function return types, and records:
+#   - fast_ops: binary operations whose operands are proven to be ints, bools
+#     or strings of the same type, with the function for that operator, so the
+#     interpreter can apply it without checking anything
+#   - exact_args: call arguments that already have the type of their formal
+#     parameter, so they need no coercion
+#   - errors: type errors the program is certain to hit if it reaches a node,
+#     as (node, description)
+# A type here is the tag of the Value an expression produces if it doesn't
+# fail, or None when it isn't known. Struct types also stand for nil, which
+# any struct variable may hold.
+#
+# Plain assignments aren't coerced or checked by the interpreter (after
+# `var b: bool; b = 5;` b holds an int), so a variable only has its declared
+# type if everything assigned to it has that type too. That is worked out
+# first, by dropping variables from the set of well-typed ones until nothing
+# changes.
+from element import DottedName
+from intbase import InterpreterBase
+from type_valuev2 import Type
+
+PRIMITIVE_TYPES = (Type.INT, Type.BOOL, Type.STRING)
+ARITH_OPS = {"+", "-", "*", "/"}
+EQUALITY_OPS = {"==", "!="}
+
+
+class TypeChecker:
+    def __init__(self, interpreter):
+        self.interpreter = interpreter
+        self.structs = interpreter.structs
+        self.op_to_lambda = interpreter.op_to_lambda
+        self.resolver = interpreter.resolver
+        self.types = {}  # expression node -> type or None
+        self.fast_ops = {}  # binary op node -> operator function
+        self.exact_args = set()  # argument nodes that already have their formal type
+        self.errors = []  # (node, description)
+        self.mistyped = set()  # vardef/arg nodes whose variable may not have its declared type
+
+    def check_program(self):
+        functions = [
+            func_ast for candidates in self.interpreter.func_name_to_ast.values() for func_ast in candidates.values()
+        ]
+        assignments = []
+        for func_ast in functions:
+            self.__collect_assignments(func_ast.get("statements"), assignments)
+            # a repeated parameter name is one variable, which gets the last
+            # argument for it, whatever the type of the first one
+            names = [arg.get("name") for arg in func_ast.get("args")]
+            for arg in func_ast.get("args"):
+                if names.count(arg.get("name")) > 1:
+                    self.mistyped.add(arg)
+        changed = True
+        while changed:
+            changed = False
+            self.types = {}
+            for definition, expr_ast in assignments:
+                if definition in self.mistyped:
+                    continue
+                if not self.__fits(definition.get("var_type"), self.__type(expr_ast)):
+                    self.mistyped.add(definition)
+                    changed = True
+
+        self.types = {}
+        for func_ast in functions:
+            self.return_type = func_ast.get("return_type")
+            self.__check_block(func_ast.get("statements"))
+        return self
+
+    # (definition, expression) for every assignment to a plain variable
+    def __collect_assignments(self, statements, assignments):
+        for statement in statements:
+            kind = statement.elem_type
+            if kind == "=":
+                definition = self.resolver.definitions[statement]
+                if definition is not None and not isinstance(statement.get("name"), DottedName):
+                    assignments.append((definition, statement.get("expression")))
+            elif kind == InterpreterBase.IF_NODE:
+                self.__collect_assignments(statement.get("statements"), assignments)
+                if statement.get("else_statements") is not None:
+                    self.__collect_assignments(statement.get("else_statements"), assignments)
+            elif kind == InterpreterBase.FOR_NODE:
+                self.__collect_assignments([statement.get("init"), statement.get("update")], assignments)
+                self.__collect_assignments(statement.get("statements"), assignments)
+
+    # can a variable declared as var_type keep it when given a value of value_type
+    def __fits(self, var_type, value_type):
+        if var_type in self.structs:
+            return value_type == var_type or value_type == Type.NIL
+        return value_type == var_type
+
+    # True if coerce_value(target_type, value) always works for a value of
+    # value_type, False if it always fails, None if that isn't known
+    def __coercible(self, target_type, value_type):
+        if value_type is None or (target_type not in PRIMITIVE_TYPES and target_type not in self.structs):
+            return None
+        if value_type == target_type or (target_type == Type.BOOL and value_type == Type.INT):
+            return True
+        if target_type in self.structs:
+            # a struct value might be nil, which any struct type takes
+            return True if value_type == Type.NIL else (False if value_type in PRIMITIVE_TYPES else None)
+        return False
+
+    def __error(self, node, description):
+        self.errors.append((node, description))
+
+    def __check_block(self, statements):
+        for statement in statements:
+            self.__check_statement(statement)
+
+    def __check_statement(self, statement):
+        kind = statement.elem_type
+        if kind == InterpreterBase.FCALL_NODE:
+            self.__check_call(statement)
+        elif kind == "=":
+            value_type = self.__check_expr(statement.get("expression"))
+            name = statement.get("name")
+            if isinstance(name, DottedName):
+                field_type = self.__variable_type(statement, name)
+                if field_type in PRIMITIVE_TYPES and self.__coercible(field_type, value_type) is False:
+                    self.__error(statement, f"Cannot coerce type {value_type} into {field_type}")
+        elif kind == InterpreterBase.RETURN_NODE:
+            expr_ast = statement.get("expression")
+            if expr_ast is not None:
+                value_type = self.__check_expr(expr_ast)
+                if self.return_type == InterpreterBase.VOID_DEF:
+                    if value_type is not None:
+                        self.__error(statement, f"Cannot coerce type {value_type} into {self.return_type}")
+                elif self.__coercible(self.return_type, value_type) is False:
+                    self.__error(statement, f"Cannot coerce type {value_type} into {self.return_type}")
+        elif kind == InterpreterBase.IF_NODE:
+            self.__check_condition(statement.get("condition"))
+            self.__check_block(statement.get("statements"))
+            if statement.get("else_statements") is not None:
+                self.__check_block(statement.get("else_statements"))
+        elif kind == InterpreterBase.FOR_NODE:
+            self.__check_statement(statement.get("init"))
+            self.__check_condition(statement.get("condition"))
+            self.__check_block(statement.get("statements"))
+            self.__check_statement(statement.get("update"))
+
+    def __check_condition(self, cond_ast):
+        if self.__coercible(Type.BOOL, self.__check_expr(cond_ast)) is False:
+            self.__error(cond_ast, "Incompatible type for condition")
+
+    # like __type, but also records what the interpreter can use, and the
+    # errors, for the whole expression
+    def __check_expr(self, expr_ast):
+        kind = expr_ast.elem_type
+        if kind == InterpreterBase.FCALL_NODE:
+            if self.__check_call(expr_ast) == InterpreterBase.VOID_DEF:
+                self.__error(expr_ast, "Void function cannot be assigned to anything and evaluated")
+        elif kind in self.interpreter.BIN_OPS:
+            left_type = self.__check_expr(expr_ast.get("op1"))
+            right_type = self.__check_expr(expr_ast.get("op2"))
+            self.__check_binary_op(expr_ast, kind, left_type, right_type)
+        elif kind == InterpreterBase.NEG_NODE or kind == InterpreterBase.NOT_NODE:
+            value_type = self.__check_expr(expr_ast.get("op1"))
+            t = Type.INT if kind == InterpreterBase.NEG_NODE else Type.BOOL
+            if self.__coercible(t, value_type) is False:
+                self.__error(expr_ast, f"Incompatible type for {kind} operation")
+        return self.__type(expr_ast)
+
+    # returns the callee's return type, None for builtins and unknown callees
+    def __check_call(self, call_ast):
+        func_name = call_ast.get("name")
+        actual_args = call_ast.get("args")
+        arg_types = [self.__check_expr(arg) for arg in actual_args]
+        if func_name in self.interpreter.BUILTIN_FUNCS:
+            return None
+        func_ast = self.interpreter.func_name_to_ast.get(func_name, {}).get(len(actual_args))
+        if func_ast is None:
+            return None
+        for formal_ast, actual_ast, arg_type in zip(func_ast.get("args"), actual_args, arg_types):
+            formal_type = formal_ast.get("var_type")
+            coercible = self.__coercible(formal_type, arg_type)
+            if coercible is False:
+                self.__error(actual_ast, f"Cannot coerce type {arg_type} into {formal_type}")
+            elif arg_type == formal_type and formal_type in PRIMITIVE_TYPES:
+                self.exact_args.add(actual_ast)
+        return func_ast.get("return_type")
+
+    def __check_binary_op(self, op_ast, op, left_type, right_type):
+        if left_type not in PRIMITIVE_TYPES or right_type not in PRIMITIVE_TYPES:
+            return
+        same_types = left_type == right_type
+        if not same_types:
+            if {left_type, right_type} == {Type.INT, Type.BOOL}:
+                # the int is coerced to a bool
+                left_type = Type.BOOL
+            elif op not in EQUALITY_OPS:
+                self.__error(op_ast, f"Incompatible types for {op} operation")
+                return
+        if op not in self.op_to_lambda[left_type]:
+            self.__error(op_ast, f"Incompatible operator {op} for type {left_type}")
+        elif same_types:
+            self.fast_ops[op_ast] = self.op_to_lambda[left_type][op]
+
+    # the type of the value expr_ast evaluates to, None if it isn't known
+    def __type(self, expr_ast):
+        if expr_ast in self.types:
+            return self.types[expr_ast]
+        value_type = self.__infer(expr_ast)
+        self.types[expr_ast] = value_type
+        return value_type
+
+    def __infer(self, expr_ast):
+        kind = expr_ast.elem_type
+        if kind == InterpreterBase.INT_NODE:
+            return Type.INT
+        if kind == InterpreterBase.STRING_NODE:
+            return Type.STRING
+        if kind == InterpreterBase.BOOL_NODE:
+            return Type.BOOL
+        if kind == InterpreterBase.NIL_NODE:
+            return Type.NIL
+        if kind == InterpreterBase.VAR_NODE:
+            return self.__variable_type(expr_ast, expr_ast.get("name"))
+        if kind == InterpreterBase.NEW_NODE:
+            return expr_ast.get("var_type") if expr_ast.get("var_type") in self.structs else None
+        if kind == InterpreterBase.NEG_NODE:
+            return Type.INT
+        if kind == InterpreterBase.NOT_NODE:
+            return Type.BOOL
+        if kind == InterpreterBase.FCALL_NODE:
+            return self.__call_type(expr_ast)
+        if kind in self.interpreter.BIN_OPS:
+            return self.__binary_op_type(expr_ast)
+        return None
+
+    # the type of a variable, or of the field at the end of a dotted path
+    def __variable_type(self, node, name):
+        definition = self.resolver.definitions.get(node)
+        if definition is None or definition in self.mistyped:
+            return None
+        var_type = definition.get("var_type")
+        if var_type not in PRIMITIVE_TYPES and var_type not in self.structs:
+            return None
+        for field_name in name.fields if isinstance(name, DottedName) else ():
+            # fields always keep their declared type, assignments to them are
+            # coerced
+            var_type = self.structs.get(var_type, {}).get(field_name)
+            if var_type is None:
+                return None
+        return var_type
+
+    def __call_type(self, call_ast):
+        func_name = call_ast.get("name")
+        if func_name == "print":
+            return Type.NIL
+        if func_name == "inputi":
+            return Type.INT if len(call_ast.get("args")) <= 1 else None
+        if func_name == "inputs":
+            return Type.STRING if len(call_ast.get("args")) <= 1 else None
+        func_ast = self.interpreter.func_name_to_ast.get(func_name, {}).get(len(call_ast.get("args")))
+        if func_ast is None:
+            return None
+        return_type = func_ast.get("return_type")
+        if return_type in PRIMITIVE_TYPES or return_type in self.structs:
+            return return_type
+        return None
+
+    def __binary_op_type(self, op_ast):
+        op = op_ast.elem_type
+        if op not in ARITH_OPS:
+            # comparisons, && and || always give a bool
+            return Type.BOOL
+        left_type = self.__type(op_ast.get("op1"))
+        right_type = self.__type(op_ast.get("op2"))
+        # arithmetic keeps the type of its operands, which must be the same
+        if left_type in (Type.INT, Type.STRING) and (right_type == left_type or right_type is None):
+            return left_type
+        if right_type in (Type.INT, Type.STRING) and left_type is None:
+            return right_type
+        return None